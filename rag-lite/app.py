@@ -1,15 +1,29 @@
+import os
+from parser import DocumentParser
+
 import streamlit as st
+from dotenv import load_dotenv
+
+from corpus_snapshot import CorpusSnapshot
+from embedding_cache import EmbeddingCache
+from helpers import load_config
+from lexical_index import build_lexical_index
 from openai_services import OpenAIEmbeddingService, OpenAIGenerationService
+from query_cache import QueryEmbeddingCache
 from rag_pipeline import (
-    Corpus, RetrievalService, PromptAugmenter, QueryProcessor,
-    ProcessorConfig, RetrievalConfig, CosineSimilarity
+    Corpus,
+    CosineSimilarity,
+    ProcessorConfig,
+    PromptAugmenter,
+    QueryProcessor,
+    RetrievalConfig,
+    RetrievalService,
 )
-from parser import DocumentParser
-from typing import List
-from datetime import datetime
-from dotenv import load_dotenv
-import os
-import boto3
+from registry import registry
+from revisions import apply_revision, previous_version
+from s3_cache import S3CacheService
+from vector_index import build_vector_index
+from write_behind import WriteBehindUploader
 
 load_dotenv()
 
@@ -27,31 +41,81 @@ bucket_name = os.getenv("AWS_S3_BUCKET")
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 
-if "corpus" not in st.session_state:
-    st.session_state.corpus = Corpus()
+def build_retrieval_stack():
+    """S3 cache, corpus, index and retrieval service shared by every session."""
+    s3_client = S3CacheService(
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        region_name=aws_region,
+        **load_config('s3_cache', {}),
+    )
+    snapshot = CorpusSnapshot(s3_client, bucket_name,
+                              **load_config('corpus_snapshot', {}))
+    vector_index = build_vector_index(load_config('vector_index', {}))
+    if vector_index is not None:
+        vector_index.load(s3_client, bucket_name, snapshot.index_key)
+    corpus = Corpus()
+    retrieval_service = RetrievalService(
+        corpus,
+        CosineSimilarity(),
+        vector_index=vector_index,
+        lexical_index=build_lexical_index(load_config('lexical_index', {})),
+    )
+    restored = snapshot.load_into(corpus)
+    return {
+        "corpus": corpus,
+        "s3_client": s3_client,
+        "snapshot": snapshot,
+        "vector_index": vector_index,
+        "retrieval_service": retrieval_service,
+        "restored": restored,
+    }
 
 if "base_services" not in st.session_state:
     with st.spinner("Initializing LLM..."):
-        embedding_service = OpenAIEmbeddingService(api_key)
+        # heavy, read-mostly resources are loaded once per process, not per session;
+        # the session's lease releases its references when Streamlit drops the session
+        lease = registry.lease()
+        st.session_state.lease = lease
+        stack = lease.acquire(
+            ("retrieval", bucket_name), build_retrieval_stack,
+            dispose=lambda stack: stack["retrieval_service"].close())
+        embedding_service = lease.acquire(
+            ("embedding_service", "openai"), lambda: OpenAIEmbeddingService(api_key))
+        embedding_cache = lease.acquire(
+            "embedding_cache",
+            lambda: EmbeddingCache(**load_config('embedding_cache', {})),
+            dispose=EmbeddingCache.close)
+        query_cache = lease.acquire(
+            "query_cache",
+            lambda: QueryEmbeddingCache(**load_config('query_cache', {})))
+        # parser artifacts are persisted in the background; the snapshot writes
+        # directly
+        uploader = lease.acquire(
+            "uploader",
+            lambda: WriteBehindUploader(stack["s3_client"],
+                                        **load_config('write_behind', {})),
+            dispose=WriteBehindUploader.shutdown)
+        # per session: the generation service keeps this user's chat memory
         generation_service = OpenAIGenerationService(api_key)
-        similarity_metric = CosineSimilarity()
-        retrieval_service = RetrievalService(st.session_state.corpus, similarity_metric)
         augmenter = PromptAugmenter('rag_prompt.md')
-        s3_client = boto3.client(
-                "s3",
-                aws_access_key_id=aws_access_key_id,
-                aws_secret_access_key=aws_secret_access_key,
-                region_name=aws_region
-            )
-        
+
+        st.session_state.corpus = stack["corpus"]
         st.session_state.base_services = {
             "embedding_service": embedding_service,
             "generation_service": generation_service,
-            "retrieval_service": retrieval_service,
+            "retrieval_service": stack["retrieval_service"],
             "augmenter": augmenter,
-            "s3_client": s3_client,
+            "s3_client": stack["s3_client"],
+            "uploader": uploader,
+            "embedding_cache": embedding_cache,
+            "query_cache": query_cache,
+            "vector_index": stack["vector_index"],
+            "snapshot": stack["snapshot"],
         }
     st.success(f"LLM initialized: {generation_service.model}", icon="✅")
+    if stack["restored"]:
+        st.sidebar.info(f"Restored {stack['restored']} chunks from corpus snapshot")
 
 # === File Upload ===
 st.sidebar.markdown("---")
@@ -62,19 +126,40 @@ for uploaded_file in uploaded_files:
     if uploaded_file and uploaded_file.size < 2 * 1024 * 1024:
         st.sidebar.success(f"Uploaded: {uploaded_file.name}")
         with st.spinner("Parsing document..."):
-            parser = DocumentParser(st.session_state.base_services["embedding_service"],
-                                    st.session_state.base_services["s3_client"],
-                                    bucket_name,)
-            new_chunks = parser.parse_docx(uploaded_file)
+            services = st.session_state.base_services
+            parser = DocumentParser(services["embedding_service"],
+                                    services["uploader"],
+                                    bucket_name,
+                                    embedding_cache=services["embedding_cache"],
+                                    docx_converter=load_config('docx_converter',
+                                                               'direct'))
+            previous_ids, previous = previous_version(st.session_state.corpus,
+                                                      uploaded_file.name)
+            new_chunks = parser.parse_docx(uploaded_file, previous=previous)
         st.sidebar.success("Document parsed successfully", icon="✅")
 
-        # Add chunks and get count of newly added ones
-        added_count = st.session_state.corpus.add_chunks(new_chunks)
-        
-        if added_count > 0:
-            st.sidebar.success(f"Added {added_count} new chunks to corpus")
+        if previous_ids:
+            # Swap the previous version of the file for the new one
+            diff = apply_revision(st.session_state.corpus, previous_ids, previous,
+                                  new_chunks,
+                                  st.session_state.base_services["snapshot"],
+                                  st.session_state.base_services["vector_index"])
+            if diff.is_empty:
+                st.sidebar.info("Document unchanged since it was added")
+            else:
+                st.sidebar.success(f"Updated document: {len(diff.added)} added, "
+                                   f"{len(diff.changed)} changed, "
+                                   f"{len(diff.removed)} removed sections")
         else:
-            st.sidebar.info("No new chunks added (document already in corpus)")
+            # Add chunks and get count of newly added ones
+            added_count = st.session_state.corpus.add_chunks(new_chunks)
+
+            if added_count > 0:
+                st.sidebar.success(f"Added {added_count} new chunks to corpus")
+                st.session_state.base_services["snapshot"].append(
+                    new_chunks, st.session_state.base_services["vector_index"])
+            else:
+                st.sidebar.info("No new chunks added (document already in corpus)")
         
         total_chunks = len(st.session_state.corpus.get_all_chunks())
         st.sidebar.info(f"Total chunks in corpus: {total_chunks}")
@@ -82,6 +167,11 @@ for uploaded_file in uploaded_files:
     elif uploaded_file:
         st.sidebar.error("File too large. Please upload files under 2MB.")
 
+if uploaded_files:
+    # cache writes run in the background; report the ones that did not land
+    for key, error in st.session_state.base_services["uploader"].flush():
+        st.sidebar.warning(f"Failed to cache {key}: {error}")
+
 # === Retrieval Configuration ===
 st.sidebar.markdown("---")
 st.sidebar.subheader("🔧 Retrieval Settings")
@@ -97,7 +187,8 @@ if user_input and api_key:
         current_config = ProcessorConfig(
             retrieval=RetrievalConfig(
                 top_k=top_k,
-                similarity_threshold=similarity_threshold
+                similarity_threshold=similarity_threshold,
+                **load_config('retrieval', {})
             )
         )
         
@@ -107,7 +198,8 @@ if user_input and api_key:
             retrieval_service=st.session_state.base_services["retrieval_service"],
             prompt_augmenter=st.session_state.base_services["augmenter"],
             generation_service=st.session_state.base_services["generation_service"],
-            config=current_config
+            config=current_config,
+            query_cache=st.session_state.base_services["query_cache"],
         )
         
         response = processor.process_query(user_input)
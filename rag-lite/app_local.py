@@ -1,24 +1,43 @@
-import streamlit as st
-from ollama_services import OllamaEmbeddingService, OllamaGenerationService, LocalCacheService
-from openai_services import OpenAIEmbeddingService, OpenAIGenerationService
-from rag_pipeline import (
-    Corpus, RetrievalService, PromptAugmenter, QueryProcessor,
-    ProcessorConfig, RetrievalConfig, CosineSimilarity
-)
-from parser_local import DocumentParser
-from dotenv import load_dotenv
 import os
 import re
-from log_time import ProcessTimer
-from helpers import load_config
 
+import streamlit as st
+from dotenv import load_dotenv
+
+from corpus_snapshot import CorpusSnapshot
+from embedding_cache import EmbeddingCache
+from embedding_executor import ConcurrentEmbeddingExecutor
+from helpers import load_config
+from lexical_index import build_lexical_index
+from log_time import ProcessTimer
+from marker_pool import shared_converter_pool
+from ollama_services import LocalCacheService
+from parser_local import DocumentParser
+from query_cache import QueryEmbeddingCache
+from rag_pipeline import (
+    Corpus,
+    CosineSimilarity,
+    ProcessorConfig,
+    PromptAugmenter,
+    QueryProcessor,
+    RetrievalConfig,
+    RetrievalService,
+)
+from registry import registry
+from rerank_cache import RerankScoreCache
+from rerank_policy import build_rerank_policy
+from reranker import RerankerConfig
+from revisions import apply_revision, previous_version
+from service_factory import build_embedding_service, build_generation_service
+from vector_index import build_vector_index
+from write_behind import WriteBehindUploader
 
 pt = ProcessTimer()
 
 load_dotenv()
 
 
-api_key = os.environ["OPENAI_API_KEY"]
+api_key = os.getenv("OPENAI_API_KEY")
 # === Streamlit Setup ===
 st.set_page_config(page_title="RAG Chat MVP (Local)", layout="wide")
 st.title("🔍📚 Retrieval-Augmented Chatbot (Local Demo)")
@@ -31,30 +50,103 @@ bucket_name  = 'test-bucket'
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 
-if "corpus" not in st.session_state:
-    st.session_state.corpus = Corpus()
+def provider_settings(section):
+    """(provider, constructor kwargs) of a service section in config.yaml."""
+    settings = dict(load_config(section, {"provider": "openai"}))
+    provider = settings.pop("provider")
+    if provider == "openai":
+        settings["api_key"] = api_key
+    return provider, settings
+
+def build_retrieval_stack():
+    """Corpus, index and retrieval service shared by every session."""
+    cache_service = LocalCacheService()
+    snapshot      = CorpusSnapshot(cache_service, bucket_name,
+                                   **load_config('corpus_snapshot', {}))
+    vector_index  = build_vector_index(load_config('vector_index', {}))
+    if vector_index is not None:
+        vector_index.load(cache_service, bucket_name, snapshot.index_key)
+    corpus = Corpus()
+    retrieval_service = RetrievalService(
+        corpus,
+        CosineSimilarity(),
+        load_config('reranker_model'),
+        vector_index=vector_index,
+        lexical_index=build_lexical_index(load_config('lexical_index', {})),
+        reranker_config=RerankerConfig(**load_config('reranker', {})),
+        score_cache=RerankScoreCache(**load_config('rerank_cache', {})),
+        rerank_policy=build_rerank_policy(load_config('rerank_policy', {})),
+    )
+    restored = snapshot.load_into(corpus)
+    return {
+        "corpus": corpus,
+        "cache_service": cache_service,
+        "snapshot": snapshot,
+        "vector_index": vector_index,
+        "retrieval_service": retrieval_service,
+        "restored": restored,
+    }
 
 if "base_services" not in st.session_state:
     with st.spinner("Initializing local models…"):
-        embedding_service = OpenAIEmbeddingService(api_key) #OllamaEmbeddingService(load_config('embedding_model'))
-        generation_service = OpenAIGenerationService(api_key) #OllamaGenerationService(load_config('inference_model'))
-        similarity_metric  = CosineSimilarity()
-        retrieval_service  = RetrievalService(
-            st.session_state.corpus,
-            similarity_metric,
-            load_config('reranker_model'),
-        )
+        # heavy, read-mostly resources are loaded once per process, not per session;
+        # the session's lease releases its references when Streamlit drops the session
+        lease = registry.lease()
+        st.session_state.lease = lease
+        stack = lease.acquire(
+            ("retrieval", bucket_name), build_retrieval_stack,
+            dispose=lambda stack: stack["retrieval_service"].close())
+        embedding_provider, embedding_settings = provider_settings('embedding_service')
+        if embedding_provider == "openai":
+            # the executor retries; client retries would multiply its attempts
+            embedding_settings["max_retries"] = 0
+        embedding_service = lease.acquire(
+            ("embedding_service", embedding_provider),
+            lambda: ConcurrentEmbeddingExecutor(
+                build_embedding_service(embedding_provider, **embedding_settings),
+                **load_config('embedding_executor', {}),
+            ),
+            dispose=ConcurrentEmbeddingExecutor.shutdown)
+        embedding_cache = lease.acquire(
+            "embedding_cache",
+            lambda: EmbeddingCache(**load_config('embedding_cache', {})),
+            dispose=EmbeddingCache.close)
+        query_cache = lease.acquire(
+            "query_cache",
+            lambda: QueryEmbeddingCache(**load_config('query_cache', {})))
+        converter_pool = shared_converter_pool(**load_config('marker_pool', {}),
+                                               owner=lease)
+        # parser artifacts are persisted in the background; the snapshot writes
+        # directly
+        uploader = lease.acquire(
+            "uploader",
+            lambda: WriteBehindUploader(stack["cache_service"],
+                                        **load_config('write_behind', {})),
+            dispose=WriteBehindUploader.shutdown)
+        # per session: the generation service keeps this user's chat memory
+        generation_provider, generation_settings = provider_settings(
+            'generation_service')
+        generation_service = build_generation_service(generation_provider,
+                                                      **generation_settings)
         augmenter     = PromptAugmenter('rag_prompt.md')
-        cache_service = LocalCacheService()
 
+        st.session_state.corpus = stack["corpus"]
         st.session_state.base_services = {
             "embedding_service": embedding_service,
             "generation_service": generation_service,
-            "retrieval_service": retrieval_service,
+            "retrieval_service": stack["retrieval_service"],
             "augmenter": augmenter,
-            "cache_service": cache_service,
+            "cache_service": stack["cache_service"],
+            "uploader": uploader,
+            "embedding_cache": embedding_cache,
+            "query_cache": query_cache,
+            "converter_pool": converter_pool,
+            "vector_index": stack["vector_index"],
+            "snapshot": stack["snapshot"],
         }
     st.success(f"Local LLM initialized: {generation_service.model}", icon="✅")
+    if stack["restored"]:
+        st.sidebar.info(f"Restored {stack['restored']} chunks from corpus snapshot")
 
 # === File Upload ===
 st.sidebar.markdown("---")
@@ -67,23 +159,52 @@ for uploaded_file in uploaded_files:
         with st.spinner("Parsing…"):
             parser = DocumentParser(
                 st.session_state.base_services["embedding_service"],
-                st.session_state.base_services["cache_service"],
-                bucket_name
+                st.session_state.base_services["uploader"],
+                bucket_name,
+                embedding_cache=st.session_state.base_services["embedding_cache"],
+                converter_pool=st.session_state.base_services["converter_pool"],
+                docx_converter=load_config('docx_converter', 'direct'),
             )
-            new_chunks = parser.parse(uploaded_file)
+            previous_ids, previous = previous_version(st.session_state.corpus,
+                                                      uploaded_file.name)
+            new_chunks = parser.parse(uploaded_file, previous=previous)
         st.sidebar.success("Document parsed", icon="✅")
+        cache_stats = parser.embedding_cache.stats()
+        st.sidebar.caption(f"Embedding cache hit rate: {cache_stats['hit_rate']:.0%} "
+                           f"({cache_stats['entries']} entries)")
 
-        # Add to corpus
-        added = st.session_state.corpus.add_chunks(new_chunks)
-        if added:
-            st.sidebar.success(f"Added {added} chunks")
+        # Replace a previous version of the file, or add to corpus
+        if previous_ids:
+            diff = apply_revision(
+                st.session_state.corpus, previous_ids, previous, new_chunks,
+                st.session_state.base_services["snapshot"],
+                st.session_state.base_services["vector_index"],
+            )
+            if diff.is_empty:
+                st.sidebar.info("Document unchanged")
+            else:
+                st.sidebar.success(f"Updated document: {len(diff.added)} added, "
+                                   f"{len(diff.changed)} changed, "
+                                   f"{len(diff.removed)} removed sections")
         else:
-            st.sidebar.info("No new chunks (already cached)")
+            added = st.session_state.corpus.add_chunks(new_chunks)
+            if added:
+                st.sidebar.success(f"Added {added} chunks")
+                st.session_state.base_services["snapshot"].append(
+                    new_chunks, st.session_state.base_services["vector_index"]
+                )
+            else:
+                st.sidebar.info("No new chunks (already cached)")
         st.sidebar.info(f"Total chunks: {len(st.session_state.corpus.get_all_chunks())}")
 
     elif uploaded_file:
         st.sidebar.error("File too large. Must be <2MB.")
 
+if uploaded_files:
+    # cache writes run in the background; report the ones that did not land
+    for key, error in st.session_state.base_services["uploader"].flush():
+        st.sidebar.warning(f"Failed to cache {key}: {error}")
+
 # === Retrieval Settings ===
 st.sidebar.markdown("---")
 st.sidebar.subheader("🔧 Retrieval Settings")
@@ -96,7 +217,8 @@ if user_input:
     config = ProcessorConfig(
             retrieval=RetrievalConfig(
                 top_k=top_k,
-                similarity_threshold=similarity_threshold
+                similarity_threshold=similarity_threshold,
+                **load_config('retrieval', {})
             )
         )
     processor = QueryProcessor(
@@ -105,7 +227,8 @@ if user_input:
             retrieval_service=st.session_state.base_services["retrieval_service"],
             prompt_augmenter=st.session_state.base_services["augmenter"],
             generation_service=st.session_state.base_services["generation_service"],
-            config=config
+            config=config,
+            query_cache=st.session_state.base_services["query_cache"],
         )
     pt.mark("Answer Generation")
     with st.spinner("Thinking..."):
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# rag-lite/bench_docx_sections.py
+"""
+DOCX conversion benchmark: direct python-docx walk vs mammoth → html2text.
+Run manually from rag-lite/ (not via pytest):
+  $ python bench_docx_sections.py [file.docx ...] [--runs 5]
+
+Both paths start from the raw bytes and end with numbered (text, section,
+heading) sections, i.e. what parse_docx embeds. Reported per file: median wall
+time, peak traced memory, and whether both paths find the same sections
+(html2text's markdown escapes are ignored in the comparison).
+"""
+import argparse
+import glob
+import os
+import re
+import statistics
+import time
+import tracemalloc
+from io import BytesIO
+
+from docx import Document as DocxDocument
+
+from docx_sections import (
+    UnsupportedDocx,
+    iter_docx_sections,
+    mammoth_markdown,
+    number_sections,
+    split_markdown,
+)
+
+HEADING = re.compile(r"^(#{1,6})\s+(.+?)(?:\n|$)(.*)", re.DOTALL)
+
+
+def process_heading(chunk: str):
+    """Same as DocumentParser._process_heading."""
+    match = HEADING.match(chunk.strip())
+    if match:
+        heading = match.group(2).strip()
+        text = (heading + "\n" + match.group(3)).strip()
+        return text, str(len(match.group(1))), heading
+    return chunk.strip(), "", ""
+
+
+def direct(data: bytes):
+    return number_sections(iter_docx_sections(DocxDocument(BytesIO(data))))
+
+
+def via_mammoth(data: bytes):
+    markdown = mammoth_markdown(data)
+    return number_sections([process_heading(c) for c in split_markdown(markdown)
+                            if c.strip()])
+
+
+def measure(convert, data: bytes, runs: int):
+    """(median seconds, peak traced bytes, result)."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = convert(data)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    convert(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak, result
+
+
+def outline(sections):
+    return [(number, heading.replace("\\", "")) for _, number, heading in sections]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("files", nargs="*",
+                    help="DOCX files (default: ../tests/documents/*.docx)")
+    ap.add_argument("--runs", type=int, default=5,
+                    help="timed runs per file and path (median is reported)")
+    args = ap.parse_args()
+    files = args.files or sorted(
+        glob.glob(os.path.join("..", "tests", "documents", "*.docx")))
+
+    print(f"{'file':<28}{'path':<9}{'median ms':>10}{'peak MiB':>10}{'sections':>10}"
+          "  same outline")
+    print("-" * 80)
+    for path in files:
+        with open(path, "rb") as f:
+            data = f.read()
+        name = os.path.basename(path)[:26]
+        m_time, m_peak, m_sections = measure(via_mammoth, data, args.runs)
+        try:
+            d_time, d_peak, d_sections = measure(direct, data, args.runs)
+        except UnsupportedDocx as e:
+            print(f"{name:<28}{'direct':<9}  unsupported ({e}); "
+                  "parse_docx falls back to mammoth")
+            continue
+        same = outline(d_sections) == outline(m_sections)
+        print(f"{name:<28}{'mammoth':<9}{m_time * 1e3:>10.1f}{m_peak / 2**20:>10.2f}"
+              f"{len(m_sections):>10}")
+        print(f"{'':<28}{'direct':<9}{d_time * 1e3:>10.1f}{d_peak / 2**20:>10.2f}"
+              f"{len(d_sections):>10}  "
+              f"{'yes' if same else 'NO'}  ({m_time / d_time:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
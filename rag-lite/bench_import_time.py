@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# rag-lite/bench_import_time.py
+"""
+Cold-start import benchmark.
+Run manually from rag-lite/ (not via pytest):
+  $ python bench_import_time.py [--runs 5]
+
+Each module is imported in a fresh interpreter, so every measurement is a cold
+import. Besides the wall time it lists which heavy dependencies the import
+dragged in; with lazy loading none of them should appear until a reranker,
+PDF or provider service is actually used. Pass --eager to also time importing
+the heavy dependencies directly, i.e. what the old top-level imports cost.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "rag_pipeline",
+    "parser_local",
+    "parser",
+    "ollama_services",
+    "openai_services",
+    "service_factory",
+]
+
+HEAVY = ["torch", "transformers", "marker", "ollama", "openai", "sentence_transformers"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed,
+                  "heavy": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+
+def cold_import(module: str):
+    """(seconds, heavy modules loaded) for importing module in a fresh interpreter."""
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+        capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        return None, out.stderr.strip().splitlines()[-1:]
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    return result["seconds"], result["heavy"]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--runs", type=int, default=3,
+                    help="cold imports per module (median is reported)")
+    ap.add_argument("--eager", action="store_true",
+                    help="also time the heavy dependencies themselves")
+    args = ap.parse_args()
+
+    modules = MODULES + (HEAVY if args.eager else [])
+    print(f"{'module':<24}{'median s':>10}  heavy dependencies loaded")
+    print("-" * 72)
+    total = 0.0
+    for module in modules:
+        times, heavy = [], []
+        for _ in range(args.runs):
+            seconds, heavy = cold_import(module)
+            if seconds is None:
+                break
+            times.append(seconds)
+        if not times:
+            print(f"{module:<24}{'n/a':>10}  import failed: {' '.join(heavy)}")
+            continue
+        median = statistics.median(times)
+        if module in MODULES:
+            total += median
+        print(f"{module:<24}{median:>10.3f}  {', '.join(heavy) or '-'}")
+    print("-" * 72)
+    print(f"{'app modules total':<24}{total:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Existence checks and multi-key reads that work against any cache service.
+
+LocalCacheService and S3CacheService implement exists/get_many natively; for
+plain boto3 clients these fall back to HEAD requests and per-key GETs.
+"""
+from typing import Dict, List
+
+from chunk_store import missing_key_errors
+
+
+def is_not_found_error(error: Exception) -> bool:
+    """Whether a boto3 ClientError reports an absent key."""
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+def object_exists(cache_service, bucket: str, key: str) -> bool:
+    """Whether key exists, without reading its contents."""
+    exists = getattr(cache_service, "exists", None)
+    if exists is not None:
+        return exists(Bucket=bucket, Key=key)
+    try:
+        cache_service.head_object(Bucket=bucket, Key=key)
+        return True
+    except missing_key_errors(cache_service):
+        return False
+    except Exception as e:
+        if is_not_found_error(e):
+            return False
+        raise
+
+
+def get_many(cache_service, bucket: str, keys: List[str]) -> Dict[str, bytes]:
+    """Contents of every present key as {key: bytes}; absent keys are left out."""
+    native = getattr(cache_service, "get_many", None)
+    if native is not None:
+        return native(Bucket=bucket, Keys=keys)
+    found: Dict[str, bytes] = {}
+    for key in keys:
+        try:
+            found[key] = cache_service.get_object(Bucket=bucket, Key=key)["Body"].read()
+        except missing_key_errors(cache_service):
+            continue
+    return found
@@ -0,0 +1,146 @@
+"""
+Binary chunk cache format.
+
+A set of chunks is stored as two objects next to each other in the cache bucket:
+  <base>.npy        float32 little-endian embedding matrix, one row per chunk,
+                    memory-mapped when the cache service exposes local paths
+  <base>.meta.json  compact JSON sidecar with the format version, contents and metadata
+"""
+import json
+from dataclasses import replace
+from datetime import datetime
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from logger import logger
+from rag_pipeline import DocumentChunk, DocumentMetadata
+
+CHUNK_FORMAT_VERSION = 2
+
+
+def chunk_keys(base: str) -> Tuple[str, str]:
+    """(embeddings_key, meta_key) for a base key such as 'cache/<hash>/chunks'."""
+    return base + ".npy", base + ".meta.json"
+
+
+def missing_key_errors(cache_service) -> Tuple[type, ...]:
+    """Exceptions a cache service raises for an absent key (local cache or boto3)."""
+    errors: List[type] = [FileNotFoundError]
+    exceptions = getattr(cache_service, "exceptions", None)
+    if exceptions is not None and hasattr(exceptions, "NoSuchKey"):
+        errors.append(exceptions.NoSuchKey)
+    return tuple(errors)
+
+
+def metadata_to_dict(md: DocumentMetadata) -> Dict[str, Any]:
+    return {
+        "file_name":       md.file_name,
+        "file_version":    md.file_version,
+        "file_date":       md.file_date.isoformat(),
+        "section_number":  md.section_number,
+        "section_heading": md.section_heading,
+        "section_page":    md.section_page,
+        "document_id":     md.document_id,
+        "document_tags":   md.document_tags,
+    }
+
+
+def metadata_from_dict(d: Dict[str, Any]) -> DocumentMetadata:
+    file_date = datetime.fromisoformat(d["file_date"])
+    return DocumentMetadata(**{**d, "file_date": file_date})
+
+
+def serialize_chunks(chunks: List[DocumentChunk]) -> Tuple[bytes, bytes]:
+    """Encode chunks as (npy bytes, sidecar bytes)."""
+    matrix = np.asarray([np.asarray(c.embedding, dtype="<f4") for c in chunks],
+                        dtype="<f4")
+    buf = BytesIO()
+    np.save(buf, matrix, allow_pickle=False)
+    sidecar = {
+        "format_version": CHUNK_FORMAT_VERSION,
+        "count": len(chunks),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "chunks": [{"content": c.content, "metadata": metadata_to_dict(c.metadata)}
+                   for c in chunks],
+    }
+    meta = json.dumps(sidecar, ensure_ascii=False, separators=(",", ":"))
+    return buf.getvalue(), meta.encode("utf-8")
+
+
+def save_chunks(cache_service, bucket: str, base: str,
+                chunks: List[DocumentChunk]) -> None:
+    """Write chunks to the cache bucket in the binary format."""
+    embeddings_key, meta_key = chunk_keys(base)
+    npy, sidecar = serialize_chunks(chunks)
+    # embeddings first: the sidecar is what marks the entry as present
+    cache_service.put_object(Bucket=bucket, Key=embeddings_key, Body=npy)
+    cache_service.put_object(Bucket=bucket, Key=meta_key, Body=sidecar)
+    logger.info("Stored %d chunks in binary cache %s (%d bytes of embeddings)",
+                len(chunks), base, len(npy))
+
+
+def _load_matrix(cache_service, bucket: str, key: str) -> np.ndarray:
+    local_path = getattr(cache_service, "local_path", None)
+    if local_path is not None:
+        # memory-map: rows are paged in lazily and never copied at load time
+        return np.load(local_path(Bucket=bucket, Key=key), mmap_mode="r",
+                       allow_pickle=False)
+    body = cache_service.get_object(Bucket=bucket, Key=key)["Body"].read()
+    return np.load(BytesIO(body), allow_pickle=False)
+
+
+def load_chunk_matrix(
+    cache_service, bucket: str, base: str
+) -> Optional[Tuple[List[DocumentChunk], np.ndarray]]:
+    """
+    Read chunks stored by save_chunks together with their (memory-mapped) embedding
+    matrix; each chunk's embedding is a row view of it. Returns None if the entry
+    is absent or unreadable.
+    """
+    embeddings_key, meta_key = chunk_keys(base)
+    try:
+        raw = cache_service.get_object(Bucket=bucket, Key=meta_key)["Body"].read()
+        sidecar = json.loads(raw)
+        if sidecar.get("format_version") != CHUNK_FORMAT_VERSION:
+            logger.warning("Unsupported chunk cache version %s in %s",
+                           sidecar.get("format_version"), base)
+            return None
+        matrix = _load_matrix(cache_service, bucket, embeddings_key)
+    except missing_key_errors(cache_service):
+        return None
+
+    if matrix.shape[0] != sidecar["count"]:
+        logger.warning("Chunk cache %s is inconsistent (%d rows, %d chunks)",
+                       base, matrix.shape[0], sidecar["count"])
+        return None
+
+    chunks = [
+        DocumentChunk(content=d["content"], metadata=metadata_from_dict(d["metadata"]),
+                      embedding=matrix[i])
+        for i, d in enumerate(sidecar["chunks"])
+    ]
+    logger.info("Loaded %d chunks from binary cache %s", len(chunks), base)
+    return chunks, matrix
+
+
+def with_file_name(chunks: List[DocumentChunk], file_name: str) -> List[DocumentChunk]:
+    """
+    Chunks labelled with file_name. Cache entries are keyed by content, so the
+    same bytes uploaded under another name find chunks carrying the first name.
+    """
+    return [
+        c if c.metadata.file_name == file_name
+        else replace(c, metadata=replace(c.metadata, file_name=file_name))
+        for c in chunks
+    ]
+
+
+def load_chunks(cache_service, bucket: str, base: str) -> Optional[List[DocumentChunk]]:
+    """
+    Read chunks stored by save_chunks. Each chunk's embedding is a row view of the
+    (memory-mapped) matrix. Returns None if the entry is absent or unreadable.
+    """
+    loaded = load_chunk_matrix(cache_service, bucket, base)
+    return None if loaded is None else loaded[0]
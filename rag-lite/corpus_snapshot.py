@@ -0,0 +1,205 @@
+import json
+import threading
+from collections import Counter
+from dataclasses import replace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from chunk_store import load_chunk_matrix, missing_key_errors, save_chunks
+from log_time import log_time
+from logger import logger
+from rag_pipeline import Corpus, DocumentChunk
+from vector_index import VectorIndex
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+class CorpusSnapshot:
+    """
+    Append-only snapshot of a Corpus in the cache bucket, for warm starts.
+
+    Layout under prefix:
+      manifest.json                 format version and the ordered list of segments
+      segment-NNNNN.npy/.meta.json  chunk bundles in the chunk_store format
+      index.faiss / index.ids.json  optional vector index built on the corpus
+
+    Adding documents writes one new segment and rewrites only the small manifest;
+    existing segments are never touched, so they can stay memory-mapped. Segments
+    hold L2-normalized embeddings, so load_into hands them to the Corpus as they
+    are (Corpus.add_block). Removing or replacing a document tombstones it in the
+    manifest: its id moves from the segment's "documents" to its "dropped" list
+    and its chunks are skipped on load.
+
+    The vector index is not rewritten on every change. The segments and
+    tombstones written since it was saved are its delta. On load, the corpus
+    adds the missing vectors to the restored index and prunes the tombstoned
+    ones. The index is saved again (compacted) once the delta exceeds
+    index_rewrite_ratio of its size, or on save_index().
+    """
+
+    def __init__(self, cache_service, bucket: str, prefix: str = "snapshots/corpus/",
+                 index_rewrite_ratio: float = 0.25, index_min_delta: int = 256):
+        self.cache = cache_service
+        self.bucket = bucket
+        self.prefix = prefix
+        self.index_rewrite_ratio = index_rewrite_ratio
+        self.index_min_delta = index_min_delta
+        self.manifest_key = prefix + "manifest.json"
+        self.index_key = prefix + "index"
+        self._lock = threading.Lock()
+        self._manifest = self._read_manifest()
+
+    def _empty_manifest(self) -> Dict[str, Any]:
+        return {"format_version": SNAPSHOT_FORMAT_VERSION, "segments": []}
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            obj = self.cache.get_object(Bucket=self.bucket, Key=self.manifest_key)
+            raw = obj["Body"].read()
+        except missing_key_errors(self.cache):
+            return self._empty_manifest()
+        manifest = json.loads(raw)
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            logger.warning("Ignoring corpus snapshot %s with unsupported version %s",
+                           self.prefix, manifest.get("format_version"))
+            return self._empty_manifest()
+        return manifest
+
+    def _write_manifest(self) -> None:
+        self.cache.put_object(Bucket=self.bucket, Key=self.manifest_key,
+                              Body=json.dumps(self._manifest, indent=2))
+
+    def document_ids(self) -> List[str]:
+        return [doc for seg in self._manifest["segments"] for doc in seg["documents"]]
+
+    @log_time("Loading corpus snapshot")
+    def load_into(self, corpus: Corpus) -> int:
+        """
+        Add every snapshot segment to the corpus, in order.
+        Returns the number of chunks added.
+        """
+        added = 0
+        for seg in self._manifest["segments"]:
+            loaded = load_chunk_matrix(self.cache, self.bucket,
+                                       self.prefix + seg["name"])
+            if loaded is None:
+                logger.warning("Corpus snapshot segment %s is missing, skipping it",
+                               seg["name"])
+                continue
+            chunks, matrix = loaded
+            dropped = set(seg.get("dropped", []))
+            if dropped:
+                # only segments with tombstones are copied
+                keep = np.array([c.metadata.document_id not in dropped
+                                 for c in chunks], dtype=bool)
+                chunks, matrix = [c for c, k in zip(chunks, keep) if k], matrix[keep]
+            added += corpus.add_block(chunks, matrix)
+        logger.info("Restored %d chunks from %d snapshot segments",
+                    added, len(self._manifest["segments"]))
+        # a restored index may still hold vectors of documents tombstoned since it
+        # was saved
+        corpus.prune_index()
+        return added
+
+    def append(self, chunks: List[DocumentChunk],
+               vector_index: Optional[VectorIndex] = None) -> int:
+        """
+        Persist the chunks of documents not yet in the snapshot as a new segment.
+        The vector index, if given, is saved only once its delta is large enough.
+        Returns the number of chunks written.
+        """
+        with self._lock:
+            written = self._append_segment(chunks)
+            if written:
+                self._changed(written, vector_index)
+                self._write_manifest()
+            return written
+
+    def replace(self, document_ids: List[str], chunks: List[DocumentChunk],
+                vector_index: Optional[VectorIndex] = None) -> int:
+        """
+        Tombstone the given documents and persist the chunks that replace them.
+        The vector index, if given, is saved only once its delta is large enough.
+        Returns the number of chunks written.
+        """
+        with self._lock:
+            replaced = set(document_ids) | {c.metadata.document_id for c in chunks}
+            dropped = self._drop_documents(replaced)
+            written = self._append_segment(chunks)
+            self._changed(dropped + written, vector_index)
+            self._write_manifest()
+            return written
+
+    def remove(self, document_ids: List[str],
+               vector_index: Optional[VectorIndex] = None) -> None:
+        """
+        Tombstone the given documents.
+        The vector index, if given, is saved only once its delta is large enough.
+        """
+        with self._lock:
+            dropped = self._drop_documents(set(document_ids))
+            self._changed(dropped, vector_index)
+            self._write_manifest()
+
+    def save_index(self, vector_index: VectorIndex) -> None:
+        """Persist the whole vector index now, folding in its delta."""
+        with self._lock:
+            self._save_index(vector_index)
+            self._write_manifest()
+
+    def _drop_documents(self, document_ids: set) -> int:
+        """Tombstone documents in their segments; returns how many chunks that drops."""
+        chunks = 0
+        for seg in self._manifest["segments"]:
+            dropped = [d for d in seg["documents"] if d in document_ids]
+            if dropped:
+                seg["documents"] = [d for d in seg["documents"]
+                                    if d not in document_ids]
+                seg["dropped"] = seg.get("dropped", []) + dropped
+                sizes = seg.get("document_chunks", {})
+                chunks += sum(sizes.get(d, 1) for d in dropped)
+                logger.info("Tombstoned %d documents in corpus snapshot segment %s",
+                            len(dropped), seg["name"])
+        return chunks
+
+    def _changed(self, chunks: int, vector_index: Optional[VectorIndex]) -> None:
+        """Count chunks changed since the index was saved; save it once they add up."""
+        if vector_index is None:
+            return
+        delta = self._manifest.get("index_delta", 0) + chunks
+        self._manifest["index_delta"] = delta
+        threshold = max(self.index_min_delta,
+                        self.index_rewrite_ratio * len(vector_index))
+        if delta >= threshold:
+            self._save_index(vector_index)
+
+    def _append_segment(self, chunks: List[DocumentChunk]) -> int:
+        known = set(self.document_ids())
+        new_chunks = [c for c in chunks if c.metadata.document_id not in known]
+        if not new_chunks:
+            return 0
+        name = f"segment-{len(self._manifest['segments']):05d}"
+        # normalized rows can be adopted by the Corpus without a copy on load
+        save_chunks(self.cache, self.bucket, self.prefix + name, [
+            replace(c, embedding=_normalized(c.embedding)) for c in new_chunks
+        ])
+        sizes = Counter(c.metadata.document_id for c in new_chunks)
+        documents = list(sizes)
+        self._manifest["segments"].append({"name": name, "count": len(new_chunks),
+                                           "documents": documents,
+                                           "document_chunks": dict(sizes)})
+        logger.info("Appended %d chunks from %d documents to corpus snapshot as %s",
+                    len(new_chunks), len(documents), name)
+        return len(new_chunks)
+
+    def _save_index(self, vector_index: Optional[VectorIndex]) -> None:
+        if vector_index is not None and hasattr(vector_index, "save"):
+            if vector_index.save(self.cache, self.bucket, self.index_key):
+                self._manifest["index_delta"] = 0
+
+
+def _normalized(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,131 @@
+"""
+Content-based document identity.
+
+A document is identified by the SHA-256 of its raw bytes, hashed in fixed-size
+blocks so large uploads are never held in memory at once. Two index entries in
+the cache bucket back this up:
+  identity/content/<sha256>.json   content hash -> cache prefix of its artifacts
+  identity/stat/<key>.json         (path or name, size, mtime/etag) -> content hash,
+                                   so an unchanged file is not read again
+"""
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, Optional, Union
+
+from chunk_store import missing_key_errors
+from logger import logger
+
+BLOCK_SIZE = 1 << 20  # 1 MiB
+
+
+def stream_sha256(fileobj: BinaryIO, block_size: int = BLOCK_SIZE) -> str:
+    """
+    SHA-256 of a binary stream from its current position, read block_size bytes
+    at a time.
+    """
+    h = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(block_size), b""):
+        h.update(block)
+    return h.hexdigest()
+
+
+def file_sha256(path: str, block_size: int = BLOCK_SIZE) -> str:
+    with open(path, "rb") as f:
+        return stream_sha256(f, block_size)
+
+
+def source_bytes(source: Union[str, os.PathLike, BinaryIO]) -> bytes:
+    """Whole contents of a path or binary stream; in-memory uploads are not copied."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    getvalue = getattr(source, "getvalue", None)  # BytesIO / Streamlit UploadedFile
+    if getvalue is not None:
+        return getvalue()
+    source.seek(0)
+    return source.read()
+
+
+@dataclass(frozen=True)
+class DocumentIdentity:
+    content_hash: str  # hex SHA-256 of the raw bytes, also the document id
+    prefix: str        # cache prefix the document's artifacts live under
+    known: bool        # whether the content was seen before
+
+
+class DocumentIdentityIndex:
+    """Resolves documents to content hashes and content hashes to cache prefixes."""
+
+    def __init__(self, cache_service, bucket: str, prefix: str = "identity/"):
+        self.cache = cache_service
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = self.cache.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except missing_key_errors(self.cache):
+            return None
+        return json.loads(raw)
+
+    def _put(self, key: str, value: Dict[str, Any]) -> None:
+        self.cache.put_object(Bucket=self.bucket, Key=key, Body=json.dumps(value))
+
+    def _stat_key(self, name: str, size: int, tag: str) -> str:
+        digest = hashlib.sha256(f"{name}|{size}|{tag}".encode("utf-8")).hexdigest()
+        return f"{self.prefix}stat/{digest}.json"
+
+    def content_hash(self, source: Union[str, BinaryIO], name: Optional[str] = None,
+                     size: Optional[int] = None, tag: Optional[str] = None) -> str:
+        """
+        SHA-256 of a file path or seekable binary stream. The stream is rewound
+        afterwards. Paths use (size, mtime) as the pre-check; streams use size
+        and tag (e.g. an S3 ETag) when given.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            path = os.fspath(source)
+            st = os.stat(path)
+            name, size, tag = os.path.abspath(path), st.st_size, str(st.st_mtime_ns)
+
+        stat_key = None
+        if name and size is not None and tag:
+            stat_key = self._stat_key(name, size, tag)
+        if stat_key:
+            hit = self._get(stat_key)
+            if hit is not None:
+                return hit["content_hash"]
+
+        if isinstance(source, (str, os.PathLike)):
+            digest = file_sha256(os.fspath(source))
+        else:
+            start = source.tell()
+            digest = stream_sha256(source)
+            source.seek(start)
+
+        if stat_key:
+            self._put(stat_key, {"content_hash": digest})
+        return digest
+
+    def identify(self, source: Union[str, BinaryIO], default_prefix: str,
+                 name: Optional[str] = None, size: Optional[int] = None,
+                 tag: Optional[str] = None) -> DocumentIdentity:
+        """
+        Identity of a document. default_prefix is formatted with the content hash
+        (e.g. "cache/{hash}/") for documents that are not in the index yet.
+        """
+        digest = self.content_hash(source, name=name, size=size, tag=tag)
+        entry = self._get(f"{self.prefix}content/{digest}.json")
+        if entry is not None:
+            return DocumentIdentity(digest, entry["prefix"], True)
+        return DocumentIdentity(digest, default_prefix.format(hash=digest), False)
+
+    def register(self, identity: DocumentIdentity, file_name: str) -> None:
+        """Record where the artifacts of a newly parsed document live."""
+        if identity.known:
+            return
+        self._put(f"{self.prefix}content/{identity.content_hash}.json",
+                  {"prefix": identity.prefix, "file_name": file_name})
+        logger.info("Registered document %s (%s) under %s",
+                    identity.content_hash[:12], file_name, identity.prefix)
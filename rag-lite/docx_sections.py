@@ -0,0 +1,176 @@
+"""
+DOCX → heading-delimited sections, straight from python-docx.
+
+The old path renders the document to HTML with mammoth, turns that into
+markdown with html2text and splits the markdown on headings, holding several
+full copies of the text. Here the body is walked once, paragraph by paragraph,
+and every section is emitted as soon as the next heading starts it, in the
+(text, level, heading) form of DocumentParser._process_heading:
+  - sections start at "Heading 1" to "Heading 3" paragraphs, like the
+    markdown split on #{1,3}; deeper headings stay in the body as "#### ..."
+  - text is the heading line followed by the body, level is "" for text
+    before the first heading
+  - list items become "* item" lines, table rows "| a | b |" lines
+
+Documents with content this walk would lose (text boxes, equations, inline
+content controls, embedded chunks) raise UnsupportedDocx; the mammoth path
+(mammoth_markdown + split_markdown) handles those.
+"""
+import re
+from io import BytesIO
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+SPLIT_LEVEL = 3  # sections start at headings up to this level
+
+_HEADING_NAME = re.compile(r"^heading\s*([1-6])$", re.IGNORECASE)
+
+_PARAGRAPH, _TABLE = qn("w:p"), qn("w:tbl")
+_SDT, _SDT_CONTENT = qn("w:sdt"), qn("w:sdtContent")
+_EXOTIC = (qn("w:txbxContent"), qn("m:oMath"), qn("w:altChunk"), qn("w:customXml"))
+
+# (text, level, heading), level "" when there is no heading
+Section = Tuple[str, str, str]
+
+
+class UnsupportedDocx(ValueError):
+    """The document has content the direct converter cannot render."""
+
+
+def _heading_levels(document) -> Dict[str, int]:
+    """Paragraph style id -> heading level for the document's "Heading N" styles."""
+    levels: Dict[str, int] = {}
+    for style in document.styles:
+        match = _HEADING_NAME.match(style.name or "")
+        if match and style.style_id:
+            levels[style.style_id] = int(match.group(1))
+    return levels
+
+
+def _table_lines(table: Table) -> List[str]:
+    lines = []
+    for row in table.rows:
+        cells = [" ".join(cell.text.split()) for cell in row.cells]
+        if any(cells):
+            lines.append("| " + " | ".join(cells) + " |")
+    return lines
+
+
+def _check_supported(body) -> None:
+    if next(body.iter(*_EXOTIC), None) is not None:
+        raise UnsupportedDocx(
+            "document contains text boxes, equations or embedded content")
+    for sdt in body.iter(_SDT):
+        if sdt.getparent().tag == _PARAGRAPH:
+            raise UnsupportedDocx("document contains inline content controls")
+
+
+def _blocks(container) -> Iterator:
+    """
+    Paragraph and table elements of container, including those in block-level
+    content controls (e.g. a TOC).
+    """
+    for element in container.iterchildren():
+        if element.tag in (_PARAGRAPH, _TABLE):
+            yield element
+        elif element.tag == _SDT:
+            content = element.find(_SDT_CONTENT)
+            if content is not None:
+                yield from _blocks(content)
+
+
+def iter_docx_sections(document) -> Iterator[Section]:
+    """Sections of a python-docx Document, in document order."""
+    body = document.element.body
+    _check_supported(body)
+
+    levels = _heading_levels(document)
+    level, heading, lines = "", "", []
+
+    def section() -> Section:
+        text = "\n".join(lines).strip()
+        return text, level, heading
+
+    for element in _blocks(body):
+        if element.tag == _TABLE:
+            lines.extend(_table_lines(Table(element, document)))
+            continue
+        paragraph = Paragraph(element, document)
+        text = paragraph.text.strip()
+        if not text:
+            continue
+        para_level = levels.get(element.style)
+        if para_level is not None and para_level <= SPLIT_LEVEL:
+            if lines:
+                yield section()
+            level, heading, lines = str(para_level), text, [text]
+        elif para_level is not None:
+            lines.append("#" * para_level + " " + text)
+        elif element.pPr is not None and element.pPr.numPr is not None:
+            lines.append("* " + text)
+        else:
+            lines.append(text)
+    if lines:
+        yield section()
+
+
+def mammoth_markdown(data: bytes) -> str:
+    """DOCX bytes → HTML (mammoth) → markdown (html2text)."""
+    import html2text
+    import mammoth
+
+    html = mammoth.convert_to_html(BytesIO(data)).value
+    converter = html2text.HTML2Text()
+    converter.body_width = 0       # no forced wraps
+    return converter.handle(html)
+
+
+def split_markdown(markdown: str) -> List[str]:
+    """Split markdown before every heading up to SPLIT_LEVEL."""
+    return re.split(r"(?=^#{1,%d} .*)" % SPLIT_LEVEL, markdown, flags=re.MULTILINE)
+
+
+def number_sections(sections: Iterable[Section]) -> List[Section]:
+    """
+    Number (text, level, heading) sections by heading nesting, e.g. 2.1 for the
+    first level-2 heading under the second level-1 heading. Sections without a
+    heading carry the number and heading of the one before them.
+    Returns (text, section_number, heading) triples.
+    """
+    numbered: List[Section] = []
+    section_counter: Dict[int, int] = {}
+    current_heading = ""
+
+    for text, level_str, heading in sections:
+        if level_str:
+            # this is a new heading
+            level = int(level_str)
+            # increment or initialize this level's counter
+            section_counter[level] = section_counter.get(level, 0) + 1
+            # drop any deeper-level counters
+            for lvl in list(section_counter):
+                if lvl > level:
+                    del section_counter[lvl]
+            # build section number from counters up to current level
+            section_number = ".".join(str(section_counter[lvl])
+                                      for lvl in sorted(section_counter)
+                                      if lvl <= level)
+            current_heading = heading
+        else:
+            # carry forward numbering if no new heading
+            section_number = ".".join(str(section_counter[lvl])
+                                      for lvl in sorted(section_counter))
+        numbered.append((text, section_number, current_heading))
+    return numbered
+
+
+def sections_markdown(sections: Iterable[Section]) -> str:
+    """
+    Markdown of (text, level, heading) sections; splitting it on headings gives
+    them back.
+    """
+    return "\n\n".join(("#" * int(level) + " " + text) if level else text
+                       for text, level, _ in sections)
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from logger import logger
+
+
+def embedding_model_name(embedding_service) -> str:
+    """
+    Best-effort model name of an embedding service, looking through wrappers
+    such as ConcurrentEmbeddingExecutor.
+    """
+    for attr in ("model_name", "model"):
+        value = getattr(embedding_service, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    inner = getattr(embedding_service, "embedding_service", None)
+    if inner is not None:
+        return embedding_model_name(inner)
+    return type(embedding_service).__name__
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store in a single SQLite file.
+
+    Entries are keyed by (model name, SHA-256 of the text) and stored as float32
+    blobs. Once the store holds more than max_entries, the least recently used
+    entries are evicted. Safe to share between threads.
+    """
+
+    _QUERY_CHUNK = 500  # stay below SQLite's bound-parameter limit
+
+    def __init__(self, path: str = "local_cache/embeddings.sqlite",
+                 max_entries: int = 200_000):
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   model     TEXT NOT NULL,
+                   text_hash TEXT NOT NULL,
+                   vector    BLOB NOT NULL,
+                   last_used INTEGER NOT NULL,
+                   PRIMARY KEY (model, text_hash)
+               )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self._conn.commit()
+        self._clock = self._conn.execute(
+            "SELECT COALESCE(MAX(last_used), 0) FROM embeddings").fetchone()[0]
+        logger.info("Opened embedding cache %s (%d entries)", path, len(self))
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings for texts; None marks a miss."""
+        hashes = [self.text_hash(t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), self._QUERY_CHUNK):
+                part = unique[start:start + self._QUERY_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                stamp = self._tick()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? "
+                    "WHERE model = ? AND text_hash = ?",
+                    [(stamp, model, h) for h in found],
+                )
+                self._conn.commit()
+
+            results = [found.get(h) for h in hashes]
+            hits = sum(r is not None for r in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model: str, texts: List[str],
+                 embeddings: List[List[float]]) -> None:
+        """Store embeddings for texts, evicting the least recently used past the cap."""
+        with self._lock:
+            stamp = self._tick()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings "
+                "(model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [
+                    (model, self.text_hash(t),
+                     np.asarray(e, dtype=np.float32).tobytes(), stamp)
+                    for t, e in zip(texts, embeddings)
+                ],
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                logger.info("Evicted %d least recently used embeddings from cache",
+                            excess)
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters since this cache was opened."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddingService:
+    """
+    EmbeddingService that answers from an EmbeddingCache first and only sends
+    texts it has never seen (for this model) to the wrapped service.
+    """
+
+    def __init__(self, embedding_service, cache: EmbeddingCache,
+                 model_name: Optional[str] = None):
+        self.embedding_service = embedding_service
+        self.cache = cache
+        self.model = getattr(embedding_service, "model", None)
+        self.model_name = model_name or embedding_model_name(embedding_service)
+
+    def embed_text(self, text: str) -> List[float]:
+        cached = self.cache.get_many(self.model_name, [text])[0]
+        if cached is not None:
+            return cached
+        embedding = list(self.embedding_service.embed_text(text))
+        self.cache.put_many(self.model_name, [text], [embedding])
+        return embedding
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        results = self.cache.get_many(self.model_name, texts)
+        cached = sum(r is not None for r in results)
+        # embed each distinct missing text once, even if it repeats within the batch
+        missing = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+        if missing:
+            embedded = self.embedding_service.embed_texts(missing)
+            fresh = dict(zip(missing, (list(e) for e in embedded)))
+            self.cache.put_many(self.model_name, missing, list(fresh.values()))
+            results = [fresh[t] if r is None else r for t, r in zip(texts, results)]
+        logger.info("Embedding cache: %d of %d texts cached, %d embedded",
+                    cached, len(texts), len(missing))
+        return results
@@ -0,0 +1,157 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, List, Optional, Tuple, TypeVar
+
+from logger import logger
+
+T = TypeVar("T")
+
+# exception classes of the embedding clients (openai, httpx, ollama) that mean the
+# request never got an answer, matched by name so none of them has to be imported
+TRANSIENT_ERRORS = ("APITimeoutError", "APIConnectionError", "TimeoutException",
+                    "ConnectError", "ReadTimeout", "ConnectTimeout")
+
+
+def status_code(error: Exception) -> Optional[int]:
+    """HTTP status of a failed request, as reported by openai, httpx or ollama."""
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limiting (429), server errors (5xx), timeouts and dropped connections."""
+    code = status_code(error)
+    if code is not None:
+        return code == 429 or code >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+class RateLimiter:
+    """
+    Sliding one-minute budget for requests and (estimated) tokens,
+    shared by every worker thread of an executor. A limit of None is unlimited.
+    """
+    WINDOW = 60.0
+
+    def __init__(self, requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None):
+        for name, limit in (("requests_per_minute", requests_per_minute),
+                            ("tokens_per_minute", tokens_per_minute)):
+            if limit is not None and limit < 1:
+                raise ValueError(f"{name} must be positive or None, got {limit}")
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._events: Deque[Tuple[float, int]] = deque()  # (timestamp, tokens)
+        self._tokens_in_window = 0
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request of the given size fits in both budgets."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= self.WINDOW:
+                    self._tokens_in_window -= self._events.popleft()[1]
+
+                requests_ok = (self.requests_per_minute is None
+                               or len(self._events) < self.requests_per_minute)
+                # a single request larger than the whole budget is let through on an
+                # empty window
+                tokens_ok = (self.tokens_per_minute is None
+                             or not self._events
+                             or self._tokens_in_window + tokens
+                             <= self.tokens_per_minute)
+                if requests_ok and tokens_ok:
+                    self._events.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+                wait = self.WINDOW - (now - self._events[0][0])
+            time.sleep(max(wait, 0.01))
+
+
+class ConcurrentEmbeddingExecutor:
+    """
+    Wraps any EmbeddingService and keeps several embedding requests in flight.
+
+    embed_texts splits its input into batches of batch_size texts, runs them on a
+    thread pool under the requests/tokens-per-minute budgets, retries rate limits,
+    server errors and timeouts with exponential backoff and full jitter, and
+    returns embeddings in input order. Other errors are raised immediately.
+    Retries stack with any the wrapped client makes itself, so build that client
+    without retries (e.g. OpenAIEmbeddingService(max_retries=0)).
+    The executor is itself an EmbeddingService, so it can be handed to a parser.
+    """
+
+    def __init__(
+        self,
+        embedding_service,
+        max_workers: int = 4,
+        batch_size: int = 64,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+    ):
+        if max_workers < 1 or batch_size < 1:
+            raise ValueError("max_workers and batch_size must be positive")
+        if max_retries < 0:
+            raise ValueError("max_retries must not be negative")
+        self.embedding_service = embedding_service
+        self.model = getattr(embedding_service, "model", None)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix="embed")
+        logger.info("Initialized ConcurrentEmbeddingExecutor with %d workers, "
+                    "batch size %d", max_workers, batch_size)
+
+    def _call_with_retry(self, fn: Callable[[], T], tokens: int) -> T:
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(tokens)
+            try:
+                return fn()
+            except Exception as e:
+                # bad input or credentials won't be fixed by asking again
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(
+                    0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                logger.warning("Embedding request failed (%s), retry %d/%d in %.1fs",
+                               e, attempt + 1, self.max_retries, delay)
+                time.sleep(delay)
+
+    def embed_text(self, text: str) -> List[float]:
+        return self._call_with_retry(lambda: self.embedding_service.embed_text(text),
+                                     len(text) // 4 + 1)
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        tokens = sum(len(text) // 4 + 1 for text in batch)
+        return self._call_with_retry(
+            lambda: self.embedding_service.embed_texts(batch), tokens)
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size]
+                   for i in range(0, len(texts), self.batch_size)]
+        futures = [self._pool.submit(self._embed_batch, batch) for batch in batches]
+
+        embeddings: List[List[float]] = []
+        for future in futures:  # in submission order, so results align with texts
+            embeddings.extend(future.result())
+        logger.debug("Embedded %d texts in %d concurrent batches",
+                     len(embeddings), len(batches))
+        return embeddings
+
+    def shutdown(self) -> None:
+        """Wait for in-flight requests and release the worker threads."""
+        self._pool.shutdown(wait=True)
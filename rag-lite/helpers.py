@@ -1,18 +1,23 @@
 import yaml
 
-def load_config(name):
+_MISSING = object()
+
+def load_config(name, default=_MISSING):
     """
     Loads a specific value from config.yaml based on the provided key name.
     
     Args:
         name (str): The key to retrieve from the config.yaml file.
+        default: Value returned when the key is absent. If omitted, a missing
+            key raises KeyError.
         
     Returns:
         The value associated with the key.
         
     Raises:
         FileNotFoundError: If config.yaml is not found.
-        KeyError: If the specified key is not in the config file.
+        KeyError: If the specified key is not in the config file and no default
+            is given.
     """
     try:
         with open('config.yaml', 'r') as file:
@@ -21,4 +26,6 @@ def load_config(name):
     except FileNotFoundError:
         raise FileNotFoundError("config.yaml file not found")
     except KeyError:
+        if default is not _MISSING:
+            return default
         raise KeyError(f"Key '{name}' not found in config.yaml")
@@ -0,0 +1,133 @@
+"""
+In-memory inverted index with BM25 scoring over corpus rows.
+
+Embeddings blur exact identifiers: a query for "AC-2", "4.3.1" or a product
+name may not rank the chunk that contains it. This index matches such terms
+exactly. Like the vector index, its rows are the corpus rows. Corpus keeps it
+in sync as chunks are added, replaced or removed (Corpus.attach_lexical_index).
+
+Tokens are lowercased alphanumeric runs. Identifiers joined by ".", "-", "_"
+or "/" are kept whole as well as split into their parts, so "ISO-27001" is
+matched by "iso-27001", "iso" and "27001". Common English stopwords are
+dropped: they match nearly every chunk and say nothing about relevance.
+"""
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+_PARTS = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be because been before
+being below between both but by can could did do does doing down during each few
+for from further had has have having he her here hers him his how i if in into
+is it its itself just me more most my no nor not now of off on once only or
+other our ours out over own same she should so some such than that the their
+theirs them then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your
+yours
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for token in _TOKEN.findall(text.lower()):
+        parts = _PARTS.findall(token)
+        if len(parts) == 1:
+            if token not in STOPWORDS:
+                tokens.append(token)
+            continue
+        kept = [part for part in parts if part not in STOPWORDS]
+        if kept:
+            tokens.append(token)
+            tokens.extend(kept)
+    return tokens
+
+
+class BM25Index:
+    """BM25 (Okapi) scores of query terms against rows of tokenized text."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.reset()
+
+    def reset(self) -> None:
+        self._docs: List[Dict[str, int]] = []  # row -> term frequencies
+        self._lengths: List[int] = []
+        self._total_length = 0
+        self._postings: Dict[str, List[int]] = {}  # term -> rows containing it
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, texts: Sequence[str]) -> None:
+        """Append rows for texts, in order."""
+        for text in texts:
+            self._append(Counter(tokenize(text)))
+
+    def _append(self, freqs: Dict[str, int]) -> None:
+        row = len(self._docs)
+        self._docs.append(freqs)
+        length = sum(freqs.values())
+        self._lengths.append(length)
+        self._total_length += length
+        for term in freqs:
+            self._postings.setdefault(term, []).append(row)
+
+    def keep(self, mask: Sequence[bool]) -> None:
+        """
+        Drop the rows whose mask entry is False, renumbering the rest in order
+        (no re-tokenization).
+        """
+        kept = [freqs for freqs, k in zip(self._docs, mask) if k]
+        self.reset()
+        for freqs in kept:
+            self._append(freqs)
+
+    def scores(self, query_text: str) -> np.ndarray:
+        """BM25 score of every row for the query; rows sharing no term score 0."""
+        n = len(self._docs)
+        scores = np.zeros(n, dtype=np.float32)
+        if not n:
+            return scores
+        lengths = np.asarray(self._lengths, dtype=np.float32)
+        avg_length = max(self._total_length / n, 1e-9)
+        norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+        for term in set(tokenize(query_text)):
+            rows = self._postings.get(term)
+            if not rows:
+                continue
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            rows_arr = np.asarray(rows)
+            tf = np.fromiter((self._docs[r][term] for r in rows), dtype=np.float32,
+                             count=len(rows))
+            scores[rows_arr] += idf * tf * (self.k1 + 1) / (tf + norm[rows_arr])
+        return scores
+
+    def search(self, query_text: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (scores, rows) of the k best-matching rows, best first; rows without a
+        match are left out.
+        """
+        scores = self.scores(query_text)
+        rows = np.flatnonzero(scores > 0)
+        if len(rows) > k:
+            rows = rows[np.argpartition(-scores[rows], k - 1)[:k]]
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+        return scores[rows], rows
+
+
+def build_lexical_index(settings: Dict[str, Any]) -> Optional[BM25Index]:
+    """
+    Build the index described by the `lexical_index` section of config.yaml.
+    Returns None when it is disabled.
+    """
+    settings = dict(settings or {})
+    if not settings.pop("enabled", True):
+        return None
+    return BM25Index(**settings)
@@ -1,13 +1,18 @@
-import os
 import json
+import os
 import shutil
+import threading
+from datetime import datetime, timezone
 from io import BytesIO
 
+
 class LocalEmbeddingService:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 batch_size: int = 32):
         from sentence_transformers import SentenceTransformer
         self.model_name = model_name
         self.model = SentenceTransformer(model_name)
+        self.batch_size = batch_size
 
     def embed_text(self, texts):
         """
@@ -16,13 +21,23 @@ class LocalEmbeddingService:
         embs = self.model.encode(texts, convert_to_numpy=True)
         return embs.tolist()
 
+    def embed_texts(self, texts):
+        """
+        texts: List[str] → List[List[float]], encoded batch_size texts at a time
+        """
+        if not texts:
+            return []
+        embs = self.model.encode(texts, batch_size=self.batch_size,
+                                 convert_to_numpy=True)
+        return embs.tolist()
+
 
 class LocalGenerationService:
     def __init__(self, model_name: str = "google/flan-t5-small"):
         from transformers import (
-            AutoTokenizer,
             AutoModelForSeq2SeqLM,
-            Text2TextGenerationPipeline
+            AutoTokenizer,
+            Text2TextGenerationPipeline,
         )
         self.model = model_name
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
@@ -42,8 +57,13 @@ class LocalGenerationService:
 
 class LocalCacheService:
     """
-    A drop-in replacement for boto3 S3 client methods: get_object, put_object,
-    upload_file, download_file, upload_fileobj. Stores files under cache_dir/<Bucket>/<Key>.
+    A drop-in replacement for boto3 S3 client methods: get_object, head_object,
+    put_object, upload_file, download_file, upload_fileobj, plus exists and
+    get_many helpers.
+    Stores files under cache_dir/<Bucket>/<Key>. Reads return in-memory bodies, so
+    no file handle outlives the call.
+    Writes are atomic (temp file + rename), so readers holding a memory map of an
+    object keep seeing the old contents if it is overwritten.
     """
     def __init__(self, cache_dir="local_cache"):
         self.cache_dir = cache_dir
@@ -52,15 +72,60 @@ class LocalCacheService:
     def _path(self, Bucket, Key):
         return os.path.join(self.cache_dir, Bucket, Key)
 
-    def get_object(self, Bucket, Key):
+    def local_path(self, Bucket, Key):
+        """Filesystem path of a cached object, e.g. for memory-mapping it."""
         path = self._path(Bucket, Key)
         if not os.path.exists(path):
             raise FileNotFoundError(f"{Bucket}/{Key} not found in local cache")
-        return {"Body": open(path, "rb")}
+        return path
 
-    def put_object(self, Bucket, Key, Body):
-        path = self._path(Bucket, Key)
+    def _write_atomic(self, path, data):
         os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _read(self, Bucket, Key):
+        try:
+            with open(self._path(Bucket, Key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"{Bucket}/{Key} not found in local cache") from None
+
+    def get_object(self, Bucket, Key):
+        data = self._read(Bucket, Key)
+        return {"Body": BytesIO(data), "ContentLength": len(data)}
+
+    def head_object(self, Bucket, Key):
+        """Object metadata without reading it; raises FileNotFoundError if absent."""
+        try:
+            st = os.stat(self._path(Bucket, Key))
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"{Bucket}/{Key} not found in local cache") from None
+        return {
+            "ContentLength": st.st_size,
+            "LastModified": datetime.fromtimestamp(st.st_mtime, tz=timezone.utc),
+            "ETag": f'"{st.st_size:x}-{st.st_mtime_ns:x}"',
+        }
+
+    def exists(self, Bucket, Key):
+        return os.path.isfile(self._path(Bucket, Key))
+
+    def get_many(self, Bucket, Keys):
+        """Contents of every present key as {key: bytes}; absent keys are left out."""
+        found = {}
+        for key in Keys:
+            try:
+                found[key] = self._read(Bucket, key)
+            except FileNotFoundError:
+                continue
+        return found
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        path = self._path(Bucket, Key)
         # Body may be bytes, str, or file-like
         if hasattr(Body, "read"):
             data = Body.read()
@@ -70,13 +135,14 @@ class LocalCacheService:
             data = Body
         else:
             data = json.dumps(Body).encode()
-        with open(path, "wb") as f:
-            f.write(data)
+        self._write_atomic(path, data)
 
     def upload_file(self, Filename, Bucket, Key):
         dest = self._path(Bucket, Key)
         os.makedirs(os.path.dirname(dest), exist_ok=True)
-        shutil.copyfile(Filename, dest)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(Filename, tmp)
+        os.replace(tmp, dest)
 
     def download_file(self, Bucket, Key, Filename):
         src = self._path(Bucket, Key)
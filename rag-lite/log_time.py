@@ -1,9 +1,11 @@
 import time
-import humanfriendly
-import logging
 from functools import wraps
+
+import humanfriendly
+
 from logger import logger
 
+
 def log_time(label: str):
     """
     Decorator to time a function/method and log the elapsed time in natural language.
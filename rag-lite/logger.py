@@ -2,6 +2,7 @@ import logging
 import os
 from datetime import datetime
 
+
 def setup_logger(name: str = "rag-lite"):
     logger = logging.getLogger(name)
     if not logger.handlers:  # Avoid adding handlers multiple times
@@ -0,0 +1,123 @@
+import gc
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from logger import logger
+from page_cache import split_paginated
+from registry import registry
+
+
+class MarkerConverterPool:
+    """
+    Long-lived pool of Marker PdfConverters.
+
+    Loading Marker's layout/OCR models is far more expensive than converting a
+    typical PDF, so converters are built once, on first use or on warmup(), and
+    reused for every document. With share_models the pool slots share a single
+    model bundle; otherwise each slot loads its own copy, trading memory for
+    conversions that do not contend on the same model objects.
+    """
+
+    def __init__(self, size: int = 1, share_models: bool = True,
+                 converter_config: Optional[Dict[str, Any]] = None):
+        if size < 1:
+            raise ValueError("size must be positive")
+        self.size = size
+        self.share_models = share_models
+        self.converter_config = converter_config or {}
+        self._lock = threading.Lock()
+        self._idle: "queue.Queue[Any]" = queue.Queue()
+        self._converters: List[Any] = []
+        self._models: Optional[Dict[str, Any]] = None
+        self._slot_models: Dict[int, Dict[str, Any]] = {}  # id(converter) -> its models
+
+    @property
+    def ready(self) -> bool:
+        return len(self._converters) == self.size
+
+    def _build_converter(self):
+        # imported here: Marker pulls in torch and its model definitions
+        from marker.converters.pdf import PdfConverter
+        from marker.models import create_model_dict
+        if self.share_models:
+            if self._models is None:
+                self._models = create_model_dict()
+            models = self._models
+        else:
+            models = create_model_dict()
+        kwargs = {"config": self.converter_config} if self.converter_config else {}
+        converter = PdfConverter(artifact_dict=models, **kwargs)
+        self._slot_models[id(converter)] = models
+        return converter
+
+    def warmup(self) -> None:
+        """Load the models and build every converter now, not on the first PDF."""
+        with self._lock:
+            if self.ready:
+                return
+            start = time.perf_counter()
+            while len(self._converters) < self.size:
+                converter = self._build_converter()
+                self._converters.append(converter)
+                self._idle.put(converter)
+            logger.info("Built %d Marker converters in %.1fs",
+                        self.size, time.perf_counter() - start)
+
+    @contextmanager
+    def converter(self) -> Iterator[Any]:
+        """Check out an idle converter, blocking while all of them are busy."""
+        if not self.ready:
+            self.warmup()
+        converter = self._idle.get()
+        try:
+            yield converter
+        finally:
+            self._idle.put(converter)
+
+    def convert_pages(self, pdf_path: str, pages: List[int]) -> Dict[int, str]:
+        """Convert only the given (0-based) pages; returns page -> markdown."""
+        from marker.converters.pdf import PdfConverter
+        with self.converter() as converter:
+            # same models as the pooled converter, page-specific settings
+            config = {**self.converter_config, "page_range": list(pages),
+                      "paginate_output": True}
+            paged = PdfConverter(artifact_dict=self._slot_models[id(converter)],
+                                 config=config)
+            return split_paginated(paged(pdf_path).markdown, list(pages))
+
+    def teardown(self) -> None:
+        """Drop the converters and models so their memory can be reclaimed."""
+        with self._lock:
+            self._converters = []
+            self._idle = queue.Queue()
+            self._models = None
+            self._slot_models = {}
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        logger.info("Released Marker converter pool")
+
+
+MARKER_POOL_KEY = "marker_pool"
+
+
+def shared_converter_pool(size: int = 1, share_models: bool = True,
+                          converter_config: Optional[Dict[str, Any]] = None,
+                          owner=None) -> MarkerConverterPool:
+    """
+    Process-wide pool from the registry (the first caller's settings win),
+    acquired through owner (a registry Lease) if given; otherwise release
+    MARKER_POOL_KEY when done. The pool stays cheap until its first conversion.
+    """
+    return (owner or registry).acquire(
+        MARKER_POOL_KEY,
+        lambda: MarkerConverterPool(size, share_models, converter_config),
+        dispose=MarkerConverterPool.teardown,
+    )
@@ -1,9 +1,11 @@
-import os
 import json
+import os
 import shutil
-from typing import List, Protocol, Dict
+import threading
+from datetime import datetime, timezone
 from io import BytesIO
-import ollama
+from typing import List, Protocol
+
 from logger import logger
 
 
@@ -12,6 +14,9 @@ class EmbeddingService(Protocol):
     def embed_text(self, text: str) -> List[float]:
         ...
 
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        ...
+
 # === Generation Service Protocol ===
 class GenerationService(Protocol):
     def generate_response(self, augmented_prompt: str) -> str:
@@ -19,23 +24,40 @@ class GenerationService(Protocol):
 
 
 class OllamaEmbeddingService:
-    def __init__(self, model: str = "mxbai-embed-large"):
+    def __init__(self, model: str = "mxbai-embed-large", batch_size: int = 64):
+        import ollama
+        self.client = ollama.Client()
         self.model = model
+        self.batch_size = batch_size
         logger.info("Initialized OpenAIEmbeddingService with model: %s", model)
 
     def embed_text(self, texts)-> List[float]:
         """
         texts: str → List[float]
         """
-        return ollama.embeddings(model=self.model, prompt=texts).embedding
+        return self.client.embeddings(model=self.model, prompt=texts).embedding
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        texts: List[str] → List[List[float]], batch_size inputs per /api/embed call
+        """
+        embeddings: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            response = self.client.embed(model=self.model, input=batch)
+            embeddings.extend(list(e) for e in response.embeddings)
+        return embeddings
 
 
 class OllamaGenerationService:
     def __init__(self, model: str = "deepseek-r1:latest"):
+        import ollama
+        self.client = ollama.Client()
         self.model = model
 
     def generate_response(self, prompt: str) -> str:
-        response_chunks = ollama.generate(model=self.model, prompt=prompt, stream=True)
+        response_chunks = self.client.generate(model=self.model, prompt=prompt,
+                                               stream=True)
         collected = ""
         for chunk in response_chunks:
             token = chunk['response']
@@ -47,8 +69,13 @@ class OllamaGenerationService:
 
 class LocalCacheService:
     """
-    A drop-in replacement for boto3 S3 client methods: get_object, put_object,
-    upload_file, download_file, upload_fileobj. Stores files under cache_dir/<Bucket>/<Key>.
+    A drop-in replacement for boto3 S3 client methods: get_object, head_object,
+    put_object, upload_file, download_file, upload_fileobj, plus exists and
+    get_many helpers.
+    Stores files under cache_dir/<Bucket>/<Key>. Reads return in-memory bodies, so
+    no file handle outlives the call.
+    Writes are atomic (temp file + rename), so readers holding a memory map of an
+    object keep seeing the old contents if it is overwritten.
     """
     def __init__(self, cache_dir="local_cache"):
         self.cache_dir = cache_dir
@@ -57,15 +84,60 @@ class LocalCacheService:
     def _path(self, Bucket, Key):
         return os.path.join(self.cache_dir, Bucket, Key)
 
-    def get_object(self, Bucket, Key):
+    def local_path(self, Bucket, Key):
+        """Filesystem path of a cached object, e.g. for memory-mapping it."""
         path = self._path(Bucket, Key)
         if not os.path.exists(path):
             raise FileNotFoundError(f"{Bucket}/{Key} not found in local cache")
-        return {"Body": open(path, "rb")}
+        return path
 
-    def put_object(self, Bucket, Key, Body):
-        path = self._path(Bucket, Key)
+    def _write_atomic(self, path, data):
         os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _read(self, Bucket, Key):
+        try:
+            with open(self._path(Bucket, Key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"{Bucket}/{Key} not found in local cache") from None
+
+    def get_object(self, Bucket, Key):
+        data = self._read(Bucket, Key)
+        return {"Body": BytesIO(data), "ContentLength": len(data)}
+
+    def head_object(self, Bucket, Key):
+        """Object metadata without reading it; raises FileNotFoundError if absent."""
+        try:
+            st = os.stat(self._path(Bucket, Key))
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"{Bucket}/{Key} not found in local cache") from None
+        return {
+            "ContentLength": st.st_size,
+            "LastModified": datetime.fromtimestamp(st.st_mtime, tz=timezone.utc),
+            "ETag": f'"{st.st_size:x}-{st.st_mtime_ns:x}"',
+        }
+
+    def exists(self, Bucket, Key):
+        return os.path.isfile(self._path(Bucket, Key))
+
+    def get_many(self, Bucket, Keys):
+        """Contents of every present key as {key: bytes}; absent keys are left out."""
+        found = {}
+        for key in Keys:
+            try:
+                found[key] = self._read(Bucket, key)
+            except FileNotFoundError:
+                continue
+        return found
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        path = self._path(Bucket, Key)
         # Body may be bytes, str, or file-like
         if hasattr(Body, "read"):
             data = Body.read()
@@ -75,13 +147,14 @@ class LocalCacheService:
             data = Body
         else:
             data = json.dumps(Body).encode()
-        with open(path, "wb") as f:
-            f.write(data)
+        self._write_atomic(path, data)
 
     def upload_file(self, Filename, Bucket, Key):
         dest = self._path(Bucket, Key)
         os.makedirs(os.path.dirname(dest), exist_ok=True)
-        shutil.copyfile(Filename, dest)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(Filename, tmp)
+        os.replace(tmp, dest)
 
     def download_file(self, Bucket, Key, Filename):
         src = self._path(Bucket, Key)
@@ -1,5 +1,5 @@
-from openai import OpenAI
-from typing import List, Protocol, Dict
+from typing import Dict, List, Optional, Protocol
+
 from logger import logger
 
 # === Embedding Service Protocol ===
@@ -8,6 +8,9 @@ class EmbeddingService(Protocol):
     def embed_text(self, text: str) -> List[float]:
         ...
 
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        ...
+
 # === Generation Service Protocol ===
 
 class GenerationService(Protocol):
@@ -17,9 +20,24 @@ class GenerationService(Protocol):
 # === OpenAI Implementation ===
 
 class OpenAIEmbeddingService:
-    def __init__(self, api_key: str, model: str = "text-embedding-3-small"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "text-embedding-3-small",
+        max_batch_inputs: int = 2048,
+        max_batch_tokens: int = 250_000,
+        max_retries: Optional[int] = None,
+    ):
+        from openai import OpenAI
+        # max_retries=0 when a ConcurrentEmbeddingExecutor retries instead; None
+        # keeps the client's default
+        options = {} if max_retries is None else {"max_retries": max_retries}
+        self.client = OpenAI(api_key=api_key, **options)
         self.model = model
+        # the API caps a request at 2048 inputs and 300k tokens; keep headroom
+        # because token counts below are estimated
+        self.max_batch_inputs = max_batch_inputs
+        self.max_batch_tokens = max_batch_tokens
         logger.info("Initialized OpenAIEmbeddingService with model: %s", model)
 
     def embed_text(self, text: str) -> List[float]:
@@ -36,8 +54,44 @@ class OpenAIEmbeddingService:
         logger.debug("Successfully generated embedding")
         return response.data[0].embedding
 
+    def _split_batches(self, texts: List[str]) -> List[List[str]]:
+        """Group texts into requests that stay under the input and token limits."""
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for text in texts:
+            tokens = len(text) // 4 + 1
+            if current and (len(current) >= self.max_batch_inputs
+                            or current_tokens + tokens > self.max_batch_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        if any(not text.strip() for text in texts):
+            raise ValueError("Cannot embed empty text.")
+
+        embeddings: List[List[float]] = []
+        batches = self._split_batches(texts)
+        for batch in batches:
+            response = self.client.embeddings.create(
+                input=batch,
+                model=self.model
+            )
+            # results carry their input index; don't rely on response order
+            ordered = sorted(response.data, key=lambda d: d.index)
+            embeddings.extend(d.embedding for d in ordered)
+        logger.debug("Generated %d embeddings in %d requests",
+                     len(embeddings), len(batches))
+        return embeddings
+
 class OpenAIGenerationService:
     def __init__(self, api_key: str, model: str = "gpt-4.1-nano-2025-04-14", memory_window: int = 1):
+        from openai import OpenAI
         self.client = OpenAI(api_key=api_key)
         self.model = model
         self.memory_window = memory_window
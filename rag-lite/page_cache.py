@@ -0,0 +1,128 @@
+"""
+Page-level cache of Marker output.
+
+Each PDF page is identified by a hash of its content (extracted text plus a
+low-resolution render), and its Marker markdown is stored under that hash. A
+revised PDF then only needs the pages whose hash is new to be converted; the
+rest are reassembled from the cache. Cached markdown is position independent:
+Marker's <span id="page-N-M"> anchors are stored with a placeholder instead of
+N and renumbered for the page's position in the document being assembled.
+"""
+import hashlib
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from cache_io import get_many
+from chunk_store import missing_key_errors
+from logger import logger
+
+PAGE_PLACEHOLDER = "__PAGE__"
+
+_PAGE_ANCHOR = re.compile(
+    r'(<span\s+id="page-)(\d+|' + PAGE_PLACEHOLDER + r')(-\d+"\s*>)')
+# Marker's paginate_output separator: "{page_id}" followed by 48 dashes
+_PAGE_SEPARATOR = re.compile(r'^\{(\d+)\}-{48}\s*$', re.MULTILINE)
+
+
+def set_page_number(markdown: str, page) -> str:
+    """Point every page anchor in markdown at page (a number or PAGE_PLACEHOLDER)."""
+    return _PAGE_ANCHOR.sub(lambda m: f"{m.group(1)}{page}{m.group(3)}", markdown)
+
+
+def split_paginated(markdown: str, pages: List[int]) -> Dict[int, str]:
+    """
+    Split Marker output rendered with paginate_output into page -> markdown for
+    the requested pages, in order. Separators that carry document page ids are
+    used as is; otherwise segments are matched to pages by position.
+    """
+    parts = _PAGE_SEPARATOR.split(markdown)
+    # parts = [preamble, id, text, id, text, ...]
+    ids = [int(p) for p in parts[1::2]]
+    texts = [t.strip("\n") for t in parts[2::2]]
+    if not ids:
+        if len(pages) != 1:
+            raise ValueError(f"Expected paginated output for {len(pages)} pages")
+        return {pages[0]: markdown.strip("\n")}
+    if not set(ids) <= set(pages):
+        if len(ids) != len(pages):
+            raise ValueError(
+                f"Got {len(ids)} pages of output for {len(pages)} requested pages")
+        ids = list(pages)
+    by_page = {page: "" for page in pages}  # pages Marker found nothing on stay empty
+    by_page.update(zip(ids, texts))
+    return by_page
+
+
+def page_hashes(pdf_path: str, render_scale: float = 0.25) -> List[str]:
+    """Content hash of every page: its text layer plus a low-resolution render."""
+    import pypdfium2
+    pdf = pypdfium2.PdfDocument(pdf_path)
+    hashes: List[str] = []
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            h = hashlib.sha256()
+            h.update(textpage.get_text_range().encode("utf-8"))
+            h.update(np.ascontiguousarray(page.render(scale=render_scale).to_numpy()).tobytes())
+            hashes.append(h.hexdigest())
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return hashes
+
+
+class PageCache:
+    """Marker markdown per page content hash, kept in the cache bucket under prefix."""
+
+    def __init__(self, cache_service, bucket: str, prefix: str = "pages/"):
+        self.cache = cache_service
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, page_hash: str) -> str:
+        return f"{self.prefix}{page_hash}.md"
+
+    def get(self, page_hash: str, page: int) -> Optional[str]:
+        """Cached markdown for page_hash, numbered as the given page; None on a miss."""
+        try:
+            obj = self.cache.get_object(Bucket=self.bucket, Key=self._key(page_hash))
+            raw = obj["Body"].read()
+        except missing_key_errors(self.cache):
+            return None
+        text = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+        return set_page_number(text, page)
+
+    def put(self, page_hash: str, markdown: str) -> None:
+        body = set_page_number(markdown, PAGE_PLACEHOLDER).encode("utf-8")
+        self.cache.put_object(Bucket=self.bucket, Key=self._key(page_hash), Body=body)
+
+    def assemble(self, hashes: List[str], convert_pages) -> str:
+        """
+        Markdown of a whole document: cached pages are reused, the others are
+        converted with convert_pages(pages) -> {page: markdown} and cached.
+        """
+        by_page: Dict[int, str] = {}
+        missing: List[int] = []
+        # one multi-key read for all pages instead of a lookup per page
+        keys = list(dict.fromkeys(self._key(h) for h in hashes))
+        found = get_many(self.cache, self.bucket, keys)
+        for page, page_hash in enumerate(hashes):
+            raw = found.get(self._key(page_hash))
+            if raw is None:
+                missing.append(page)
+            else:
+                by_page[page] = set_page_number(raw.decode("utf-8"), page)
+        logger.info("Page cache: %d of %d pages cached, converting %d",
+                    len(by_page), len(hashes), len(missing))
+
+        if missing:
+            converted = convert_pages(missing)
+            for page in missing:
+                markdown = set_page_number(converted.get(page, ""), page)
+                self.put(hashes[page], markdown)
+                by_page[page] = markdown
+        return "\n\n".join(by_page[page] for page in range(len(hashes)))
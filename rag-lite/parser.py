@@ -1,45 +1,45 @@
-import os
-import re
-import subprocess
 import json
-import hashlib
-from typing import List, Dict, Any, Tuple
+import re
 from datetime import datetime
-import mammoth
-import html2text  
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
 from docx import Document as DocxDocument
-from rag_pipeline import DocumentChunk, DocumentMetadata
+
+from chunk_store import load_chunks, missing_key_errors, save_chunks, with_file_name
+from doc_identity import DocumentIdentityIndex, source_bytes
+from docx_sections import (
+    UnsupportedDocx,
+    iter_docx_sections,
+    mammoth_markdown,
+    number_sections,
+    sections_markdown,
+    split_markdown,
+)
+from embedding_cache import CachedEmbeddingService, EmbeddingCache
 from logger import logger
+from rag_pipeline import DocumentChunk, DocumentMetadata
+from revisions import embed_sections
 
 
 class DocumentParser:
-    def __init__(self, embedding_service, s3_client, bucket_name):
+    def __init__(self, embedding_service, s3_client, bucket_name,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 docx_converter: str = "direct"):
+        # shared, content-addressed embeddings survive document hash changes
+        if embedding_cache is not None:
+            embedding_service = CachedEmbeddingService(embedding_service,
+                                                       embedding_cache)
         self.embedding_service = embedding_service
-        self.cache_root = "tmp/cache/"
-        os.makedirs(self.cache_root, exist_ok=True)
+        self.embedding_cache = embedding_cache
         self.bucket = bucket_name
         self.s3 = s3_client
+        # documents are identified by the SHA-256 of their bytes, not their properties
+        self.identity = DocumentIdentityIndex(s3_client, bucket_name)
+        # "direct": walk python-docx paragraphs, "mammoth": DOCX → HTML → markdown
+        self.docx_converter = docx_converter
         logger.info("DocumentParser initialized with s3 bucket: %s", self.bucket)
 
-    def _hash_docx_metadata(self, docx_file: DocxDocument) -> str:
-        core_props = docx_file.core_properties
-        key_data = f"{core_props.title}-{core_props.modified}-{core_props.author}"
-        return hashlib.sha256(key_data.encode()).hexdigest()
-
-    def _serialize_chunk(self, chunk: DocumentChunk) -> Dict[str, Any]:
-        return {
-            'content': chunk.content,
-            'metadata': {
-                'file_name': chunk.metadata.file_name,
-                'file_version': chunk.metadata.file_version,
-                'file_date': chunk.metadata.file_date.isoformat(),
-                'section_number': chunk.metadata.section_number,
-                'section_heading': chunk.metadata.section_heading,
-                'document_id': chunk.metadata.document_id
-            },
-            'embedding': chunk.embedding
-        }
-
     def _reconstruct_chunk_from_dict(self, chunk_dict: Dict[str, Any]) -> DocumentChunk:
         metadata_dict = chunk_dict['metadata']
         if isinstance(metadata_dict, str):
@@ -78,107 +78,88 @@ class DocumentParser:
             return content, str(level), heading
         return chunk.strip(), "", ""
 
-    def parse_docx(self, docx_file: DocxDocument) -> List[DocumentChunk]:
+    def _docx_sections(self, document, data: bytes) -> List[Tuple[str, str, str]]:
+        """
+        (text, level, heading) sections of a DOCX, walked directly or via
+        mammoth as a fallback.
+        """
+        if self.docx_converter == "direct":
+            try:
+                return list(iter_docx_sections(document))
+            except UnsupportedDocx as e:
+                logger.info("Falling back to mammoth: %s", e)
+        markdown = mammoth_markdown(data)
+        return [self._process_heading(chunk) for chunk in split_markdown(markdown)
+                if chunk.strip()]
+
+    def parse_docx(
+        self, docx_file: DocxDocument, previous: Optional[List[DocumentChunk]] = None
+    ) -> List[DocumentChunk]:
         file_name = docx_file.name
-        docx_obj = DocxDocument(docx_file)
-        file_hash = self._hash_docx_metadata(docx_obj)
-        cache_prefix = f"cache/{file_hash}/"
+        identity = self.identity.identify(docx_file, "cache/{hash}/", name=file_name,
+                                          size=getattr(docx_file, "size", None),
+                                          tag=getattr(docx_file, "file_id", None))
+        file_hash = identity.content_hash
+        cache_prefix = identity.prefix
 
         chunks_key = cache_prefix + "chunks.json"
         markdown_key = cache_prefix + "converted.md"
         uploaded_key = cache_prefix + "uploaded.docx"
 
-        # Return from cache if exists
+        chunks_base = cache_prefix + "chunks"
+
+        # Return from cache if exists (binary format, then legacy JSON)
+        # a content hit may have been parsed under another name
+        cached = load_chunks(self.s3, self.bucket, chunks_base)
+        if cached is not None:
+            return with_file_name(cached, file_name)
         try:
             response = self.s3.get_object(Bucket=self.bucket, Key=chunks_key)
             chunk_dicts = json.load(response['Body'])
-            logger.info("Loaded chunks from S3: %s", chunks_key)
-            return [self._reconstruct_chunk_from_dict(chunk) for chunk in chunk_dicts]
-        except self.s3.exceptions.NoSuchKey:
+            logger.info("Loaded chunks from legacy JSON in S3: %s", chunks_key)
+            chunks = [self._reconstruct_chunk_from_dict(chunk) for chunk in chunk_dicts]
+            save_chunks(self.s3, self.bucket, chunks_base, chunks)
+            return with_file_name(chunks, file_name)
+        except missing_key_errors(self.s3):
             logger.info("No cached chunks found in S3 for hash: %s", file_hash)
 
-        # Save file to file_path for pandoc subprocess
-        local_docx_path = os.path.join(self.cache_root, f"{file_hash}_uploaded.docx")
-        docx_obj.save(local_docx_path)
-        
+        # the upload is held in memory once; nothing is written to local disk
+        data = source_bytes(docx_file)
         logger.info("Processing new document: %s", file_name)
-        self.s3.upload_file(local_docx_path, self.bucket, uploaded_key)
-        
-        # Load file again for fresh metadata
-        core_props = docx_obj.core_properties
-        file_date = core_props.modified or datetime.now()
+        self.s3.put_object(Bucket=self.bucket, Key=uploaded_key, Body=data)
 
-        # Convert DOCX to Markdown using pandoc
-        
-
-        with open(local_docx_path, "rb") as f:
-            html = mammoth.convert_to_html(f).value
+        document = DocxDocument(BytesIO(data))
+        file_date = document.core_properties.modified or datetime.now()
 
-        # use html2text for much cleaner markdown
-        converter = html2text.HTML2Text()
-        converter.body_width = 0       # no forced wraps
-        markdown = converter.handle(html)
+        raw_sections = self._docx_sections(document, data)
+        self.s3.put_object(Bucket=self.bucket, Key=markdown_key,
+                           Body=sections_markdown(raw_sections).encode("utf-8"))
 
-        # write out for inspection & cache
-        local_md_path = os.path.join(self.cache_root, f"{file_hash}_converted.md")
-        with open(local_md_path, "w", encoding="utf-8") as f:
-            f.write(markdown)
-            
-        self.s3.upload_file(local_md_path, self.bucket, markdown_key)
+        sections = number_sections(raw_sections)
+        logger.info("Split document into %d sections", len(sections))
 
-        pattern = r"(?=^#{1,3} .*)"  # Split on headings (up to ###)
-        raw_chunks = re.split(pattern, markdown, flags=re.MULTILINE)
-        logger.info("Split markdown into %d initial chunks", len(raw_chunks))
+        # embed changed sections in as few requests as the service allows
+        embeddings = embed_sections(self.embedding_service,
+                                    [(number, text) for text, number, _ in sections],
+                                    previous)
 
         chunks: List[DocumentChunk] = []
-        section_counter = {}
-        current_heading = ""
-
-        for chunk in raw_chunks:
-            if not chunk.strip():
-                continue
-
-            chunk_text, level_str, heading = self._process_heading(chunk)
-            
-            if level_str:  # This is a section with a heading
-                level = int(level_str)
-                if level not in section_counter:
-                    section_counter[level] = 1
-                else:
-                    section_counter[level] += 1
-                for k in list(section_counter.keys()):
-                    if k > level:
-                        del section_counter[k]
-                section_numbers = [str(section_counter[l]) for l in sorted(section_counter.keys()) if l <= level]
-                section_number = ".".join(section_numbers)
-                current_heading = heading
-            else:
-                section_number = ".".join(str(section_counter[l]) for l in sorted(section_counter.keys()))
-
-            estimated_tokens = len(chunk_text) // 4
-            logger.debug("Processing chunk with ~%d tokens from section %s: %s", 
-                        estimated_tokens, section_number, current_heading)
-            
-            embedding = self.embedding_service.embed_text(chunk_text)
+        rows = zip(sections, embeddings)
+        for (chunk_text, section_number, heading), embedding in rows:
             metadata = DocumentMetadata(
                 file_name=file_name,
                 file_version="v1",
                 file_date=file_date,
                 section_number=section_number,
-                section_heading=current_heading,
+                section_heading=heading,
                 document_id=file_hash,
             )
             chunks.append(DocumentChunk(content=chunk_text, metadata=metadata, embedding=embedding))
 
         logger.info("Successfully processed %d chunks with embeddings", len(chunks))
 
-        chunk_dicts = [self._serialize_chunk(chunk) for chunk in chunks]
-        self.s3.put_object(
-            Bucket=self.bucket,
-            Key=chunks_key,
-            Body=json.dumps(chunk_dicts, indent=2, default=str),
-            ContentType="application/json"
-        )
-        logger.info("Saved chunks to S3: %s", chunks_key)
+        save_chunks(self.s3, self.bucket, chunks_base, chunks)
+        logger.info("Saved chunks to S3: %s", chunks_base)
+        self.identity.register(identity, file_name)
 
         return chunks
@@ -1,52 +1,88 @@
+import json
 import os
 import re
-import json
-import hashlib
-from typing import List, Dict, Any, Tuple, Optional
+import shutil
 from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
-import mammoth
-import html2text            # pip install html2text
 from docx import Document as DocxDocument
 
-from pathlib import Path
-from marker.converters.pdf import PdfConverter
-from marker.models import create_model_dict
-
-from rag_pipeline import DocumentChunk, DocumentMetadata
-from logger import logger
+from cache_io import get_many
+from chunk_store import load_chunks, save_chunks, with_file_name
+from doc_identity import (
+    BLOCK_SIZE,
+    DocumentIdentity,
+    DocumentIdentityIndex,
+    source_bytes,
+)
+from docx_sections import (
+    UnsupportedDocx,
+    iter_docx_sections,
+    mammoth_markdown,
+    number_sections,
+    sections_markdown,
+    split_markdown,
+)
+from embedding_cache import CachedEmbeddingService, EmbeddingCache
 from log_time import log_time
+from logger import logger
+from marker_pool import MarkerConverterPool
+from page_cache import PageCache, page_hashes
+from pdf_sharding import ShardedPdfConverter
+from rag_pipeline import DocumentChunk, DocumentMetadata
+from revisions import embed_sections
 
 
 class DocumentParser:
-    def __init__(self, embedding_service, cache_service, bucket_name):
+    def __init__(self, embedding_service, cache_service, bucket_name,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 converter_pool: Optional[MarkerConverterPool] = None,
+                 sharded_converter: Optional[ShardedPdfConverter] = None,
+                 docx_converter: str = "direct"):
+        # shared, content-addressed embeddings survive document hash changes
+        if embedding_cache is not None:
+            embedding_service = CachedEmbeddingService(embedding_service,
+                                                       embedding_cache)
         self.embedding_service = embedding_service
+        self.embedding_cache = embedding_cache
         self.cache = cache_service
         self.bucket = bucket_name
+        # Marker models load on the first PDF and are reused for every later one
+        self._owns_converter_pool = converter_pool is None
+        self.converter_pool = converter_pool or MarkerConverterPool()
+        # when set, PDFs are converted page range by page range in worker processes
+        self.sharded_converter = sharded_converter
+        # Marker markdown per page content hash, shared by all PDFs in the bucket
+        self.page_cache = PageCache(cache_service, bucket_name)
+        # documents are identified by the SHA-256 of their bytes, not by name or
+        # properties
+        self.identity = DocumentIdentityIndex(cache_service, bucket_name)
+        # "direct": walk python-docx paragraphs, "mammoth": DOCX → HTML → markdown
+        self.docx_converter = docx_converter
 
         # cache root for all artifacts
         self.cache_root = "local_cache"
         os.makedirs(self.cache_root, exist_ok=True)
         logger.info("DocumentParser initialized with local cache bucket: %s", self.bucket)
 
-    def _hash_docx_metadata(self, doc: DocxDocument) -> str:
-        p = doc.core_properties
-        key_data = f"{p.title}-{p.modified}-{p.author}"
-        return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
-
-    def _serialize_chunk(self, chunk: DocumentChunk) -> Dict[str, Any]:
-        return {
-            "content": chunk.content,
-            "metadata": {
-                "file_name":      chunk.metadata.file_name,
-                "file_version":   chunk.metadata.file_version,
-                "file_date":      chunk.metadata.file_date.isoformat(),
-                "section_number": chunk.metadata.section_number,
-                "section_heading":chunk.metadata.section_heading,
-                "document_id":    chunk.metadata.document_id,
-            },
-            "embedding": chunk.embedding,
-        }
+    def close(self) -> None:
+        """Release the Marker models if this parser built its own converter pool."""
+        if self._owns_converter_pool:
+            self.converter_pool.teardown()
+
+    def _identify(self, source, default_prefix: str) -> DocumentIdentity:
+        """
+        Content identity of a path or upload; uploads are pre-checked by name,
+        size and file id.
+        """
+        if isinstance(source, (str, Path)):
+            return self.identity.identify(str(source), default_prefix)
+        return self.identity.identify(source, default_prefix,
+                                      name=getattr(source, "name", None),
+                                      size=getattr(source, "size", None),
+                                      tag=getattr(source, "file_id", None))
 
     def _reconstruct_chunk_from_dict(self, d: Dict[str, Any]) -> DocumentChunk:
         m = d["metadata"]
@@ -74,12 +110,16 @@ class DocumentParser:
             return body, str(lvl), heading
         return text.strip(), "", ""
 
-    def parse(self, file) -> List[DocumentChunk]:
+    def parse(
+        self, file, previous: Optional[List[DocumentChunk]] = None
+    ) -> List[DocumentChunk]:
         """
         Parses the uploaded file based on its type.
 
         Parameters:
         - file: UploadedFile (from Streamlit), a file-like object
+        - previous: chunks of the file's previous version, whose unchanged
+          sections are not embedded again
 
         Returns:
         - Result of parse_pdf() or parse_docx()
@@ -88,134 +128,102 @@ class DocumentParser:
         - ValueError: If the file type is unsupported
         """
         if file.name.endswith('.pdf'):
-            return self.parse_pdf(file)
+            return self.parse_pdf(file, previous)
         elif file.name.endswith('.docx'):
-            return self.parse_docx(file)
+            return self.parse_docx(file, previous)
         else:
             raise ValueError("Unsupported file type. Only PDF and DOCX files are supported.")
 
     @log_time("Parsing Docx or Loading Cached")
-    def parse_docx(self, docx_file) -> List[DocumentChunk]:
+    def parse_docx(
+        self, docx_file, previous: Optional[List[DocumentChunk]] = None
+    ) -> List[DocumentChunk]:
         # —————————————————————
         # 1) Hash & cache paths
         # —————————————————————
-        file_name = getattr(docx_file, "name", "uploaded.docx")
-        docx_obj  = DocxDocument(docx_file)
-        doc_hash  = self._hash_docx_metadata(docx_obj)
-        prefix    = f"cache/{doc_hash}/"
+        if isinstance(docx_file, (str, Path)):
+            file_name = os.path.basename(str(docx_file))
+        else:
+            file_name = getattr(docx_file, "name", "uploaded.docx")
+        identity  = self._identify(docx_file, "cache/{hash}/")
+        doc_hash  = identity.content_hash
+        prefix    = identity.prefix
         chunks_key, md_key, up_key = (
             prefix + "chunks.json",
             prefix + "converted.md",
             prefix + "uploaded.docx",
         )
 
+        chunks_base = prefix + "chunks"
+
         # —————————————————————
-        # 2) Try loading existing chunks
+        # 2) Try loading existing chunks (binary format, then legacy JSON)
         # —————————————————————
+        # a content hit may have been parsed under another name
+        cached = load_chunks(self.cache, self.bucket, chunks_base)
+        if cached is not None:
+            return with_file_name(cached, file_name)
+
         try:
             resp = self.cache.get_object(Bucket=self.bucket, Key=chunks_key)
             raw  = resp["Body"].read()
             if isinstance(raw, bytes):
                 raw = raw.decode("utf-8")
             chunk_dicts = json.loads(raw)
-            logger.info("Loaded %d chunks from cache", len(chunk_dicts))
-            return [self._reconstruct_chunk_from_dict(cd) for cd in chunk_dicts]
+            logger.info("Loaded %d chunks from legacy JSON cache", len(chunk_dicts))
+            chunks = [self._reconstruct_chunk_from_dict(cd) for cd in chunk_dicts]
+            save_chunks(self.cache, self.bucket, chunks_base, chunks)
+            return with_file_name(chunks, file_name)
 
         except FileNotFoundError:
             logger.info("No cached chunks for hash %s, re-parsing", doc_hash)
 
+        # the upload is held in memory once; the cache service decides what touches disk
+        data = source_bytes(docx_file)
+        logger.info("Processing new document: %s (%d bytes)", file_name, len(data))
+
         # —————————————————————
-        # 3) Save & “upload” the .docx itself
+        # 3) Cache the .docx itself
         # —————————————————————
-        local_docx = os.path.join(self.cache_root, f"{doc_hash}_uploaded.docx")
-        docx_obj.save(local_docx)
-        self.cache.upload_file(Filename=local_docx, Bucket=self.bucket, Key=up_key)
+        self.cache.put_object(Bucket=self.bucket, Key=up_key, Body=data)
 
+        document = DocxDocument(BytesIO(data))
         # fallback date
-        core = docx_obj.core_properties
-        file_date = core.modified or datetime.now()
+        file_date = document.core_properties.modified or datetime.now()
 
         # —————————————————————
-        # 4) Convert → clean Markdown
+        # 4) Convert → heading-delimited sections (+ Markdown for the cache)
         # —————————————————————
-        with open(local_docx, "rb") as f:
-            html = mammoth.convert_to_html(f).value
-
-        # use html2text for much cleaner markdown
-        converter = html2text.HTML2Text()
-        converter.body_width = 0       # no forced wraps
-        markdown = converter.handle(html)
-
-        # write out for inspection & cache
-        local_md = os.path.join(self.cache_root, f"{doc_hash}_converted.md")
-        with open(local_md, "w", encoding="utf-8") as f:
-            f.write(markdown)
-        self.cache.upload_file(Filename=local_md, Bucket=self.bucket, Key=md_key)
-        logger.info("Converted DOCX→HTML→Markdown and cached")
+        raw_sections = self._docx_sections(document, data)
+        self.cache.put_object(Bucket=self.bucket, Key=md_key,
+                              Body=sections_markdown(raw_sections).encode("utf-8"))
 
         # —————————————————————
         # 5) Chunk + embed with heading-based numbering
         # —————————————————————
-        pattern    = r"(?=^#{1,3} .*)"  # Split on headings (up to ###)
-        raw_chunks = re.split(pattern, markdown, flags=re.MULTILINE)
-        logger.info("Split markdown into %d initial chunks", len(raw_chunks))
+        sections = number_sections(raw_sections)
+        logger.info("Split DOCX into %d sections", len(sections))
 
-        chunks: List[DocumentChunk] = []
-        section_counter = {}
-        current_heading = ""
-
-        for chunk in raw_chunks:
-            if not chunk.strip():
-                continue
-
-            # extract the clean text, heading level, and heading text
-            chunk_text, level_str, heading = self._process_heading(chunk)
-
-            if level_str:
-                # this is a new heading
-                level = int(level_str)
-                # increment or initialize this level’s counter
-                section_counter[level] = section_counter.get(level, 0) + 1
-                # drop any deeper-level counters
-                for lvl in list(section_counter):
-                    if lvl > level:
-                        del section_counter[lvl]
-                # build section number from counters up to current level
-                section_numbers = [
-                    str(section_counter[l]) 
-                    for l in sorted(section_counter) 
-                    if l <= level
-                ]
-                section_number  = ".".join(section_numbers)
-                current_heading = heading
-            else:
-                # carry forward numbering if no new heading
-                section_number = ".".join(
-                    str(section_counter[l]) 
-                    for l in sorted(section_counter)
-                )
-
-            estimated_tokens = len(chunk_text) // 4
-            logger.debug(
-                "Processing chunk with ~%d tokens from section %s: %s",
-                estimated_tokens, section_number, current_heading
-            )
-
-            # get embedding (assuming your service has embed_text)
-            embedding = list(self.embedding_service.embed_text(chunk_text))
+        # embed changed sections in as few requests as the service allows
+        embeddings = embed_sections(self.embedding_service,
+                                    [(number, text) for text, number, _ in sections],
+                                    previous)
 
+        chunks: List[DocumentChunk] = []
+        rows = zip(sections, embeddings)
+        for (chunk_text, section_number, heading), embedding in rows:
             metadata = DocumentMetadata(
                 file_name       = file_name,
                 file_version    = "v1",
                 file_date       = file_date,
                 section_number  = section_number,
-                section_heading = current_heading,
+                section_heading = heading,
                 document_id     = doc_hash,
             )
             chunks.append(DocumentChunk(
                 content   = chunk_text,
                 metadata  = metadata,
-                embedding = embedding
+                embedding = list(embedding)
             ))
 
         logger.info("Successfully processed %d chunks with embeddings", len(chunks))
@@ -224,16 +232,25 @@ class DocumentParser:
         # —————————————————————
         # 6) Cache the new chunks
         # —————————————————————
-        ser = [self._serialize_chunk(c) for c in chunks]
-        local_json = os.path.join(self.cache_root, f"{doc_hash}_chunks.json")
-        with open(local_json, "w", encoding="utf-8") as f:
-            json.dump(ser, f, indent=2)
-
-        self.cache.upload_file(Filename=local_json, Bucket=self.bucket, Key=chunks_key)
-        logger.info("Stored %d chunks in cache %s", len(ser), chunks_key)
+        save_chunks(self.cache, self.bucket, chunks_base, chunks)
+        self.identity.register(identity, file_name)
 
         return chunks
 
+    def _docx_sections(self, document, data: bytes) -> List[Tuple[str, str, str]]:
+        """
+        (text, level, heading) sections of a DOCX, walked directly or via
+        mammoth as a fallback.
+        """
+        if self.docx_converter == "direct":
+            try:
+                return list(iter_docx_sections(document))
+            except UnsupportedDocx as e:
+                logger.info("Falling back to mammoth: %s", e)
+        markdown = mammoth_markdown(data)
+        return [self._process_heading(chunk) for chunk in split_markdown(markdown)
+                if chunk.strip()]
+
     @log_time("Pre-processing markdown")
     def preprocess_markdown(self, markdown_text: str) -> Tuple[str, str, str, datetime]:
         """
@@ -326,111 +343,119 @@ class DocumentParser:
         return processed_text, title, version, file_date
 
     @log_time("Parsing PDF or Loading Cached")
-    def parse_pdf(self, pdf_file) -> List[DocumentChunk]:
+    def parse_pdf(
+        self, pdf_file, previous: Optional[List[DocumentChunk]] = None
+    ) -> List[DocumentChunk]:
         if isinstance(pdf_file, (str, Path)):
-            file_path = str(pdf_file)
-            file_name = os.path.basename(file_path)
-            with open(file_path, 'rb') as f:
-                pdf_bytes = f.read()
+            file_name = os.path.basename(str(pdf_file))
         else:
             file_name = getattr(pdf_file, 'name', 'uploaded.pdf')
-            pdf_bytes = pdf_file.read()
 
-        # Compute hash & cache prefix
-        doc_hash = hashlib.md5(file_name.encode('utf-8')).hexdigest()[:8]
-        prefix = f"{doc_hash}_"
+        # Compute content hash & cache prefix (streamed, the PDF is never buffered)
+        identity = self._identify(pdf_file, "{hash}_")
+        doc_hash = identity.content_hash
+        prefix = identity.prefix
         up_key = prefix + 'uploaded.pdf'
         md_key = prefix + 'converted.md'
         chunk_key = prefix + 'chunks.json'
         embed_key = prefix + 'chunks_embedded.json'
 
+        # A cached document needs nothing but its final chunks, relabelled in case
+        # the same bytes were first uploaded under another name
+        cached = load_chunks(self.cache, self.bucket, prefix + 'chunks_embedded')
+        if cached is not None:
+            return with_file_name(cached, file_name)
+
         # Step 1: convert (PDF→MD→preprocess)
-        processed_md, title, version, file_date = self._convert(pdf_bytes,
-                                                              up_key, md_key)
-        # Step 2: chunk (MD→interim JSON with metadata)
+        processed_md, title, version, file_date, reconverted = self._convert(
+            pdf_file, up_key, md_key)
+        # Step 2: chunk (MD→interim JSON with metadata); a new revision bypasses
+        # the cached chunks
         chunk_dicts = self._chunk(processed_md, title, version,
-                                  file_date, chunk_key)
+                                  file_date, chunk_key, refresh=reconverted)
         # Step 3: embed (add embeddings → final JSON + return DocumentChunks)
         chunks = self._embed(chunk_dicts, file_name,
                              version, file_date, doc_hash,
-                             embed_key)
+                             embed_key, refresh=reconverted, previous=previous)
+        self.identity.register(identity, file_name)
         return chunks
 
     def _convert(self,
-                 pdf_bytes: bytes,
+                 pdf_source,
                  up_key: str,
                  md_key: str
-                 ) -> Tuple[str, str, str, datetime]:
+                 ) -> Tuple[str, str, str, datetime, bool]:
         """
-        Convert PDF bytes to preprocessed markdown, extracting metadata, with caching.
-        Returns: processed_md, title, version, file_date
+        Convert a PDF (path or binary stream) to preprocessed markdown, extracting
+        metadata, with caching. Marker output is cached per page, so a revised PDF
+        only has its changed pages reconverted.
+        Returns: processed_md, title, version, file_date, reconverted
         """
         # derive prefix and meta_key
         prefix = up_key.rsplit('_', 1)[0] + '_'
         meta_key = prefix + 'md_meta.json'
 
-        # if both markdown and meta are cached, load and return
-        if self._is_cached(md_key) and self._is_cached(meta_key):
-            # load processed markdown
-            resp_md = self.cache.get_object(Bucket=self.bucket, Key=md_key)
-            raw_md = resp_md['Body'].read()
-            processed_md = raw_md.decode('utf-8') if isinstance(raw_md, bytes) else raw_md
-            # load metadata
-            resp_meta = self.cache.get_object(Bucket=self.bucket, Key=meta_key)
-            meta_raw = resp_meta['Body'].read()
-            meta_d = json.loads(meta_raw.decode('utf-8') if isinstance(meta_raw, bytes) else meta_raw)
+        # the prefix is content-addressed: cached markdown and meta always match
+        # these bytes
+        cached = get_many(self.cache, self.bucket, [meta_key, md_key])
+        if len(cached) == 2:
+            meta_d = json.loads(cached[meta_key])
+            processed_md = cached[md_key].decode('utf-8')
             title = meta_d.get('title', '')
             version = meta_d.get('version', 'v1')
-            file_date = datetime.fromisoformat(meta_d.get('file_date', datetime.now().isoformat()))
-            return processed_md, title, version, file_date
+            file_date = datetime.fromisoformat(
+                meta_d.get('file_date', datetime.now().isoformat()))
+            return processed_md, title, version, file_date, False
 
-        # upload raw PDF if not already cached
+        # upload raw PDF; page content hashes let unchanged pages come from the
+        # page cache
         local_pdf = os.path.join(self.cache_root, f"{up_key.split('/')[-1]}")
-        if not self._is_cached(up_key):
-            with open(local_pdf, 'wb') as f:
-                f.write(pdf_bytes)
-            self.cache.upload_file(Filename=local_pdf, Bucket=self.bucket, Key=up_key)
+        self._copy_to_local(pdf_source, local_pdf)
+        hashes = page_hashes(local_pdf)
+        self.cache.upload_file(Filename=local_pdf, Bucket=self.bucket, Key=up_key)
 
-        # convert via Marker
-        converter = PdfConverter(artifact_dict=create_model_dict())
-        rendered = converter(local_pdf)
-        raw_md = rendered.markdown
+        # reuse cached pages, convert the rest via worker processes or a pooled
+        # Marker converter
+        converter = self.sharded_converter or self.converter_pool
+        raw_md = self.page_cache.assemble(
+            hashes, lambda pages: converter.convert_pages(local_pdf, pages))
 
         # preprocess & extract metadata
         processed_md, title, version, file_date = self.preprocess_markdown(raw_md)
         
         # cache processed markdown
         local_md = os.path.join(self.cache_root, f"{md_key.split('/')[-1]}")
-        if not self._is_cached(md_key):
-            with open(local_md, 'w', encoding='utf-8') as f:
-                f.write(processed_md)
-            self.cache.upload_file(Filename=local_md, Bucket=self.bucket, Key=md_key)
+        with open(local_md, 'w', encoding='utf-8') as f:
+            f.write(processed_md)
+        self.cache.upload_file(Filename=local_md, Bucket=self.bucket, Key=md_key)
 
         # cache markdown metadata
-        meta = {'title': title, 'version': version, 'file_date': file_date.isoformat()}
+        meta = {'title': title, 'version': version, 'file_date': file_date.isoformat(),
+                'page_hashes': hashes}
         local_meta = os.path.join(self.cache_root, f"{meta_key.split('/')[-1]}")
         with open(local_meta, 'w', encoding='utf-8') as f:
             json.dump(meta, f, indent=2)
         self.cache.upload_file(Filename=local_meta, Bucket=self.bucket, Key=meta_key)
 
-        return processed_md, title, version, file_date
+        return processed_md, title, version, file_date, True
 
     def _chunk(self,
                processed_md: str,
                title: str,
                version: str,
                file_date: datetime,
-               chunk_key: str
+               chunk_key: str,
+               refresh: bool = False
                ) -> List[Dict[str, Any]]:
         """
         Split preprocessed markdown into section dicts (no embeddings), caching JSON.
         Returns list of dicts with keys: content, metadata
         """
         # load from cache if exists
-        if self._is_cached(chunk_key):
-            resp = self.cache.get_object(Bucket=self.bucket, Key=chunk_key)
-            raw = resp['Body'].read().decode('utf-8')
-            return json.loads(raw)
+        if not refresh:
+            cached = get_many(self.cache, self.bucket, [chunk_key])
+            if chunk_key in cached:
+                return json.loads(cached[chunk_key])
 
         pattern = r'(?=^##\s+)'
         raw_chunks = re.split(pattern, processed_md, flags=re.MULTILINE)
@@ -482,23 +507,34 @@ class DocumentParser:
                version: str,
                file_date: datetime,
                doc_hash: str,
-               embed_key: str
+               embed_key: str,
+               refresh: bool = False,
+               previous: Optional[List[DocumentChunk]] = None
                ) -> List[DocumentChunk]:
         """
-        Take interim chunk dicts, generate embeddings, produce DocumentChunks, cache final JSON.
+        Take interim chunk dicts, generate embeddings, produce DocumentChunks and
+        cache them as an embedding matrix (.npy) with a JSON sidecar.
         """
-        # load from cache if final exists
-        if self._is_cached(embed_key):
-            resp = self.cache.get_object(Bucket=self.bucket, Key=embed_key)
-            raw = resp['Body'].read().decode('utf-8')
-            dicts = json.loads(raw)
-            return [self._reconstruct_chunk_from_dict(d) for d in dicts]
+        embed_base = embed_key[:-len('.json')]
+
+        # parse_pdf already looked for the binary format; migrate a legacy JSON cache
+        legacy = {} if refresh else get_many(self.cache, self.bucket, [embed_key])
+        if embed_key in legacy:
+            dicts = json.loads(legacy[embed_key])
+            chunks = [self._reconstruct_chunk_from_dict(d) for d in dicts]
+            save_chunks(self.cache, self.bucket, embed_base, chunks)
+            return with_file_name(chunks, file_name)
+
+        # embed changed sections in as few requests as the service allows
+        embeddings = embed_sections(self.embedding_service,
+                                    [(d['section_number'], d['content'])
+                                     for d in chunk_dicts],
+                                    previous)
 
         chunks: List[DocumentChunk] = []
-        for d in chunk_dicts:
+        for d, embedding in zip(chunk_dicts, embeddings):
             body = d['content']
-            # embed
-            embedding = list(self.embedding_service.embed_text(body))
+            embedding = list(embedding)
             # metadata
             metadata = DocumentMetadata(
                 file_name=file_name,
@@ -510,18 +546,15 @@ class DocumentParser:
             )
             chunks.append(DocumentChunk(content=body, metadata=metadata, embedding=embedding))
 
-        # cache final JSON
-        serialized = [self._serialize_chunk(c) for c in chunks]
-        local_json = os.path.join(self.cache_root, f"{embed_key.split('/')[-1]}")
-        with open(local_json, 'w', encoding='utf-8') as f:
-            json.dump(serialized, f, indent=2)
-        self.cache.upload_file(Filename=local_json, Bucket=self.bucket, Key=embed_key)
+        # cache final chunks
+        save_chunks(self.cache, self.bucket, embed_base, chunks)
         return chunks
 
-    def _is_cached(self, key: str) -> bool:
-        """Helper to check existence in cache service."""
-        try:
-            self.cache.get_object(Bucket=self.bucket, Key=key)
-            return True
-        except FileNotFoundError:
-            return False
+    def _copy_to_local(self, source, local_path: str) -> None:
+        """Copy a path or binary stream to local_path block by block."""
+        if isinstance(source, (str, Path)):
+            shutil.copyfile(source, local_path)
+            return
+        source.seek(0)
+        with open(local_path, 'wb') as f:
+            shutil.copyfileobj(source, f, BLOCK_SIZE)
@@ -0,0 +1,158 @@
+"""
+Multi-process PDF conversion with page-range sharding.
+
+The pages to convert (those missing from the page cache) are split into
+shards that Marker converts in parallel in a process pool. Each shard is
+converted with paginated output and split back into per-page markdown that
+carries its document-global [PAGE:N] marker.
+"""
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Dict, List, Optional, Tuple
+
+from logger import logger
+from page_cache import set_page_number, split_paginated
+
+# per worker process: Marker models, loaded by the first shard the worker converts
+_worker_models: Optional[Dict[str, Any]] = None
+
+
+def _peak_rss_mb() -> Optional[int]:
+    """Peak resident memory of this process, None where it cannot be read."""
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak // (1024 * 1024) if sys.platform == "darwin" else peak // 1024
+
+
+def _worker_converter(config: Dict[str, Any]):
+    global _worker_models
+    from marker.converters.pdf import PdfConverter
+    from marker.models import create_model_dict
+    if _worker_models is None:
+        _worker_models = create_model_dict()
+    return PdfConverter(artifact_dict=_worker_models, config=config)
+
+
+def _convert_page_list(pdf_path: str,
+                       pages: List[int]) -> Tuple[Dict[int, str], Optional[int]]:
+    """(page -> markdown, peak RSS of the worker in MB) for the given pages."""
+    converter = _worker_converter({"page_range": pages, "paginate_output": True})
+    by_page = split_paginated(converter(pdf_path).markdown, pages)
+    numbered = {page: set_page_number(md, page) for page, md in by_page.items()}
+    return numbered, _peak_rss_mb()
+
+
+def _available_memory_mb() -> Optional[int]:
+    try:
+        pages = os.sysconf("SC_AVPHYS_PAGES")
+        return pages * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class ShardedPdfConverter:
+    """
+    Converts PDF pages to markdown in a pool of worker processes, one shard of
+    pages per task.
+
+    All documents share the same pool, so several PDFs can be converted at once
+    without exceeding max_workers processes. The worker count is further capped
+    so that workers * memory_per_worker_mb fits in the memory available at pool
+    start; this only sizes the pool and does not limit the workers.
+
+    Workers are optionally recycled to reclaim memory: each is replaced after
+    max_tasks_per_child shards, and the whole pool is replaced (after its
+    running shards finish) once a worker's peak resident memory exceeds
+    max_worker_rss_mb.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, pages_per_shard: int = 40,
+                 memory_per_worker_mb: Optional[int] = 6144,
+                 max_tasks_per_child: Optional[int] = None,
+                 max_worker_rss_mb: Optional[int] = None):
+        if pages_per_shard < 1:
+            raise ValueError("pages_per_shard must be positive")
+        if max_tasks_per_child is not None and max_tasks_per_child < 1:
+            raise ValueError("max_tasks_per_child must be positive")
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pages_per_shard = pages_per_shard
+        self.memory_per_worker_mb = memory_per_worker_mb
+        self.max_tasks_per_child = max_tasks_per_child
+        self.max_worker_rss_mb = max_worker_rss_mb
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _workers(self) -> int:
+        workers = self.max_workers
+        available = _available_memory_mb()
+        if self.memory_per_worker_mb and available:
+            workers = min(workers, max(1, available // self.memory_per_worker_mb))
+        return workers
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                workers = self._workers()
+                # spawn: forking a process that holds torch state or threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=get_context("spawn"),
+                    max_tasks_per_child=self.max_tasks_per_child,
+                )
+                logger.info("Started PDF conversion pool with %d workers", workers)
+            return self._executor
+
+    def convert_pages(self, pdf_path: str, pages: List[int]) -> Dict[int, str]:
+        """
+        Convert only the given (0-based) pages, pages_per_shard per task;
+        returns page -> markdown.
+        """
+        pages = sorted(pages)
+        pool = self._pool()
+        step = self.pages_per_shard
+        futures = [pool.submit(_convert_page_list, pdf_path, pages[i:i + step])
+                   for i in range(0, len(pages), step)]
+        by_page: Dict[int, str] = {}
+        peak = 0
+        for f in futures:
+            shard, rss_mb = f.result()
+            by_page.update(shard)
+            peak = max(peak, rss_mb or 0)
+        if self.max_worker_rss_mb and peak > self.max_worker_rss_mb:
+            self._recycle(pool, peak)
+        return by_page
+
+    def _recycle(self, pool: ProcessPoolExecutor, peak_mb: int) -> None:
+        """Replace the pool on its next use; shards already submitted still finish."""
+        with self._lock:
+            if self._executor is not pool:
+                return  # already replaced by a concurrent conversion
+            self._executor = None
+        logger.info("PDF worker reached %d MB resident (limit %d MB), "
+                    "recycling the pool", peak_mb, self.max_worker_rss_mb)
+        pool.shutdown(wait=False)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+def build_sharded_converter(settings: Dict[str, Any]) -> Optional[ShardedPdfConverter]:
+    """
+    Build the converter selected by the `pdf_sharding` section of config.yaml.
+    Returns None when sharding is disabled (in-process Marker conversion).
+    """
+    settings = dict(settings or {})
+    settings.pop("concurrent_pdfs", None)
+    if not settings.pop("enabled", False):
+        return None
+    return ShardedPdfConverter(**settings)
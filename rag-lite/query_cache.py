@@ -0,0 +1,157 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from embedding_cache import embedding_model_name
+from logger import logger
+
+
+def normalize_query(text: str) -> str:
+    """Default query normalization: collapse whitespace and lowercase."""
+    return " ".join(text.split()).lower()
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe in-memory LRU map with an optional time-to-live
+    and hit/miss counters.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (value, stored_at)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def _expired(self, stored_at: float) -> bool:
+        return (self.ttl_seconds is not None
+                and time.time() - stored_at > self.ttl_seconds)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, stored_at: Optional[float] = None) -> None:
+        with self._lock:
+            if stored_at is None:
+                stored_at = time.time()
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def items(self) -> List[tuple]:
+        """Snapshot of (key, value, stored_at), least recently used first."""
+        with self._lock:
+            return [(k, v, t) for k, (v, t) in self._entries.items()]
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class QueryEmbeddingCache:
+    """
+    LRU cache of query embeddings keyed by (model name, normalized query text),
+    so repeated questions skip the embedding round trip.
+
+    With persist_path set, entries are loaded at construction and written back
+    on save() and at interpreter exit.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: Optional[float] = None,
+        normalize: Callable[[str], str] = normalize_query,
+        persist_path: Optional[str] = None,
+    ):
+        self._cache = LRUCache(max_entries, ttl_seconds)
+        self.normalize = normalize
+        self.persist_path = persist_path
+        if persist_path:
+            self.load()
+            atexit.register(self.save)
+
+    def get_or_embed(self, query_text: str, embedding_service) -> List[float]:
+        """Return the cached embedding for query_text, embedding it on a miss."""
+        key = (embedding_model_name(embedding_service), self.normalize(query_text))
+        embedding = self._cache.get(key)
+        if embedding is None:
+            embedding = list(embedding_service.embed_text(query_text))
+            self._cache.put(key, embedding)
+        else:
+            logger.info("Query embedding cache hit (hit rate %.0f%%)",
+                        100 * self._cache.stats()["hit_rate"])
+        return embedding
+
+    def stats(self) -> Dict[str, float]:
+        return self._cache.stats()
+
+    def save(self) -> None:
+        if not self.persist_path:
+            return
+        if os.path.dirname(self.persist_path):
+            os.makedirs(os.path.dirname(self.persist_path), exist_ok=True)
+        entries = [
+            {"model": model, "query": query, "embedding": embedding,
+             "stored_at": stored_at}
+            for (model, query), embedding, stored_at in self._cache.items()
+        ]
+        # written aside and renamed, so a crash never leaves a truncated file
+        tmp = f"{self.persist_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.persist_path)
+        logger.info("Saved %d query embeddings to %s", len(entries), self.persist_path)
+
+    def load(self) -> None:
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load query embedding cache %s: %s",
+                           self.persist_path, e)
+            return
+        for e in entries:  # least recently used first, so LRU order is preserved
+            if not self._cache._expired(e["stored_at"]):
+                self._cache.put((e["model"], e["query"]), e["embedding"],
+                                stored_at=e["stored_at"])
+        logger.info("Loaded %d query embeddings from %s",
+                    len(self._cache), self.persist_path)
@@ -1,10 +1,19 @@
-from dataclasses import dataclass
-from typing import List, Protocol, Optional, Dict
+import threading
+from dataclasses import dataclass, field
 from datetime import datetime
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
-from logger import logger
+from typing import Callable, Dict, List, Optional, Protocol, Union
+
+import numpy as np
+
+from lexical_index import BM25Index
 from log_time import log_time
+from logger import logger
+from query_cache import QueryEmbeddingCache
+from registry import registry
+from rerank_cache import RerankScoreCache
+from rerank_policy import RerankPolicy
+from reranker import RerankerConfig, build_reranker
+from vector_index import VectorIndex
 
 # === Data Classes ===
 
@@ -33,11 +42,19 @@ class DocumentMetadata:
 class DocumentChunk:
     content: str
     metadata: DocumentMetadata
-    embedding: List[float]
+    # ndarray: row of a cached matrix
+    embedding: Union[List[float], np.ndarray] = field(repr=False)
 
     def __post_init__(self):
         if not self.content.strip():
             raise ValueError("content cannot be empty")
+        if isinstance(self.embedding, np.ndarray):
+            # kept as a view (possibly memory-mapped) instead of copied into a list
+            if self.embedding.ndim != 1 or not self.embedding.size:
+                raise ValueError("embedding cannot be empty")
+            if not np.issubdtype(self.embedding.dtype, np.floating):
+                raise ValueError("embedding must contain only floats")
+            return
         if not self.embedding:
             raise ValueError("embedding cannot be empty")
         if not isinstance(self.embedding, list):
@@ -45,6 +62,13 @@ class DocumentChunk:
         if not all(isinstance(x, float) for x in self.embedding):
             raise ValueError("embedding must contain only floats")
 
+    def __eq__(self, other):
+        # the generated __eq__ would compare array embeddings elementwise
+        if not isinstance(other, DocumentChunk):
+            return NotImplemented
+        return (self.content == other.content and self.metadata == other.metadata
+                and np.array_equal(self.embedding, other.embedding))
+
 @dataclass(frozen=True)
 class Query:
     text: str
@@ -60,16 +84,40 @@ class Query:
         if not all(isinstance(x, float) for x in self.embedding):
             raise ValueError("embedding must contain only floats")
 
+RETRIEVAL_MODES = ("dense", "hybrid")
+FUSION_METHODS = ("rrf", "weighted")
+
 @dataclass(frozen=True)
 class RetrievalConfig:
     top_k: int
     similarity_threshold: float
+    mode: str = "dense"                 # dense: embeddings only, hybrid: plus BM25
+    fusion: str = "rrf"                 # hybrid: reciprocal-rank (rrf) or weighted
+    dense_weight: float = 1.0
+    lexical_weight: float = 1.0
+    rrf_k: int = 60                     # rrf: rank offset, larger flattens the curve
+    fusion_depth: int = 20              # hybrid: candidates per ranking before fusion
+    # hybrid: BM25 score that admits a chunk below the similarity threshold
+    min_lexical_score: Optional[float] = None
+    prefilter_k: Optional[int] = None   # densely score only the best BM25 matches
 
     def __post_init__(self):
         if self.top_k < 1:
             raise ValueError("top_k must be positive")
         if not 0 <= self.similarity_threshold <= 1:
             raise ValueError("similarity_threshold must be between 0 and 1")
+        if self.mode not in RETRIEVAL_MODES:
+            raise ValueError(f"mode must be one of {RETRIEVAL_MODES}")
+        if self.fusion not in FUSION_METHODS:
+            raise ValueError(f"fusion must be one of {FUSION_METHODS}")
+        if self.dense_weight < 0 or self.lexical_weight < 0:
+            raise ValueError("fusion weights must be non-negative")
+        if self.rrf_k < 0 or self.fusion_depth < 1:
+            raise ValueError("rrf_k must be non-negative and fusion_depth positive")
+        if self.min_lexical_score is not None and self.min_lexical_score <= 0:
+            raise ValueError("min_lexical_score must be positive")
+        if self.prefilter_k is not None and self.prefilter_k < self.top_k:
+            raise ValueError("prefilter_k must be at least top_k")
 
 @dataclass(frozen=True)
 class RetrievedChunk:
@@ -90,10 +138,20 @@ class EmbeddingService(Protocol):
     def embed_text(self, text: str) -> List[float]:
         ...
 
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        ...
+
 class SimilarityMetric(Protocol):
     def compute(self, a: List[float], b: List[float]) -> float:
         ...
 
+    def compute_batch(self, query: List[float], matrix: np.ndarray) -> np.ndarray:
+        """
+        Score the query against every row of an L2-normalized embedding matrix.
+        Returns one score per row.
+        """
+        ...
+
 class GenerationService(Protocol):
     def generate_response(self, augmented_prompt: str) -> str:
         ...
@@ -101,45 +159,357 @@ class GenerationService(Protocol):
 # === Core Corpus ===
 
 class Corpus:
-    """Repository for document chunks with duplicate prevention."""
-    
+    """
+    Repository for document chunks with duplicate prevention.
+
+    Alongside the chunks it keeps a float32 matrix of L2-normalized embeddings
+    (one row per chunk, in insertion order) for vectorized scoring. The matrix
+    is a list of blocks: read-only blocks adopted as they are (e.g. memory-mapped
+    snapshot segments, see add_block), then a contiguous tail that grows as
+    chunks are added.
+    Mutations hold `lock`, so one corpus can be shared by concurrent sessions;
+    readers that need a consistent view across several calls take it too.
+    """
+
+    _INITIAL_CAPACITY = 64
+
     def __init__(self):
         self._chunks: List[DocumentChunk] = []
-        self._chunk_ids: Dict[str, bool] = {}  # Using dict for O(1) lookup
+        self._chunk_ids: Dict[str, int] = {}  # chunk id -> row, for O(1) lookup
+        # read-only leading rows, adopted without copying
+        self._blocks: List[np.ndarray] = []
+        self._block_rows = 0
+        # growable tail: rows [:len(self) - _block_rows] are valid
+        self._matrix: Optional[np.ndarray] = None
+        self._index: Optional[VectorIndex] = None
+        self._lexical: Optional[BM25Index] = None
+        self._removal_listeners: List[Callable[[set], None]] = []
+        self.lock = threading.RLock()
 
     def _make_chunk_id(self, chunk: DocumentChunk) -> str:
         """Create a unique identifier for a chunk."""
         return f"{chunk.metadata.document_id}:{chunk.metadata.section_number}"
 
+    @property
+    def dimension(self) -> Optional[int]:
+        """Embedding dimension of the corpus, or None while it is empty."""
+        if self._blocks:
+            return self._blocks[0].shape[1]
+        return None if self._matrix is None else self._matrix.shape[1]
+
+    def _append_rows(self, rows: np.ndarray) -> None:
+        """Normalize rows and append them to the matrix, growing it geometrically."""
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        if not norms.all():
+            logger.warning("Adding %d zero-norm embeddings to corpus",
+                           int((norms == 0).sum()))
+        rows /= np.where(norms == 0, 1.0, norms)
+
+        count = len(self._chunks) - self._block_rows
+        needed = count + len(rows)
+        if self._matrix is None or needed > self._matrix.shape[0]:
+            capacity = max(self._INITIAL_CAPACITY, needed, 2 * count)
+            grown = np.empty((capacity, rows.shape[1]), dtype=np.float32)
+            if self._matrix is not None:
+                grown[:count] = self._matrix[:count]
+            self._matrix = grown
+        self._matrix[count:needed] = rows
+
     def add_chunk(self, chunk: DocumentChunk) -> bool:
         """
         Add a chunk to the corpus if it doesn't exist.
         Returns True if added, False if duplicate.
         """
-        chunk_id = self._make_chunk_id(chunk)
-        if chunk_id in self._chunk_ids:
-            logger.debug("Skipping duplicate chunk: %s", chunk_id)
-            return False
-        
-        self._chunk_ids[chunk_id] = True
-        self._chunks.append(chunk)
-        return True
+        return self.add_chunks([chunk]) == 1
 
     def add_chunks(self, chunks: List[DocumentChunk]) -> int:
         """
         Add multiple chunks to the corpus.
         Returns number of chunks actually added (excluding duplicates).
         """
-        return sum(1 for chunk in chunks if self.add_chunk(chunk))
+        with self.lock:
+            return self._add_chunks(chunks)
+
+    def _add_chunks(self, chunks: List[DocumentChunk]) -> int:
+        dim = self.dimension
+        added: List[DocumentChunk] = []
+        vectors: List[np.ndarray] = []
+        for chunk in chunks:
+            chunk_id = self._make_chunk_id(chunk)
+            if chunk_id in self._chunk_ids:
+                logger.debug("Skipping duplicate chunk: %s", chunk_id)
+                continue
+
+            vector = np.asarray(chunk.embedding, dtype=np.float32)
+            if dim is None:
+                dim = vector.shape[0]
+            elif vector.shape[0] != dim:
+                logger.error("Skipping chunk %s: embedding dimension %d does not "
+                             "match corpus dimension %d",
+                             chunk_id, vector.shape[0], dim)
+                continue
+
+            self._chunk_ids[chunk_id] = len(self._chunks) + len(added)
+            added.append(chunk)
+            vectors.append(vector)
+
+        if added:
+            self._append_rows(np.stack(vectors))
+            self._chunks.extend(added)
+            self._sync_index(len(self._chunks) - len(added))
+            if self._lexical is not None:
+                self._lexical.add([self._lexical_text(c) for c in added])
+        return len(added)
+
+    def add_block(self, chunks: List[DocumentChunk], matrix: np.ndarray) -> int:
+        """
+        Add chunks whose embeddings are the rows of matrix, adopting matrix as
+        a read-only block instead of copying it (a memory-mapped matrix stays
+        mapped). Falls back to add_chunks, which copies, unless every chunk is
+        new, the rows are L2-normalized and no chunk was added to the tail yet.
+        Returns number of chunks added.
+        """
+        with self.lock:
+            dim = self.dimension
+            ids = [self._make_chunk_id(c) for c in chunks]
+            adoptable = (
+                len(chunks) == len(matrix) and matrix.ndim == 2
+                and matrix.dtype == np.float32
+                and len(self._chunks) == self._block_rows
+                and (dim is None or matrix.shape[1] == dim)
+                and len(set(ids)) == len(ids)
+                and not any(i in self._chunk_ids for i in ids)
+                and np.allclose(np.einsum("ij,ij->i", matrix, matrix), 1.0, atol=1e-3)
+            )
+            if not adoptable:
+                return self._add_chunks(chunks)
+            if not len(chunks):
+                return 0
+            start = len(self._chunks)
+            self._blocks.append(matrix)
+            self._block_rows += len(chunks)
+            for offset, chunk_id in enumerate(ids):
+                self._chunk_ids[chunk_id] = start + offset
+            self._chunks.extend(chunks)
+            self._sync_index(start)
+            if self._lexical is not None:
+                self._lexical.add([self._lexical_text(c) for c in chunks])
+            logger.info("Adopted %d embedding rows without copying", len(chunks))
+            return len(chunks)
+
+    def _segments(self) -> List[np.ndarray]:
+        """The matrix blocks in row order, the valid part of the tail last."""
+        tail = len(self._chunks) - self._block_rows
+        return self._blocks + ([self._matrix[:tail]] if tail else [])
+
+    @staticmethod
+    def _lexical_text(chunk: DocumentChunk) -> str:
+        md = chunk.metadata
+        return f"{md.section_number} {md.section_heading}\n{chunk.content}"
+
+    @property
+    def lexical_index(self) -> Optional[BM25Index]:
+        return self._lexical
+
+    def attach_lexical_index(self, index: BM25Index) -> None:
+        """Index the corpus chunks in a BM25 index and keep it in sync from now on."""
+        with self.lock:
+            index.reset()
+            index.add([self._lexical_text(c) for c in self._chunks])
+            self._lexical = index
+
+    @property
+    def vector_index(self) -> Optional[VectorIndex]:
+        return self._index
+
+    def attach_index(self, index: VectorIndex) -> None:
+        """
+        Keep a vector index in sync with this corpus from now on.
+        Vectors the index already holds (e.g. restored from the cache) are reused
+        for the chunks with the same chunk id.
+        """
+        with self.lock:
+            self._index = index
+            self._sync_index(0)
+
+    def _sync_index(self, start: int) -> None:
+        """Add the rows from start on that the index does not hold yet."""
+        index = self._index
+        if index is None:
+            return
+        ids = {row: self._make_chunk_id(self._chunks[row])
+               for row in range(start, len(self._chunks))}
+        rows = [row for row, chunk_id in ids.items() if chunk_id not in index]
+        if rows:
+            index.add(self.get_embedding_rows(rows), [ids[row] for row in rows])
+
+    def prune_index(self) -> int:
+        """Drop index vectors of chunks that are not in the corpus; returns how many."""
+        with self.lock:
+            if self._index is None:
+                return 0
+            stale = [chunk_id for chunk_id in self._index.chunk_ids
+                     if chunk_id not in self._chunk_ids]
+            removed = self._index.remove(stale)
+            if removed:
+                logger.info("Pruned %d stale vectors from the index", removed)
+            return removed
+
+    def rows_of(self, chunk_ids: List[str]) -> np.ndarray:
+        """Corpus rows of the given chunk ids, -1 for ids not in the corpus."""
+        return np.asarray([self._chunk_ids.get(c, -1) for c in chunk_ids],
+                          dtype=np.int64)
+
+    def document_ids(self, file_name: Optional[str] = None) -> List[str]:
+        """Ids of the corpus documents in insertion order, optionally of one file."""
+        return list(dict.fromkeys(
+            c.metadata.document_id for c in self._chunks
+            if file_name is None or c.metadata.file_name == file_name
+        ))
+
+    def get_document_chunks(self, document_id: str) -> List[DocumentChunk]:
+        """Get the chunks of one document, in insertion order."""
+        return [c for c in self._chunks if c.metadata.document_id == document_id]
+
+    def add_removal_listener(self, listener: Callable[[set], None]) -> None:
+        """
+        Call listener(document_ids) whenever chunks of those documents are
+        removed or replaced.
+        """
+        with self.lock:
+            self._removal_listeners.append(listener)
+
+    def _notify_removed(self, document_ids: set) -> None:
+        for listener in self._removal_listeners:
+            listener(document_ids)
+
+    def _remove_documents(self, document_ids: set) -> int:
+        """
+        Drop the chunks of the given documents. The tail is compacted in place;
+        an adopted block only loses mapping if rows of its own are removed, in
+        which case its remaining rows are copied.
+        """
+        keep = np.array([c.metadata.document_id not in document_ids
+                         for c in self._chunks], dtype=bool)
+        removed = int(len(keep) - keep.sum())
+        if not removed:
+            return 0
+        blocks: List[np.ndarray] = []
+        start = 0
+        for block in self._blocks:
+            block_keep = keep[start:start + len(block)]
+            start += len(block)
+            if block_keep.all():
+                blocks.append(block)
+            elif block_keep.any():
+                compacted = block[block_keep]
+                compacted.flags.writeable = False
+                blocks.append(compacted)
+        self._blocks = blocks
+        self._block_rows = sum(len(b) for b in blocks)
+        tail_keep = keep[start:]
+        kept = int(tail_keep.sum())
+        if kept:
+            self._matrix[:kept] = self._matrix[:len(tail_keep)][tail_keep]
+        elif not self._blocks:
+            self._matrix = None
+        removed_ids = [self._make_chunk_id(c)
+                       for c, k in zip(self._chunks, keep) if not k]
+        self._chunks = [c for c, k in zip(self._chunks, keep) if k]
+        self._chunk_ids = {self._make_chunk_id(c): row
+                           for row, c in enumerate(self._chunks)}
+        if self._lexical is not None:
+            self._lexical.keep(keep)
+        # the index is keyed by chunk id: only the removed vectors are touched
+        if self._index is not None:
+            self._index.remove(removed_ids)
+        self._notify_removed(document_ids)
+        return removed
+
+    def remove_document(self, document_id: str) -> int:
+        """
+        Remove all chunks of a document.
+        Returns number of chunks removed.
+        """
+        with self.lock:
+            removed = self._remove_documents({document_id})
+            logger.info("Removed %d chunks of document %s", removed, document_id)
+            return removed
+
+    def replace_document(self, document_id: str, chunks: List[DocumentChunk]) -> int:
+        """
+        Atomically swap the chunks of a document for new ones, which may carry a
+        new document id. Returns number of chunks added.
+        """
+        with self.lock:
+            replaced = {document_id} | {c.metadata.document_id for c in chunks}
+            removed = self._remove_documents(replaced)
+            added = self._add_chunks(chunks)
+            logger.info("Replaced %d chunks of document %s with %d chunks",
+                        removed, document_id, added)
+            return added
 
     def get_all_chunks(self) -> List[DocumentChunk]:
         """Get all chunks in the corpus."""
         return self._chunks.copy()  # Return a copy to prevent modification
 
+    def get_chunk(self, row: int) -> DocumentChunk:
+        """Get the chunk stored at a given row of the embedding matrix."""
+        return self._chunks[row]
+
+    def get_embedding_matrix(self) -> np.ndarray:
+        """
+        Get a read-only (len(corpus), dimension) matrix of the normalized embeddings.
+        Row i belongs to the i-th chunk returned by get_all_chunks(). This is a
+        view while the rows are in one block, a copy otherwise; scoring should
+        go through get_embedding_blocks() instead.
+        """
+        segments = self._segments()
+        if not segments:
+            return np.empty((0, 0), dtype=np.float32)
+        matrix = segments[0] if len(segments) == 1 else np.concatenate(segments)
+        view = matrix.view()
+        view.flags.writeable = False
+        return view
+
+    def get_embedding_blocks(self) -> List[np.ndarray]:
+        """Read-only views of the embedding matrix blocks in row order, not copies."""
+        views = []
+        for segment in self._segments():
+            view = segment.view()
+            view.flags.writeable = False
+            views.append(view)
+        return views
+
+    def get_embedding_rows(self, rows) -> np.ndarray:
+        """Copy of the normalized embeddings of the given rows, in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        segments = self._segments()
+        if len(segments) == 1:
+            return segments[0][rows]
+        out = np.empty((len(rows), self.dimension or 0), dtype=np.float32)
+        start = 0
+        for segment in segments:
+            inside = (rows >= start) & (rows < start + len(segment))
+            out[inside] = segment[rows[inside] - start]
+            start += len(segment)
+        return out
+
     def clear(self) -> None:
         """Clear all chunks from the corpus."""
-        self._chunks.clear()
-        self._chunk_ids.clear()
+        with self.lock:
+            removed = {c.metadata.document_id for c in self._chunks}
+            self._chunks.clear()
+            self._chunk_ids.clear()
+            self._blocks = []
+            self._block_rows = 0
+            self._matrix = None
+            if self._index is not None:
+                self._index.reset()
+            if self._lexical is not None:
+                self._lexical.reset()
+            if removed:
+                self._notify_removed(removed)
 
     def __len__(self) -> int:
         return len(self._chunks)
@@ -162,27 +532,99 @@ class CosineSimilarity:
             
         return dot / (norm_a * norm_b)
 
+    def compute_batch(self, query: List[float], matrix: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of the query against every row of an L2-normalized matrix,
+        computed as a single matrix-vector product.
+        """
+        q = np.asarray(query, dtype=np.float32)
+        if q.shape[0] != matrix.shape[1]:
+            raise ValueError("Vectors must have same dimension")
+
+        norm_q = np.linalg.norm(q)
+        if norm_q == 0:
+            raise ValueError("Zero vectors are not allowed")
+
+        return matrix @ (q / norm_q)
+
 # === Retrieval ===
 
 class RetrievalService:
     """Service for retrieving relevant chunks based on query similarity."""
     
-    def __init__(self, corpus: Corpus, similarity_metric: SimilarityMetric, reranker_model_name: str = None):
+    def __init__(
+        self,
+        corpus: Corpus,
+        similarity_metric: SimilarityMetric,
+        reranker_model_name: str = None,
+        vector_index: Optional[VectorIndex] = None,
+        reranker_config: Optional[RerankerConfig] = None,
+        score_cache: Optional[RerankScoreCache] = None,
+        rerank_policy: Optional[RerankPolicy] = None,
+        lexical_index: Optional[BM25Index] = None,
+    ):
         if not isinstance(corpus, Corpus):
             raise ValueError("corpus must be an instance of Corpus")
             
         self.corpus = corpus
         self.similarity_metric = similarity_metric
         logger.info("Initialized RetrievalService")
+
+        # approximate search scores by inner product; the metric only drives exact
+        # search
+        self.vector_index = vector_index
+        if vector_index is not None:
+            corpus.attach_index(vector_index)
+            logger.info("Retrieval uses vector index: %s", type(vector_index).__name__)
+        # BM25 over the same rows, for hybrid mode and the lexical prefilter
+        if lexical_index is not None:
+            corpus.attach_lexical_index(lexical_index)
+            logger.info("Retrieval uses lexical index of %d chunks", len(lexical_index))
         
-        # initialize BGE reranker if requested
-        if reranker_model_name:
-            self.reranker_tokenizer = AutoTokenizer.from_pretrained(reranker_model_name)
-            self.reranker_model = AutoModelForSequenceClassification.from_pretrained(reranker_model_name)
-            logger.info(f"Loaded BGE re-ranker model: {reranker_model_name}")
-        else:
-            self.reranker_tokenizer = None
-            self.reranker_model = None
+        # BGE reranker is loaded on first use, sharing one copy per process
+        self.reranker_model_name = reranker_model_name
+        self.reranker_config = reranker_config or RerankerConfig()
+        self.reranker_tokenizer = None
+        self.reranker_model = None
+        self.reranker = None
+        self._reranker_lock = threading.Lock()  # concurrent first queries load once
+
+        # cross-encoder scores of (query, chunk) pairs, dropped when a document
+        # changes
+        self.score_cache = score_cache
+        if score_cache is not None:
+            corpus.add_removal_listener(score_cache.invalidate_documents)
+        # decides per query whether the dense ranking needs the cross-encoder
+        # (None: always rerank)
+        self.rerank_policy = rerank_policy
+
+    def _reranker_key(self):
+        return ("reranker", self.reranker_model_name, self.reranker_config.backend)
+
+    def _load_reranker(self) -> None:
+        if self.reranker is not None:
+            return
+        with self._reranker_lock:
+            if self.reranker is not None:
+                return
+            name = self.reranker_model_name
+            config = self.reranker_config
+            reranker = registry.acquire(self._reranker_key(),
+                                        lambda: build_reranker(name, config))
+            self.reranker_tokenizer = reranker.tokenizer
+            self.reranker_model = reranker.model
+            self.reranker = reranker
+            logger.info("Loaded BGE re-ranker model: %s (%s)",
+                        name, self.reranker_config.backend)
+
+    def close(self) -> None:
+        """Drop this service's reference to the shared reranker."""
+        with self._reranker_lock:
+            if self.reranker is not None:
+                registry.release(self._reranker_key())
+                self.reranker_tokenizer = None
+                self.reranker_model = None
+                self.reranker = None
 
     @log_time("rerank_with_bge")
     def rerank_with_bge(
@@ -194,74 +636,233 @@ class RetrievalService:
         """
         Re-rank retrieved chunks with BGE cross-encoder
         """
-        if not self.reranker_model:
+        if not self.reranker_model_name:
             logger.warning("BGE re-ranker is not configured, skipping reranking.")
             return retrieved_chunks
-        
-        pairs = [(query_text, rc.chunk.content) for rc in retrieved_chunks]
-        
-        inputs = self.reranker_tokenizer(
-            [q for q, c in pairs],
-            [c for q, c in pairs],
-            return_tensors="pt",
-            truncation=True,
-            padding=True
-        )
-        
-        with torch.no_grad():
-            outputs = self.reranker_model(**inputs)
-            scores = outputs.logits.squeeze(-1)
-        
-        # rank the retrieved chunks by BGE re-ranker scores
-        sorted_indices = torch.topk(scores, k=min(top_n, len(retrieved_chunks))).indices.tolist()
-        
-        sorted_indices = [x for x in sorted_indices if scores[x].item() > scores[sorted_indices[0]].item()*0.5]
-        
+        chunks = [rc.chunk for rc in retrieved_chunks]
+        model = f"{self.reranker_model_name}:{self.reranker_config.backend}"
+        if self.score_cache is not None:
+            cached = self.score_cache.lookup(model, query_text, chunks)
+        else:
+            cached = [None] * len(chunks)
+        missing = [i for i, score in enumerate(cached) if score is None]
+        scores = np.array([np.nan if score is None else score for score in cached],
+                          dtype=np.float32)
+
+        # candidates are in dense order; with a staged policy the best ones are
+        # scored first
+        stage = None
+        if self.rerank_policy is not None:
+            stage = self.rerank_policy.config.stage_size
+        stage = stage or max(1, len(missing))
+        computed = 0
+        for start in range(0, len(missing), stage):
+            scored = scores[~np.isnan(scores)]
+            # cached scores may already settle the winners
+            if (self.rerank_policy is not None and len(scored)
+                    and self.rerank_policy.should_stop(scored,
+                                                       min(top_n, len(chunks)))):
+                logger.info("Winners clear after %d of %d candidates, stopping early",
+                            len(scored), len(chunks))
+                break
+            part = missing[start:start + stage]
+            self._load_reranker()
+            # length-bucketed micro-batches; scores come back in candidate order
+            fresh = self.reranker.score(query_text, [chunks[i].content for i in part])
+            scores[part] = fresh
+            computed += len(part)
+            if self.score_cache is not None:
+                self.score_cache.store(model, query_text, [chunks[i] for i in part],
+                                       fresh)
+        logger.info("Rerank scores: %d cached, %d computed",
+                    len(chunks) - len(missing), computed)
+
+        # rank the retrieved chunks by BGE re-ranker scores; candidates left
+        # unscored drop out
+        sorted_indices = [i for i in np.argsort(-scores, kind="stable").tolist()
+                          if not np.isnan(scores[i])]
+        sorted_indices = sorted_indices[:min(top_n, len(retrieved_chunks))]
+
+        sorted_indices = [x for x in sorted_indices
+                          if scores[x] > scores[sorted_indices[0]]*0.5]
+
         reranked_chunks = [retrieved_chunks[i] for i in sorted_indices]
         
         for idx,rc in enumerate(reranked_chunks):
             logger.info("Re-ranked chunk from section %s with BGE score %.3f", 
-                        rc.chunk.metadata.section_number, scores[sorted_indices[idx]].item())
+                        rc.chunk.metadata.section_number, scores[sorted_indices[idx]])
         
         logger.info("Re-ranked chunks with BGE cross-encoder.")
         return reranked_chunks
 
+    def _score_corpus(self, query: Query,
+                      rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Score the query against every chunk in the corpus, or only the given rows.
+        Uses the metric's batch path when available, else falls back to
+        per-chunk compute.
+        """
+        compute_batch = getattr(self.similarity_metric, "compute_batch", None)
+        if compute_batch is not None:
+            if rows is not None:
+                matrix = self.corpus.get_embedding_rows(rows)
+                return np.asarray(compute_batch(query.embedding, matrix))
+            # block by block, so memory-mapped blocks are never concatenated
+            blocks = self.corpus.get_embedding_blocks()
+            if not blocks:
+                return np.empty(0, dtype=np.float32)
+            return np.concatenate([np.asarray(compute_batch(query.embedding, b))
+                                   for b in blocks])
+
+        if rows is None:
+            rows = np.arange(len(self.corpus))
+        scores = np.full(len(rows), -np.inf, dtype=np.float32)
+        for i, row in enumerate(rows):
+            try:
+                embedding = self.corpus.get_chunk(row).embedding
+                scores[i] = self.similarity_metric.compute(query.embedding, embedding)
+            except ValueError as e:
+                logger.error("Error computing similarity: %s", str(e))
+        return scores
+
+    def _dense_search(self, query: Query, k: int, candidates: Optional[np.ndarray]):
+        """(scores, rows) of dense matches: at least the best k, or every candidate."""
+        if candidates is not None:
+            return self._score_corpus(query, candidates), candidates
+        if self.vector_index is not None:
+            # vectors restored from the cache may not be in this corpus yet
+            missing = max(0, len(self.vector_index) - len(self.corpus))
+            scores, chunk_ids = self.vector_index.search(query.embedding, k + missing)
+            rows = self.corpus.rows_of(chunk_ids)
+            in_corpus = rows >= 0
+            return scores[in_corpus], rows[in_corpus]
+        scores = self._score_corpus(query)
+        return scores, np.arange(len(scores))
+
+    @staticmethod
+    def _top(scores: np.ndarray, rows: np.ndarray, k: int):
+        """Partial selection of the k best rows, best first."""
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            scores, rows = scores[top], rows[top]
+        order = np.argsort(-scores, kind="stable")
+        return scores[order], rows[order]
+
+    @staticmethod
+    def _fuse(dense_scores, dense_rows, lexical_scores, lexical_rows,
+              config: RetrievalConfig) -> np.ndarray:
+        """Rows of both rankings ordered by fused score, best first."""
+        fused: Dict[int, float] = {}
+        rankings = ((config.dense_weight, dense_scores, dense_rows),
+                    (config.lexical_weight, lexical_scores, lexical_rows))
+        if config.fusion == "rrf":
+            for weight, _, rows in rankings:
+                for rank, row in enumerate(rows.tolist()):
+                    score = weight / (config.rrf_k + rank + 1)
+                    fused[row] = fused.get(row, 0.0) + score
+        else:
+            # BM25 is unbounded: scale each ranking by its best score so the
+            # weights compare like with like
+            for weight, scores, rows in rankings:
+                if not len(rows):
+                    continue
+                scaled = np.maximum(scores, 0) / max(float(scores.max()), 1e-9)
+                for row, score in zip(rows.tolist(), scaled.tolist()):
+                    fused[row] = fused.get(row, 0.0) + weight * score
+        return np.asarray(sorted(fused, key=lambda row: (-fused[row], row)),
+                          dtype=np.int64)
+
     @log_time("retrieve_similar_chunks")
     def retrieve_similar_chunks(
         self, query: Query, config: RetrievalConfig
     ) -> List[RetrievedChunk]:
         """
         Retrieve chunks similar to the query based on the config.
-        Returns list of chunks sorted by similarity score.
+        Returns list of chunks sorted by similarity score, or by fused rank in
+        hybrid mode.
         """
-        results = []
-        all_chunks = self.corpus.get_all_chunks()
-        logger.info("Searching through %d chunks in corpus", len(all_chunks))
-        
-        for chunk in all_chunks:
+        logger.info("Searching through %d chunks in corpus", len(self.corpus))
+        if not len(self.corpus):
+            return []
+
+        # hold the corpus lock so rows, index and chunks stay consistent
+        with self.corpus.lock:
+            lexical = self.corpus.lexical_index
+            hybrid = config.mode == "hybrid" and lexical is not None
+            depth = max(config.top_k, config.fusion_depth) if hybrid else config.top_k
+
+            # cheap BM25 prefilter: only its best matches are scored densely
+            candidates = None
+            if config.prefilter_k and lexical is not None:
+                _, candidates = lexical.search(query.text, config.prefilter_k)
+                if len(candidates):
+                    logger.info("Lexical prefilter kept %d of %d chunks",
+                                len(candidates), len(self.corpus))
+                else:
+                    logger.info("No lexical match for the prefilter; "
+                                "scoring all chunks")
+                    candidates = None
+
             try:
-                score = self.similarity_metric.compute(query.embedding, chunk.embedding)
-                if score >= config.similarity_threshold:
-                    results.append(RetrievedChunk(chunk=chunk, similarity_score=score))
+                scores, rows = self._dense_search(query, depth, candidates)
             except ValueError as e:
                 logger.error("Error computing similarity: %s", str(e))
-                continue
-        
-        results.sort(key=lambda rc: rc.similarity_score, reverse=True)
-        if self.reranker_model:
-            results = results[:config.top_k]
-        else:
-            results = results[:config.top_k]
-        
+                return []
+            # float32 rounding can push a perfect match marginally above 1
+            scores = np.clip(scores, -1.0, 1.0)
+
+            # threshold as a mask, then partial selection of the top rows
+            keep = scores >= config.similarity_threshold
+            scores, rows = self._top(scores[keep], rows[keep], depth)
+
+            if hybrid:
+                lexical_scores, lexical_rows = lexical.search(query.text, depth)
+                if candidates is not None:
+                    in_candidates = np.isin(lexical_rows, candidates)
+                    lexical_scores = lexical_scores[in_candidates]
+                    lexical_rows = lexical_rows[in_candidates]
+                dense_count = len(rows)
+                fused = self._fuse(scores, rows, lexical_scores, lexical_rows, config)
+                # keep the dense similarity as the score; chunks only BM25 matched
+                # must still pass the threshold, unless their BM25 score reaches
+                # min_lexical_score
+                fused_scores = np.clip(self._score_corpus(query, fused), 0.0, 1.0)
+                admitted = fused_scores >= config.similarity_threshold
+                if config.min_lexical_score is not None:
+                    strong = lexical_rows[lexical_scores >= config.min_lexical_score]
+                    admitted |= np.isin(fused, strong)
+                rows = fused[admitted][:config.top_k]
+                scores = fused_scores[admitted][:config.top_k]
+                logger.info("Fused %s ranking of %d dense and %d lexical matches",
+                            config.fusion, dense_count, len(lexical_rows))
+
+            results = [
+                RetrievedChunk(chunk=self.corpus.get_chunk(row),
+                               similarity_score=float(score))
+                for score, row in zip(scores, rows)
+            ]
+
         logger.info("Retrieved %d chunks above similarity threshold %.2f", 
                    len(results), config.similarity_threshold)
         for rc in results:
             logger.info("Retrieved chunk from section %s with score %.3f", 
                         rc.chunk.metadata.section_number, rc.similarity_score)
         
-        # pass to reranker if configured
-        if self.reranker_model:
-            results = self.rerank_with_bge(query.text, results, top_n=config.top_k)
+        # pass to reranker if configured and the dense ranking is not decisive on
+        # its own
+        if self.reranker_model_name:
+            if self.rerank_policy is None:
+                results = self.rerank_with_bge(query.text, results, top_n=config.top_k)
+            else:
+                # the policy reads dense scores best first; hybrid results are in
+                # fused order
+                by_dense = sorted(results, key=lambda rc: -rc.similarity_score)
+                decision = self.rerank_policy.decide(
+                    [rc.similarity_score for rc in by_dense])
+                if decision.rerank:
+                    results = self.rerank_with_bge(query.text,
+                                                   by_dense[:decision.candidates],
+                                                   top_n=config.top_k)
         
         return results
 
@@ -317,7 +918,8 @@ class QueryProcessor:
         retrieval_service: RetrievalService,
         prompt_augmenter: PromptAugmenter,
         generation_service: GenerationService,
-        config: ProcessorConfig
+        config: ProcessorConfig,
+        query_cache: Optional[QueryEmbeddingCache] = None
     ):
         self.corpus = corpus
         self.embedding_service = embedding_service
@@ -325,6 +927,7 @@ class QueryProcessor:
         self.prompt_augmenter = prompt_augmenter
         self.generation_service = generation_service
         self.config = config
+        self.query_cache = query_cache
         logger.info("Initialized QueryProcessor with config: %s", config)
 
     def pre_gen_process(self, query_text: str) -> str:
@@ -336,7 +939,11 @@ class QueryProcessor:
             raise ValueError("Query text cannot be empty")
 
         logger.info("Processing query: %s", query_text)
-        query_embedding = self.embedding_service.embed_text(query_text)
+        if self.query_cache is not None:
+            query_embedding = self.query_cache.get_or_embed(query_text,
+                                                            self.embedding_service)
+        else:
+            query_embedding = self.embedding_service.embed_text(query_text)
         query = Query(text=query_text, embedding=query_embedding)
 
         retrieved_chunks = self.retrieval_service.retrieve_similar_chunks(
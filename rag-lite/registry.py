@@ -0,0 +1,152 @@
+import gc
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Hashable, List, Optional, TypeVar
+
+from logger import logger
+
+T = TypeVar("T")
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()  # serializes the (slow) factory call per key
+        self.value: Any = None
+        self.loaded = False
+        self.refcount = 0
+        self.dispose: Optional[Callable[[Any], None]] = None
+
+
+class ResourceRegistry:
+    """
+    Process-wide registry of shared, read-only resources such as models and corpora.
+
+    The first acquire() of a key builds the resource with its factory; later
+    acquires, from any thread or Streamlit session, get the same object. Each
+    acquire bumps a reference count that release() drops again. Resources stay
+    loaded at refcount zero until unload() is called explicitly, which calls the
+    resource's dispose callback, if one was given, before dropping it.
+
+    Owners such as Streamlit sessions acquire through a Lease, which releases
+    everything it acquired when it is released or garbage collected.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, _Entry] = {}
+
+    def acquire(self, key: Hashable, factory: Callable[[], T],
+                dispose: Optional[Callable[[T], None]] = None) -> T:
+        with self._lock:
+            entry = self._entries.setdefault(key, _Entry())
+            entry.refcount += 1
+            if entry.dispose is None:
+                entry.dispose = dispose
+
+        with entry.lock:
+            if not entry.loaded:
+                start = time.perf_counter()
+                try:
+                    entry.value = factory()
+                except Exception:
+                    with self._lock:
+                        entry.refcount -= 1
+                        if not entry.refcount and self._entries.get(key) is entry:
+                            del self._entries[key]
+                    raise
+                entry.loaded = True
+                logger.info("Loaded shared resource %s in %.1fs",
+                            key, time.perf_counter() - start)
+        return entry.value
+
+    def release(self, key: Hashable) -> int:
+        """Drop one reference to key. Returns the remaining reference count."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.refcount == 0:
+                logger.warning("Release of shared resource %s without a matching "
+                               "acquire", key)
+                return 0
+            entry.refcount -= 1
+            return entry.refcount
+
+    def unload(self, key: Hashable, force: bool = False) -> bool:
+        """
+        Remove a resource from the registry so it can be garbage collected.
+        Refuses while references are held, unless force is set.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if entry.refcount and not force:
+                logger.warning("Not unloading %s: still held by %d references",
+                               key, entry.refcount)
+                return False
+            del self._entries[key]
+        if entry.loaded and entry.dispose is not None:
+            try:
+                entry.dispose(entry.value)
+            except Exception as e:
+                logger.warning("Disposing shared resource %s failed: %s", key, e)
+        entry.value = None
+        gc.collect()
+        logger.info("Unloaded shared resource %s", key)
+        return True
+
+    def refcount(self, key: Hashable) -> int:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.refcount if entry else 0
+
+    def stats(self) -> Dict[Hashable, int]:
+        """Reference count of every registered resource."""
+        with self._lock:
+            return {key: entry.refcount for key, entry in self._entries.items()}
+
+    def lease(self) -> "Lease":
+        return Lease(self)
+
+
+def _release_all(registry: ResourceRegistry, keys: List[Hashable]) -> None:
+    while keys:
+        registry.release(keys.pop())
+
+
+class Lease:
+    """
+    References acquired on behalf of one owner, such as a Streamlit session.
+    release() drops all of them; so does garbage collection of the lease, which
+    happens when Streamlit discards the state of an ended session. Also usable
+    as a context manager.
+    """
+
+    def __init__(self, registry: ResourceRegistry):
+        self.registry = registry
+        self._keys: List[Hashable] = []
+        self._lock = threading.Lock()
+        # must not reference self, or the lease would never be collected
+        self._finalizer = weakref.finalize(self, _release_all, registry, self._keys)
+
+    def acquire(self, key: Hashable, factory: Callable[[], T],
+                dispose: Optional[Callable[[T], None]] = None) -> T:
+        value = self.registry.acquire(key, factory, dispose)
+        with self._lock:
+            self._keys.append(key)
+        return value
+
+    def release(self) -> None:
+        """Release every reference held by this lease (idempotent)."""
+        with self._lock:
+            self._finalizer()
+
+    def __enter__(self) -> "Lease":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+# Create default process-wide registry
+registry = ResourceRegistry()
@@ -0,0 +1,65 @@
+import hashlib
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from logger import logger
+from query_cache import LRUCache, normalize_query
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """
+    LRU cache of cross-encoder scores keyed by
+    (model, normalized query text, "document_id:section_number", chunk content hash),
+    so rephrased or repeated questions only send unseen pairs to the reranker.
+
+    Entries of a document are dropped when it is replaced or removed from the
+    corpus it is attached to (see Corpus.add_removal_listener).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        ttl_seconds: Optional[float] = None,
+        normalize: Callable[[str], str] = normalize_query,
+    ):
+        self._cache = LRUCache(max_entries, ttl_seconds)
+        self.normalize = normalize
+
+    def _keys(self, model: str, query_text: str, chunks: Sequence) -> List[tuple]:
+        query = self.normalize(query_text)
+        return [
+            (model, query, f"{c.metadata.document_id}:{c.metadata.section_number}",
+             _content_hash(c.content))
+            for c in chunks
+        ]
+
+    def lookup(self, model: str, query_text: str,
+               chunks: Sequence) -> List[Optional[float]]:
+        """Cached score of every chunk for query_text, None where there is none."""
+        return [self._cache.get(key) for key in self._keys(model, query_text, chunks)]
+
+    def store(self, model: str, query_text: str, chunks: Sequence,
+              scores: Iterable[float]) -> None:
+        for key, score in zip(self._keys(model, query_text, chunks), scores):
+            self._cache.put(key, float(score))
+
+    def invalidate_documents(self, document_ids: Iterable[str]) -> int:
+        """Drop the scores of chunks of the given documents; returns how many."""
+        document_ids = set(document_ids)
+        stale = [key for key, _, _ in self._cache.items()
+                 if key[2].split(":", 1)[0] in document_ids]
+        for key in stale:
+            self._cache.discard(key)
+        if stale:
+            logger.info("Dropped %d cached rerank scores of %d documents",
+                        len(stale), len(document_ids))
+        return len(stale)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, float]:
+        return self._cache.stats()
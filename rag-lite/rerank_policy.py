@@ -0,0 +1,116 @@
+"""
+When to run the cross-encoder.
+
+Dense retrieval often settles a query on its own. Examples: the best chunk
+scores far above the runner-up, or only one chunk passes the similarity
+threshold. RerankPolicy looks at the dense scores and decides whether to
+rerank at all and how many of the top candidates to send. While reranking
+runs in stages, it also decides whether the winners are already clear
+enough to stop. It counts how often each branch fires.
+"""
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from logger import logger
+
+# decision branches, as reported by RerankPolicy.stats()
+SKIP_TOO_FEW = "skip_too_few"
+SKIP_DECISIVE = "skip_decisive"
+RERANK_SHRUNK = "rerank_shrunk"
+RERANK_ALL = "rerank_all"
+EARLY_STOP = "early_stop"
+
+
+@dataclass(frozen=True)
+class RerankPolicyConfig:
+    adaptive: bool = True               # False: always rerank every candidate
+    min_candidates: int = 2             # fewer candidates than this: nothing to reorder
+    decisive_margin: float = 0.15       # top-1 lead over top-2 that skips the reranker
+    candidate_margin: float = 0.2       # rerank only candidates this close to the top
+    min_rerank: int = 2                 # ... but never fewer than this many
+    stage_size: Optional[int] = None    # candidates per rerank stage (None: all)
+    stop_score: Optional[float] = None  # stop once top_n reranker scores reach this
+
+    def __post_init__(self):
+        if self.min_candidates < 1 or self.min_rerank < 1:
+            raise ValueError("min_candidates and min_rerank must be positive")
+        if self.decisive_margin < 0 or self.candidate_margin < 0:
+            raise ValueError("margins must be non-negative")
+        if self.stage_size is not None and self.stage_size < 1:
+            raise ValueError("stage_size must be positive")
+
+
+@dataclass(frozen=True)
+class RerankDecision:
+    rerank: bool
+    candidates: int  # how many of the dense-ordered candidates to rerank
+    branch: str
+
+
+class RerankPolicy:
+    """Decides per query whether and how much to rerank; thread-safe branch counters."""
+
+    def __init__(self, config: Optional[RerankPolicyConfig] = None):
+        self.config = config or RerankPolicyConfig()
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, branch: str) -> None:
+        with self._lock:
+            self._counts[branch] += 1
+
+    def decide(self, dense_scores: Sequence[float]) -> RerankDecision:
+        """Decision for candidates with the given dense scores, best first."""
+        cfg = self.config
+        n = len(dense_scores)
+        if not cfg.adaptive:
+            decision = RerankDecision(True, n, RERANK_ALL)
+        elif n < cfg.min_candidates:
+            decision = RerankDecision(False, 0, SKIP_TOO_FEW)
+        elif dense_scores[0] - dense_scores[1] >= cfg.decisive_margin:
+            decision = RerankDecision(False, 0, SKIP_DECISIVE)
+        else:
+            close = sum(1 for s in dense_scores
+                        if dense_scores[0] - s <= cfg.candidate_margin)
+            keep = min(n, max(close, cfg.min_rerank))
+            branch = RERANK_SHRUNK if keep < n else RERANK_ALL
+            decision = RerankDecision(True, keep, branch)
+        self._count(decision.branch)
+        logger.info("Rerank policy: %s (%d of %d candidates), "
+                    "%.0f%% of queries skipped so far",
+                    decision.branch, decision.candidates, n,
+                    100 * self.stats()["skip_rate"])
+        return decision
+
+    def should_stop(self, scores: np.ndarray, top_n: int) -> bool:
+        """Whether the reranker scores so far already hold top_n clear winners."""
+        stop_score = self.config.stop_score
+        if stop_score is None or len(scores) < top_n:
+            return False
+        kth_best = -np.partition(-scores, top_n - 1)[top_n - 1]
+        if kth_best >= stop_score:
+            self._count(EARLY_STOP)
+            return True
+        return False
+
+    def stats(self) -> Dict[str, float]:
+        """Count of every branch, plus the share of queries that skipped reranking."""
+        with self._lock:
+            counts = dict(self._counts)
+        decided = sum(v for k, v in counts.items() if k != EARLY_STOP)
+        skipped = sum(v for k, v in counts.items() if k.startswith("skip_"))
+        skip_rate = skipped / decided if decided else 0.0
+        return {**counts, "queries": decided, "skip_rate": skip_rate}
+
+
+def build_rerank_policy(settings: Dict[str, Any]) -> Optional[RerankPolicy]:
+    """
+    Build the policy selected by the `rerank_policy` section of config.yaml.
+    Returns None when `adaptive` is off, so every query is fully reranked.
+    """
+    config = RerankPolicyConfig(**(settings or {}))
+    return RerankPolicy(config) if config.adaptive else None
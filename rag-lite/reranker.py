@@ -0,0 +1,207 @@
+"""
+Cross-encoder reranker scoring.
+
+(query, chunk) pairs are tokenized once without padding and sorted by token
+length. Fixed-size micro-batches are then taken in that order, so each batch
+is padded only to its own longest pair rather than to the longest chunk
+among all candidates. Scores are returned in the original candidate order.
+Compute therefore follows the real token count, and memory is bounded by
+batch_size x max_length.
+
+CPU backends, selected with RerankerConfig.backend:
+  torch       the fp32 transformers model
+  torch-int8  the same model with its Linear layers dynamically quantized to int8
+  onnx        the model exported to ONNX and run by ONNX Runtime
+  onnx-int8   the ONNX export with int8 dynamically quantized weights
+ONNX exports are written to onnx_dir once per model and reused afterwards.
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from logger import logger
+
+RERANKER_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+@dataclass(frozen=True)
+class RerankerConfig:
+    batch_size: int = 8                 # pairs per forward pass
+    max_length: int = 512               # tokens per (query, chunk) pair, truncated
+    num_threads: Optional[int] = None   # intra-op threads; None keeps the default
+    backend: str = "torch"              # see RERANKER_BACKENDS
+    onnx_dir: str = "local_cache/onnx"  # where ONNX exports are kept
+
+    def __post_init__(self):
+        if self.backend not in RERANKER_BACKENDS:
+            raise ValueError(f"backend must be one of {RERANKER_BACKENDS}")
+        if self.batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        if self.max_length < 8:
+            raise ValueError("max_length must be at least 8")
+        if self.num_threads is not None and self.num_threads < 1:
+            raise ValueError("num_threads must be positive")
+
+
+def load_bge_reranker(model_name: str):
+    """Load the (tokenizer, model) pair of a cross-encoder reranker."""
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    return tokenizer, model
+
+
+def length_buckets(lengths: List[int], batch_size: int) -> List[List[int]]:
+    """Indices grouped into batches of up to batch_size, shortest pairs first."""
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+class CrossEncoderScorer:
+    """Scores (query, text) pairs with a cross-encoder in micro-batches."""
+
+    tensor_type = "pt"  # what tokenizer.pad returns for the model
+
+    def __init__(self, tokenizer, model, config: Optional[RerankerConfig] = None):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.config = config or RerankerConfig()
+        if self.config.num_threads is not None:
+            self._set_threads(self.config.num_threads)
+
+    def _set_threads(self, num_threads: int) -> None:
+        import torch
+        # process-wide setting; every scorer in the process shares the CPU
+        torch.set_num_threads(num_threads)
+        logger.info("Reranker uses %d torch threads", num_threads)
+
+    def _encode(self, query: str, texts: List[str]):
+        """Unpadded token ids of every (query, text) pair, truncated to max_length."""
+        return self.tokenizer(
+            [query] * len(texts),
+            texts,
+            truncation=True,
+            max_length=self.config.max_length,
+        )
+
+    def _forward(self, batch) -> np.ndarray:
+        import torch
+        with torch.no_grad():
+            logits = self.model(**batch).logits
+        return logits.squeeze(-1).float().cpu().numpy()
+
+    def score(self, query: str, texts: List[str]) -> np.ndarray:
+        """Relevance score of every text for query, in the order of texts."""
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        encoded = self._encode(query, texts)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        scores = np.empty(len(texts), dtype=np.float32)
+        buckets = length_buckets(lengths, self.config.batch_size)
+        padded = 0
+        for batch in buckets:
+            features = [{key: encoded[key][i] for key in encoded.keys()} for i in batch]
+            padded_batch = self.tokenizer.pad(features, return_tensors=self.tensor_type)
+            scores[batch] = self._forward(padded_batch)
+            padded += max(lengths[i] for i in batch) * len(batch)
+        logger.info("Scored %d pairs in %d micro-batches: %d tokens, %d with padding",
+                    len(texts), len(buckets), sum(lengths), padded)
+        return scores
+
+
+class OnnxCrossEncoderScorer(CrossEncoderScorer):
+    """CrossEncoderScorer running an ONNX Runtime session instead of a torch model."""
+
+    tensor_type = "np"
+
+    def _set_threads(self, num_threads: int) -> None:
+        pass  # set on the session when it is created
+
+    def _forward(self, batch) -> np.ndarray:
+        inputs = {i.name: np.asarray(batch[i.name], dtype=np.int64)
+                  for i in self.model.get_inputs()}
+        logits = self.model.run(["logits"], inputs)[0]
+        return logits.reshape(len(logits), -1)[:, 0].astype(np.float32)
+
+
+# === Backends ===
+
+def quantize_int8(model):
+    """
+    Copy of a torch model whose Linear layers run with int8 weights and
+    dynamically quantized activations.
+    """
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear},
+                                                  dtype=torch.qint8)
+
+
+def export_onnx(tokenizer, model, path: str) -> None:
+    """Export a cross-encoder to ONNX with dynamic batch and sequence axes."""
+    import torch
+    sample = tokenizer(["query"], ["passage"], return_tensors="pt")
+    # positional order of the forward() arguments of BERT-style models
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids")
+             if n in sample]
+    axes = {n: {0: "batch", 1: "sequence"} for n in names}
+    axes["logits"] = {0: "batch"}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[n] for n in names), tmp,
+                          input_names=names, output_names=["logits"],
+                          dynamic_axes=axes, opset_version=17)
+    os.replace(tmp, path)
+
+
+def onnx_model_path(model_name: str, config: RerankerConfig) -> str:
+    """ONNX file of model_name for config.backend, exported on first use."""
+    folder = os.path.join(config.onnx_dir,
+                          re.sub(r"[^A-Za-z0-9._-]+", "--", model_name))
+    fp32 = os.path.join(folder, "model.onnx")
+    if not os.path.exists(fp32):
+        logger.info("Exporting reranker %s to ONNX at %s", model_name, fp32)
+        tokenizer, model = load_bge_reranker(model_name)
+        export_onnx(tokenizer, model, fp32)
+    if config.backend != "onnx-int8":
+        return fp32
+    int8 = os.path.join(folder, "model-int8.onnx")
+    if not os.path.exists(int8):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        logger.info("Quantizing ONNX reranker %s to int8", model_name)
+        tmp = f"{int8}.{os.getpid()}.tmp"
+        quantize_dynamic(fp32, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, int8)
+    return int8
+
+
+def onnx_session(path: str, num_threads: Optional[int] = None):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads is not None:
+        options.intra_op_num_threads = num_threads
+    return onnxruntime.InferenceSession(path, options,
+                                        providers=["CPUExecutionProvider"])
+
+
+def build_reranker(model_name: str,
+                   config: Optional[RerankerConfig] = None) -> CrossEncoderScorer:
+    """Scorer for model_name on the backend chosen in config."""
+    config = config or RerankerConfig()
+    if config.backend in ("onnx", "onnx-int8"):
+        from transformers import AutoTokenizer
+        path = onnx_model_path(model_name, config)
+        scorer = OnnxCrossEncoderScorer(AutoTokenizer.from_pretrained(model_name),
+                                        onnx_session(path, config.num_threads), config)
+    else:
+        tokenizer, model = load_bge_reranker(model_name)
+        if config.backend == "torch-int8":
+            model = quantize_int8(model)
+        scorer = CrossEncoderScorer(tokenizer, model, config)
+    logger.info("Loaded reranker %s on the %s backend", model_name, config.backend)
+    return scorer
@@ -0,0 +1,134 @@
+"""
+Section-level updates for revised documents.
+
+A new revision of a file is diffed against the version already in the corpus by
+section number and content hash. Only sections whose text changed are embedded
+again, and the old chunks are swapped for the new ones in one step.
+"""
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from logger import logger
+from rag_pipeline import Corpus, DocumentChunk
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class SectionDiff:
+    """Section numbers of a revision, classified against the previous version."""
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.changed or self.removed)
+
+
+def diff_sections(previous: List[DocumentChunk],
+                  sections: Sequence[Tuple[str, str]]) -> SectionDiff:
+    """Diff (section_number, text) pairs against the chunks of the previous version."""
+    old = {c.metadata.section_number: content_hash(c.content) for c in previous}
+    diff = SectionDiff()
+    for number, text in sections:
+        if number not in old:
+            diff.added.append(number)
+        elif old[number] != content_hash(text):
+            diff.changed.append(number)
+        else:
+            diff.unchanged.append(number)
+    current = {number for number, _ in sections}
+    diff.removed.extend(n for n in old if n not in current)
+    return diff
+
+
+def carry_over_embeddings(
+    previous: List[DocumentChunk], sections: Sequence[Tuple[str, str]]
+) -> List[Optional[List[float]]]:
+    """
+    Embedding of the previous version for every (section_number, text) whose text
+    is unchanged, None for sections that need embedding. Text that only moved to
+    another section number is reused as well.
+    """
+    by_section: Dict[Tuple[str, str], List[float]] = {}
+    by_content: Dict[str, List[float]] = {}
+    for c in previous:
+        h = content_hash(c.content)
+        # cached chunks may hold float32 matrix rows; new chunks take plain floats
+        embedding = np.asarray(c.embedding, dtype=np.float64).tolist()
+        by_section[(c.metadata.section_number, h)] = embedding
+        by_content.setdefault(h, embedding)
+    reused: List[Optional[List[float]]] = []
+    for number, text in sections:
+        h = content_hash(text)
+        reused.append(by_section.get((number, h), by_content.get(h)))
+    return reused
+
+
+def embed_sections(embedding_service, sections: Sequence[Tuple[str, str]],
+                   previous: Optional[List[DocumentChunk]] = None) -> List[List[float]]:
+    """
+    Embeddings for (section_number, text) pairs, embedding only text the
+    previous version lacks.
+    """
+    embeddings = carry_over_embeddings(previous or [], sections)
+    todo = [i for i, e in enumerate(embeddings) if e is None]
+    if previous:
+        logger.info("Reusing %d of %d section embeddings from the previous revision",
+                    len(sections) - len(todo), len(sections))
+    fresh = []
+    if todo:
+        fresh = embedding_service.embed_texts([sections[i][1] for i in todo])
+    for i, embedding in zip(todo, fresh):
+        embeddings[i] = list(embedding)
+    return embeddings
+
+
+def previous_version(corpus: Corpus,
+                     file_name: str) -> Tuple[List[str], List[DocumentChunk]]:
+    """
+    ([document id], chunks) of the most recently added document named file_name,
+    or ([], []) if there is none. Document ids are content hashes, so a name is
+    the only link between revisions. It can be shared by unrelated documents,
+    so only the latest one is treated as the previous version and diffed.
+    """
+    with corpus.lock:
+        document_ids = corpus.document_ids(file_name=file_name)
+        if not document_ids:
+            return [], []
+        latest = document_ids[-1]
+        return [latest], corpus.get_document_chunks(latest)
+
+
+def apply_revision(corpus: Corpus, previous_ids: List[str],
+                   previous: List[DocumentChunk], chunks: List[DocumentChunk],
+                   snapshot=None, vector_index=None) -> SectionDiff:
+    """
+    Replace the previous version of a document with its new chunks in the corpus,
+    its vector index and, if given, the corpus snapshot. Nothing is touched when
+    the revision has the same sections and document ids as the previous version.
+    """
+    diff = diff_sections(previous,
+                         [(c.metadata.section_number, c.content) for c in chunks])
+    new_ids = list(dict.fromkeys(c.metadata.document_id for c in chunks))
+    if diff.is_empty and set(new_ids) == set(previous_ids):
+        logger.info("Revision of %s is unchanged", previous_ids)
+        return diff
+
+    with corpus.lock:
+        for document_id in previous_ids[1:]:
+            corpus.remove_document(document_id)
+        corpus.replace_document(previous_ids[0], chunks)
+    if snapshot is not None:
+        snapshot.replace(previous_ids, chunks, vector_index)
+    logger.info("Applied revision: %d added, %d changed, %d removed, "
+                "%d unchanged sections", len(diff.added), len(diff.changed),
+                len(diff.removed), len(diff.unchanged))
+    return diff
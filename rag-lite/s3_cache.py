@@ -0,0 +1,218 @@
+"""
+S3 cache service.
+
+Implements the LocalCacheService interface (get_object, head_object, exists,
+get_many, put_object, upload_file, download_file, upload_fileobj) on top of an
+S3 client, so the parsers, the chunk store and the corpus snapshot work the
+same against either. Absent keys raise FileNotFoundError, as locally.
+
+- The client keeps up to max_pool_connections connections alive, so that
+  concurrent get_many reads and multipart transfers do not queue for one.
+- Requests are retried in botocore's standard (or adaptive) retry mode, which
+  backs off exponentially with full jitter. Each part of a multipart transfer
+  is retried on its own.
+- Objects above multipart_threshold_mb are uploaded in parts and downloaded
+  with parallel ranged GETs of multipart_chunksize_mb each.
+
+Pass client= to run against a stand-in (e.g. a moto mock or a local S3 server).
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Optional
+
+from cache_io import is_not_found_error
+from logger import logger
+
+MB = 1 << 20
+
+
+@contextmanager
+def _not_found_as_file_error(bucket: str, key: str):
+    try:
+        yield
+    except Exception as e:
+        if is_not_found_error(e):
+            raise FileNotFoundError(f"{bucket}/{key} not found in S3") from None
+        raise
+
+
+def _body_bytes(Body) -> bytes:
+    # same Body handling as LocalCacheService.put_object
+    if hasattr(Body, "read"):
+        return Body.read()
+    if isinstance(Body, str):
+        return Body.encode()
+    if isinstance(Body, (bytes, bytearray)):
+        return bytes(Body)
+    return json.dumps(Body).encode()
+
+
+class S3CacheService:
+    """S3 client wrapper with the LocalCacheService interface; see the module doc."""
+
+    def __init__(self, client=None, region_name: Optional[str] = None,
+                 aws_access_key_id: Optional[str] = None,
+                 aws_secret_access_key: Optional[str] = None,
+                 endpoint_url: Optional[str] = None,
+                 max_pool_connections: int = 32,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 60.0,
+                 max_attempts: int = 5,
+                 retry_mode: str = "standard",
+                 multipart_threshold_mb: int = 16,
+                 multipart_chunksize_mb: int = 8,
+                 max_concurrency: int = 8,
+                 get_many_workers: int = 16):
+        from boto3.s3.transfer import TransferConfig
+
+        if client is None:
+            import boto3
+            from botocore.config import Config
+
+            client = boto3.client(
+                "s3",
+                region_name=region_name,
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+                endpoint_url=endpoint_url,
+                config=Config(
+                    max_pool_connections=max_pool_connections,
+                    connect_timeout=connect_timeout,
+                    read_timeout=read_timeout,
+                    retries={"mode": retry_mode, "total_max_attempts": max_attempts},
+                ),
+            )
+        self.client = client
+        self.multipart_threshold = multipart_threshold_mb * MB
+        self.chunk_size = multipart_chunksize_mb * MB
+        self.max_concurrency = max_concurrency
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.chunk_size,
+            max_concurrency=max_concurrency,
+            use_threads=max_concurrency > 1,
+        )
+        self.get_many_workers = get_many_workers
+        self._readers: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        logger.info("S3CacheService: %d pooled connections, multipart above %d MB, "
+                    "%d-way transfers",
+                    max_pool_connections, multipart_threshold_mb, max_concurrency)
+
+    def _reader_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._readers is None:
+                self._readers = ThreadPoolExecutor(max_workers=self.get_many_workers,
+                                                   thread_name_prefix="s3-read")
+            return self._readers
+
+    def close(self) -> None:
+        with self._lock:
+            if self._readers is not None:
+                self._readers.shutdown(wait=True)
+                self._readers = None
+
+    # === Reads ===
+
+    def _read(self, Bucket, Key) -> bytes:
+        """
+        Object contents. The first GET asks for up to multipart_threshold bytes;
+        anything past that is fetched as parallel ranged GETs.
+        """
+        with _not_found_as_file_error(Bucket, Key):
+            try:
+                first_range = f"bytes=0-{self.multipart_threshold - 1}"
+                first = self.client.get_object(Bucket=Bucket, Key=Key,
+                                               Range=first_range)
+            except Exception as e:
+                # zero-byte objects cannot be ranged
+                code = getattr(e, "response", {}).get("Error", {}).get("Code")
+                if code != "InvalidRange":
+                    raise
+                return self.client.get_object(Bucket=Bucket, Key=Key)["Body"].read()
+            head = first["Body"].read()
+            content_range = first.get("ContentRange")
+            total = int(content_range.rsplit("/", 1)[1]) if content_range else len(head)
+            if total <= len(head):
+                return head
+
+            ranges = [(start, min(start + self.chunk_size, total) - 1)
+                      for start in range(len(head), total, self.chunk_size)]
+            etag = first.get("ETag")
+
+            def fetch(byte_range):
+                # fail rather than mix two versions of the object
+                kwargs = {"IfMatch": etag} if etag else {}
+                part = self.client.get_object(Bucket=Bucket, Key=Key,
+                                              Range="bytes=%d-%d" % byte_range,
+                                              **kwargs)
+                return part["Body"].read()
+
+            workers = min(self.max_concurrency, len(ranges))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(fetch, ranges))
+        return b"".join([head, *parts])
+
+    def get_object(self, Bucket, Key):
+        data = self._read(Bucket, Key)
+        return {"Body": BytesIO(data), "ContentLength": len(data)}
+
+    def head_object(self, Bucket, Key):
+        """Object metadata without reading it; raises FileNotFoundError if absent."""
+        with _not_found_as_file_error(Bucket, Key):
+            response = self.client.head_object(Bucket=Bucket, Key=Key)
+        return {
+            "ContentLength": response["ContentLength"],
+            "LastModified": response["LastModified"],
+            "ETag": response["ETag"],
+        }
+
+    def exists(self, Bucket, Key):
+        try:
+            self.head_object(Bucket, Key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get_many(self, Bucket, Keys):
+        """
+        Contents of every present key as {key: bytes}; absent keys are left out.
+        Keys are read concurrently.
+        """
+        def fetch(key):
+            try:
+                return key, self._read(Bucket, key)
+            except FileNotFoundError:
+                return key, None
+
+        keys = list(dict.fromkeys(Keys))
+        if len(keys) <= 1:
+            results = [fetch(key) for key in keys]
+        else:
+            results = list(self._reader_pool().map(fetch, keys))
+        return {key: data for key, data in results if data is not None}
+
+    def download_file(self, Bucket, Key, Filename):
+        with _not_found_as_file_error(Bucket, Key):
+            self.client.download_file(Bucket, Key, Filename,
+                                      Config=self.transfer_config)
+
+    # === Writes ===
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        data = _body_bytes(Body)
+        if len(data) > self.multipart_threshold:
+            self.client.upload_fileobj(BytesIO(data), Bucket, Key,
+                                       Config=self.transfer_config,
+                                       ExtraArgs=kwargs or None)
+        else:
+            self.client.put_object(Bucket=Bucket, Key=Key, Body=data, **kwargs)
+
+    def upload_file(self, Filename, Bucket, Key):
+        self.client.upload_file(Filename, Bucket, Key, Config=self.transfer_config)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key):
+        self.client.upload_fileobj(Fileobj, Bucket, Key, Config=self.transfer_config)
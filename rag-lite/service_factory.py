@@ -0,0 +1,38 @@
+import importlib
+from typing import Any, Dict, Tuple
+
+from logger import logger
+
+# provider -> (module, class); modules are imported only when a service is built,
+# so an OpenAI-only deployment never loads the Ollama or transformers stacks
+EMBEDDING_PROVIDERS: Dict[str, Tuple[str, str]] = {
+    "openai": ("openai_services", "OpenAIEmbeddingService"),
+    "ollama": ("ollama_services", "OllamaEmbeddingService"),
+    "local":  ("local_services", "LocalEmbeddingService"),
+}
+
+GENERATION_PROVIDERS: Dict[str, Tuple[str, str]] = {
+    "openai": ("openai_services", "OpenAIGenerationService"),
+    "ollama": ("ollama_services", "OllamaGenerationService"),
+    "local":  ("local_services", "LocalGenerationService"),
+}
+
+
+def _build(providers: Dict[str, Tuple[str, str]], provider: str, **kwargs: Any):
+    if provider not in providers:
+        raise ValueError(
+            f"Unknown provider '{provider}', expected one of {tuple(providers)}")
+    module_name, class_name = providers[provider]
+    cls = getattr(importlib.import_module(module_name), class_name)
+    logger.info("Building %s from %s", class_name, module_name)
+    return cls(**kwargs)
+
+
+def build_embedding_service(provider: str, **kwargs: Any):
+    """Build the embedding service of a provider; kwargs go to its constructor."""
+    return _build(EMBEDDING_PROVIDERS, provider, **kwargs)
+
+
+def build_generation_service(provider: str, **kwargs: Any):
+    """Build the generation service of a provider; kwargs go to its constructor."""
+    return _build(GENERATION_PROVIDERS, provider, **kwargs)
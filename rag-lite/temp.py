@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
-import os
-import io
 import json
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 
-# Adjust this import to wherever your parser lives:
-from parser_local import DocumentParser
-from ollama_services import OllamaEmbeddingService, LocalCacheService 
-from openai_services import OpenAIEmbeddingService
+from dotenv import load_dotenv
+
+from chunk_store import load_chunks, metadata_to_dict
+from embedding_cache import EmbeddingCache
+from embedding_executor import ConcurrentEmbeddingExecutor
 from helpers import load_config
 from log_time import ProcessTimer
-from dotenv import load_dotenv
+from marker_pool import MarkerConverterPool
+from ollama_services import LocalCacheService
+from openai_services import OpenAIEmbeddingService
+
+# Adjust this import to wherever your parser lives:
+from parser_local import DocumentParser
+from pdf_sharding import build_sharded_converter
+from write_behind import WriteBehindUploader
 
 pt = ProcessTimer()
 load_dotenv()
@@ -21,47 +29,80 @@ api_key = os.environ["OPENAI_API_KEY"]
 
 def main():
     logging.basicConfig(level=logging.INFO)
-    embed_service = OpenAIEmbeddingService(api_key) # OllamaEmbeddingService(load_config('embedding_model'))
+    embed_service = ConcurrentEmbeddingExecutor(
+        # or OllamaEmbeddingService(load_config('embedding_model'))
+        OpenAIEmbeddingService(api_key, max_retries=0),  # the executor retries
+        **load_config('embedding_executor', {}),
+    )
     cache_service = LocalCacheService()
+    uploader = WriteBehindUploader(cache_service, **load_config('write_behind', {}))
+    converter_pool = MarkerConverterPool(**load_config('marker_pool', {}))
+    sharding = load_config('pdf_sharding', {})
+    sharded_converter = build_sharded_converter(sharding)
+    if sharded_converter is None:
+        pt.mark("Marker warmup")
+        converter_pool.warmup()
+        pt.done("Marker warmup")
     parser = DocumentParser(
         embedding_service=embed_service,
-        cache_service=cache_service,
-        bucket_name='test-bucket'
+        cache_service=uploader,
+        bucket_name='test-bucket',
+        embedding_cache=EmbeddingCache(**load_config('embedding_cache', {})),
+        converter_pool=converter_pool,
+        sharded_converter=sharded_converter,
     )
 
     pt.mark("Document parsing")
     pdf_dir = 'temp'
-    for fname in os.listdir(pdf_dir):
-        if not fname.lower().endswith('.pdf'):
-            continue
-        pdf_path = os.path.join(pdf_dir, fname)
+    pdf_paths = [os.path.join(pdf_dir, fname) for fname in sorted(os.listdir(pdf_dir))
+                 if fname.lower().endswith('.pdf')]
+
+    def parse_one(pdf_path):
         print(f"Parsing PDF at {pdf_path!r}…")
-        chunks = parser.parse_pdf(pdf_path)
-        print(f"→ Parsed {len(chunks)} chunks.\n")
+        parsed = parser.parse_pdf(pdf_path)
+        print(f"→ Parsed {len(parsed)} chunks from {pdf_path!r}.\n")
+        return parsed
+
+    # several PDFs at once; their page shards share the worker process pool
+    chunks = []
+    with ThreadPoolExecutor(max_workers=sharding.get('concurrent_pdfs', 1)) as pdf_pool:
+        for parsed in pdf_pool.map(parse_one, pdf_paths):
+            chunks = parsed
     pt.done("Document parsing")
+    pt.mark("Background writes")
+    for key, error in uploader.flush():
+        print(f"❌ Failed to persist {key}: {error}")
+    pt.done("Background writes")
+    embed_service.shutdown()
+    converter_pool.teardown()
+    if sharded_converter is not None:
+        sharded_converter.close()
+    print(f"Embedding cache: {parser.embedding_cache.stats()}")
 
     if not chunks:
         print("No chunks produced.")
         return
 
-    # The document_id is the hash used for the JSON filename:
+    # The document_id is the hash used for the cache keys:
     doc_id = chunks[0].metadata.document_id
-    json_path = os.path.join(parser.cache_root, f"{doc_id}_chunks_embedded.json")
+    cached = load_chunks(cache_service, 'test-bucket', f"{doc_id}_chunks_embedded")
 
-    if not os.path.exists(json_path):
-        print(f"❌ Expected JSON output not found at {json_path!r}")
+    if cached is None:
+        print(f"❌ Expected cached chunks not found for {doc_id!r}")
         return
 
-    print(f"✅ JSON output written to {json_path!r}\n")
-
-    # Load and pretty-print the first 3 entries so you can inspect them:
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    print(f"✅ Chunks cached under {doc_id}_chunks_embedded.npy/.meta.json\n")
 
-    preview = data[:3]  # first three chunks
-    # truncate embeddings to only the first 3 floats
-    for chunk in preview:
-        chunk['embedding'] = chunk['embedding'][:3]
+    # Pretty-print the first 3 entries so you can inspect them,
+    # truncating embeddings to only the first 3 floats
+    preview = [
+        {
+            "content": c.content,
+            "metadata": metadata_to_dict(c.metadata),
+            "embedding": [float(x) for x in c.embedding[:3]],
+        }
+        for c in cached[:3]
+    ]
     print("Preview of first 3 chunks:")
     print(json.dumps(preview, indent=2, ensure_ascii=False))
 
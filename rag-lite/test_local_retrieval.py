@@ -8,18 +8,21 @@ if any expected section is missing.
 """
 import sys
 from pathlib import Path
+
 import yaml
 
+from helpers import load_config
+from ollama_services import LocalCacheService, OllamaEmbeddingService
+from parser_local import DocumentParser
+from query_cache import QueryEmbeddingCache
 from rag_pipeline import (
     Corpus,
-    RetrievalService,
-    RetrievalConfig,
+    CosineSimilarity,
     Query,
-    CosineSimilarity
+    RetrievalConfig,
+    RetrievalService,
 )
-from parser_local import DocumentParser
-from ollama_services import OllamaEmbeddingService, LocalCacheService
-from helpers import load_config
+from reranker import RerankerConfig
 
 TOP_K = 3
 SIMILARITY_THRESHOLD = 0.42
@@ -34,6 +37,7 @@ def main():
 
     # 2. Initialize services
     embedding_service = OllamaEmbeddingService(load_config('embedding_model'))
+    query_cache = QueryEmbeddingCache(**load_config('query_cache', {}))
     similarity_metric = CosineSimilarity()
     reranker_model = load_config('reranker_model')
 
@@ -48,7 +52,9 @@ def main():
         corpus.add_chunks(chunks)
 
     # 4. Initialize retrieval service (with BGE reranker)
-    retriever = RetrievalService(corpus, similarity_metric, reranker_model)
+    reranker_config = RerankerConfig(**load_config('reranker', {}))
+    retriever = RetrievalService(corpus, similarity_metric, reranker_model,
+                                 reranker_config=reranker_config)
     # to test recall, retrieve all candidates
     cfg = RetrievalConfig(top_k=TOP_K, similarity_threshold=SIMILARITY_THRESHOLD)
 
@@ -62,7 +68,7 @@ def main():
             for e in case['expected_sections']
         ]
 
-        q_embed = embedding_service.embed_text(q_text)
+        q_embed = query_cache.get_or_embed(q_text, embedding_service)
         query = Query(text=q_text, embedding=q_embed)
         retrieved = retriever.retrieve_similar_chunks(query, cfg)
 
@@ -96,7 +102,11 @@ def main():
             rpt.write(f"| {r['question']} | {exp_str} | {ret_str} | {r['recall']:.2f} |\n")
         avg = sum(r['recall'] for r in results) / len(results) if results else 0.0
         rpt.write(f"\n**Average Recall:** {avg:.2f}\n")
+        qc = query_cache.stats()
+        rpt.write(f"\n**Query Embedding Cache:** {qc['hits']} hits, "
+                  f"{qc['misses']} misses (hit rate {qc['hit_rate']:.2f})\n")
 
+    query_cache.save()
     print(f"Report written to {report_path}")
     if missing:
         print("\nMissing expected sections:")
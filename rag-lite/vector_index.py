@@ -0,0 +1,281 @@
+import json
+from typing import Any, Dict, List, Optional, Protocol, Set, Tuple
+
+import numpy as np
+
+from logger import logger
+
+# === Index Interface ===
+
+class VectorIndex(Protocol):
+    """
+    Nearest-neighbour index over the normalized embedding rows of a Corpus,
+    keyed by chunk id, so documents can be removed without touching other rows.
+    """
+
+    def __len__(self) -> int:
+        ...
+
+    def __contains__(self, chunk_id: str) -> bool:
+        ...
+
+    @property
+    def chunk_ids(self) -> List[str]:
+        ...
+
+    def add(self, vectors: np.ndarray, chunk_ids: List[str]) -> None:
+        ...
+
+    def remove(self, chunk_ids: List[str]) -> int:
+        ...
+
+    def reset(self) -> None:
+        ...
+
+    def search(self, query: List[float], k: int) -> Tuple[np.ndarray, List[str]]:
+        """Return (scores, chunk_ids) of the k best rows by inner product."""
+        ...
+
+# === FAISS Implementation ===
+
+class FaissIndex:
+    """
+    FAISS-backed inner-product index with flat, IVF and HNSW variants.
+
+    Vectors are expected to be L2-normalized, so inner product equals cosine
+    similarity. The underlying FAISS index is created on the first add, once the
+    embedding dimension is known. An IVF index buffers vectors (searched exactly)
+    until it has enough of them to train its coarse quantizer.
+
+    Every vector is stored under a 64-bit id mapped to its chunk id (IVF lists
+    hold ids natively, flat and HNSW are wrapped in faiss.IndexIDMap), so
+    removing a document deletes only its own vectors: flat and IVF drop them
+    with remove_ids. HNSW graphs cannot delete nodes, so removed HNSW
+    vectors are tombstoned and skipped at search time; the graph is rebuilt
+    from its stored vectors once tombstones exceed max_tombstone_ratio.
+    """
+
+    KINDS = ("flat", "ivf", "hnsw")
+
+    def __init__(
+        self,
+        kind: str = "flat",
+        nlist: int = 256,
+        nprobe: int = 16,
+        hnsw_m: int = 32,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        train_size: Optional[int] = None,
+        max_tombstone_ratio: float = 0.25,
+    ):
+        if kind not in self.KINDS:
+            raise ValueError(
+                f"Unknown index kind '{kind}', expected one of {self.KINDS}")
+        import faiss
+        self._faiss = faiss
+        self.kind = kind
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        # FAISS warns below ~39 training points per centroid
+        self.train_size = train_size or 39 * nlist
+        self.max_tombstone_ratio = max_tombstone_ratio
+        self.reset()
+        logger.info("Initialized FaissIndex (%s)", kind)
+
+    def _build(self, dim: int):
+        faiss = self._faiss
+        if self.kind == "flat":
+            index = faiss.IndexFlatIP(dim)
+        elif self.kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = self.ef_construction
+            index.hnsw.efSearch = self.ef_search
+        else:
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, self.nlist,
+                                       faiss.METRIC_INNER_PRODUCT)
+            index.nprobe = self.nprobe
+            return index
+        return faiss.IndexIDMap(index)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._ids
+
+    @property
+    def chunk_ids(self) -> List[str]:
+        return list(self._ids)
+
+    def add(self, vectors: np.ndarray, chunk_ids: List[str]) -> None:
+        if len(vectors) != len(chunk_ids):
+            raise ValueError("vectors and chunk_ids must have the same length")
+        if not len(vectors):
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self._index is None:
+            self._index = self._build(vectors.shape[1])
+        ids = np.arange(self._next_id, self._next_id + len(chunk_ids), dtype=np.int64)
+        self._next_id += len(chunk_ids)
+        for chunk_id, i in zip(chunk_ids, ids.tolist()):
+            self._ids[chunk_id] = i
+            self._chunk_of[i] = chunk_id
+
+        if self._index.is_trained:
+            self._index.add_with_ids(vectors, ids)
+            return
+
+        if self._pending is None:
+            self._pending, self._pending_ids = vectors, ids
+        else:
+            self._pending = np.vstack([self._pending, vectors])
+            self._pending_ids = np.concatenate([self._pending_ids, ids])
+        if len(self._pending) >= self.train_size:
+            logger.info("Training IVF index on %d vectors (nlist=%d)",
+                        len(self._pending), self.nlist)
+            self._index.train(self._pending)
+            self._index.add_with_ids(self._pending, self._pending_ids)
+            self._pending = self._pending_ids = None
+
+    def remove(self, chunk_ids: List[str]) -> int:
+        """Drop the vectors of the given chunk ids; returns how many were present."""
+        ids = [self._ids.pop(c) for c in chunk_ids if c in self._ids]
+        if not ids:
+            return 0
+        for i in ids:
+            del self._chunk_of[i]
+        ids = np.asarray(ids, dtype=np.int64)
+        if self._pending is not None:
+            keep = ~np.isin(self._pending_ids, ids)
+            self._pending = self._pending[keep]
+            self._pending_ids = self._pending_ids[keep]
+        elif self.kind == "hnsw":
+            self._tombstones.update(ids.tolist())
+            limit = self.max_tombstone_ratio * max(len(self._ids), 1)
+            if len(self._tombstones) > limit:
+                self._compact()
+        else:
+            self._index.remove_ids(ids)
+        return len(ids)
+
+    def _compact(self) -> None:
+        """Rebuild an HNSW graph without its tombstoned vectors."""
+        old = self._index
+        all_ids = self._faiss.vector_to_array(old.id_map)
+        vectors = self._faiss.downcast_index(old.index).reconstruct_n(0, old.ntotal)
+        live = ~np.isin(all_ids, np.fromiter(self._tombstones, dtype=np.int64))
+        logger.info("Rebuilding HNSW index without %d removed vectors",
+                    len(self._tombstones))
+        self._index = self._build(vectors.shape[1])
+        self._index.add_with_ids(np.ascontiguousarray(vectors[live]), all_ids[live])
+        self._tombstones = set()
+
+    def reset(self) -> None:
+        self._index = None
+        self._pending: Optional[np.ndarray] = None  # untrained IVF buffer
+        self._pending_ids: Optional[np.ndarray] = None
+        self._ids: Dict[str, int] = {}  # chunk id -> faiss id, in insertion order
+        self._chunk_of: Dict[int, str] = {}
+        self._tombstones: Set[int] = set()  # removed HNSW ids still in the graph
+        self._next_id = 0
+
+    def search(self, query: List[float], k: int) -> Tuple[np.ndarray, List[str]]:
+        if not self._ids:
+            return np.empty(0, dtype=np.float32), []
+        q = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm == 0:
+            raise ValueError("Zero vectors are not allowed")
+        q = (q / norm).reshape(1, -1)
+
+        if self._pending is not None:
+            # IVF not trained yet: exact scan over the buffered vectors
+            scores = self._pending @ q[0]
+            rows = np.argsort(-scores, kind="stable")[:k]
+            ids = self._pending_ids[rows].tolist()
+            return scores[rows], [self._chunk_of[i] for i in ids]
+
+        fetch = min(k + len(self._tombstones), self._index.ntotal)
+        scores, ids = self._index.search(q, fetch)
+        keep = [j for j, i in enumerate(ids[0].tolist()) if i in self._chunk_of][:k]
+        return scores[0][keep], [self._chunk_of[i] for i in ids[0][keep].tolist()]
+
+    # === Persistence ===
+
+    def save(self, cache_service, bucket: str, key: str) -> bool:
+        """
+        Persist the index and its chunk ids to the cache bucket under key.
+        Returns False if there is nothing (trained) to persist yet.
+        """
+        if self._index is None or self._pending is not None:
+            logger.info("Index %s has no trained vectors yet, not persisting", key)
+            return False
+        data = self._faiss.serialize_index(self._index).tobytes()
+        sidecar = {
+            "kind": self.kind,
+            "ids": self._ids,
+            "tombstones": sorted(self._tombstones),
+            "next_id": self._next_id,
+        }
+        cache_service.put_object(Bucket=bucket, Key=key + ".faiss", Body=data)
+        cache_service.put_object(Bucket=bucket, Key=key + ".ids.json",
+                                 Body=json.dumps(sidecar))
+        logger.info("Persisted %s index with %d vectors to %s",
+                    self.kind, len(self), key)
+        return True
+
+    def load(self, cache_service, bucket: str, key: str) -> bool:
+        """
+        Replace the index contents with a persisted copy from the cache bucket.
+        Returns False if no usable copy exists.
+        """
+        try:
+            raw = cache_service.get_object(Bucket=bucket, Key=key + ".faiss")
+            raw = raw["Body"].read()
+            meta = cache_service.get_object(Bucket=bucket, Key=key + ".ids.json")
+            sidecar = json.loads(meta["Body"].read())
+        except Exception as e:
+            logger.info("No persisted index at %s (%s)", key, e)
+            return False
+        if sidecar.get("kind") != self.kind or "ids" not in sidecar:
+            logger.info("Persisted index at %s is %s, not %s; rebuilding",
+                        key, sidecar.get("kind"), self.kind)
+            return False
+        ids = sidecar["ids"]
+        tombstones = set(sidecar.get("tombstones", []))
+
+        index = self._faiss.deserialize_index(np.frombuffer(raw, dtype=np.uint8))
+        if index.ntotal != len(ids) + len(tombstones):
+            logger.warning("Persisted index %s is inconsistent, ignoring it", key)
+            return False
+        if self.kind == "ivf":
+            index.nprobe = self.nprobe
+        elif self.kind == "hnsw":
+            self._faiss.downcast_index(index.index).hnsw.efSearch = self.ef_search
+
+        self.reset()
+        self._index = index
+        self._ids = dict(ids)
+        self._chunk_of = {i: c for c, i in ids.items()}
+        self._tombstones = tombstones
+        self._next_id = sidecar["next_id"]
+        logger.info("Loaded %s index with %d vectors from %s",
+                    self.kind, len(self), key)
+        return True
+
+# === Factory ===
+
+def build_vector_index(settings: Dict[str, Any]) -> Optional[FaissIndex]:
+    """
+    Build the index selected by the `vector_index` section of config.yaml.
+    Returns None for the default exact (NumPy) search.
+    """
+    settings = dict(settings or {})
+    backend = settings.pop("backend", "exact")
+    if backend == "exact":
+        return None
+    return FaissIndex(kind=backend, **settings)
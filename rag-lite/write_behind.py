@@ -0,0 +1,179 @@
+import atexit
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from logger import logger
+
+
+def _write_group(bucket: str, key: str) -> Tuple[str, str]:
+    """Objects of one artifact (e.g. chunks.npy and chunks.meta.json) share a group."""
+    head, name = os.path.split(key)
+    return bucket, os.path.join(head, name.split(".", 1)[0])
+
+
+class WriteBehindUploader:
+    """
+    Cache service wrapper whose writes (put_object, upload_file, upload_fileobj)
+    return immediately and are persisted by a background thread pool.
+
+    - At most max_pending writes are queued; further writes block until one
+      finishes.
+    - Reads of a key wait for its pending write, so callers always read their
+      own writes.
+    - Writes to objects of the same artifact (same key up to the first dot) run in
+      submission order, so e.g. a chunk sidecar never lands before its embeddings.
+    - Failed writes are logged and collected; flush() waits for all pending
+      writes and returns the failures since the previous flush.
+    - Pending writes are flushed at interpreter exit.
+
+    Everything else is delegated to the wrapped service.
+    """
+
+    def __init__(self, cache_service, max_workers: int = 4, max_pending: int = 64):
+        self.cache = cache_service
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="write-behind")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        # (bucket, key) -> latest write, and write group -> latest write
+        self._pending: Dict[Tuple[str, str], Future] = {}
+        self._groups: Dict[Tuple[str, str], Future] = {}
+        self._errors: List[Tuple[str, Exception]] = []
+        self._closed = False
+        atexit.register(self.shutdown)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.cache, name)
+
+    # === Writes ===
+
+    def _submit(self, bucket: str, key: str, write) -> None:
+        if self._closed:
+            raise RuntimeError("WriteBehindUploader is shut down")
+        self._slots.acquire()
+        group = _write_group(bucket, key)
+        with self._lock:
+            before = self._groups.get(group)
+
+            def run():
+                if before is not None:
+                    wait([before])  # submitted earlier, so already running or done
+                write()
+
+            future = self._executor.submit(run)
+            self._pending[(bucket, key)] = future
+            self._groups[group] = future
+        future.add_done_callback(lambda f: self._done(bucket, key, group, f))
+
+    def _done(self, bucket: str, key: str, group: Tuple[str, str],
+              future: Future) -> None:
+        self._slots.release()
+        with self._lock:
+            if self._pending.get((bucket, key)) is future:
+                del self._pending[(bucket, key)]
+            if self._groups.get(group) is future:
+                del self._groups[group]
+        error = future.exception()
+        if error is not None:
+            logger.error("Background write of %s/%s failed: %s", bucket, key, error)
+            with self._lock:
+                self._errors.append((f"{bucket}/{key}", error))
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        self._submit(Bucket, Key, lambda: self.cache.put_object(
+            Bucket=Bucket, Key=Key, Body=Body, **kwargs))
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        self._submit(Bucket, Key, lambda: self.cache.upload_file(
+            Filename, Bucket, Key, **kwargs))
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self.put_object(Bucket, Key, Fileobj.read(), **kwargs)
+
+    # === Reads (wait for a pending write of the same key) ===
+
+    def _settle(self, bucket: str, *keys: str) -> None:
+        with self._lock:
+            futures = [self._pending[(bucket, k)] for k in keys
+                       if (bucket, k) in self._pending]
+        if futures:
+            wait(futures)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._settle(Bucket, Key)
+        return self.cache.get_object(Bucket=Bucket, Key=Key, **kwargs)
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._settle(Bucket, Key)
+        return self.cache.head_object(Bucket=Bucket, Key=Key, **kwargs)
+
+    # optional helpers: only present when the wrapped service has them
+    # (an AttributeError here falls through to __getattr__, which raises it again)
+
+    @property
+    def exists(self):
+        exists = self.cache.exists
+
+        def settled(Bucket, Key):
+            self._settle(Bucket, Key)
+            return exists(Bucket=Bucket, Key=Key)
+        return settled
+
+    @property
+    def get_many(self):
+        get_many = self.cache.get_many
+
+        def settled(Bucket, Keys):
+            self._settle(Bucket, *Keys)
+            return get_many(Bucket=Bucket, Keys=Keys)
+        return settled
+
+    @property
+    def local_path(self):
+        local_path = self.cache.local_path
+
+        def settled(Bucket, Key):
+            self._settle(Bucket, Key)
+            return local_path(Bucket=Bucket, Key=Key)
+        return settled
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        self._settle(Bucket, Key)
+        return self.cache.download_file(Bucket, Key, Filename, **kwargs)
+
+    # === Lifecycle ===
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, timeout: Optional[float] = None) -> List[Tuple[str, Exception]]:
+        """
+        Wait for all pending writes; returns (key, error) of writes that failed
+        since the last flush.
+        """
+        with self._lock:
+            futures = list(self._pending.values())
+        done, not_done = wait(futures, timeout=timeout)
+        if not_done:
+            logger.warning("%d background writes still pending after flush timeout",
+                           len(not_done))
+        with self._lock:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def shutdown(self) -> None:
+        """Flush pending writes and stop the worker threads."""
+        if self._closed:
+            return
+        errors = self.flush()
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        if errors:
+            logger.error("%d background writes failed: %s",
+                         len(errors), ", ".join(k for k, _ in errors))
@@ -0,0 +1,38 @@
+import os
+import sys
+from dataclasses import replace
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rag-lite"))
+
+from rag_pipeline import DocumentChunk, DocumentMetadata  # noqa: E402
+
+METADATA = DocumentMetadata(file_name="a.docx", file_version="v1",
+                            file_date=datetime(2026, 1, 1), section_number="1",
+                            section_heading="Intro", document_id="abc")
+
+
+def chunk(embedding, content="text"):
+    return DocumentChunk(content=content, metadata=METADATA, embedding=embedding)
+
+
+def test_array_embeddings_compare_by_value():
+    matrix = np.arange(6, dtype=np.float32).reshape(2, 3)
+    a = chunk(matrix[0])
+    assert a == chunk(matrix[0].copy())
+    assert a != chunk(matrix[1])
+    assert a in [chunk(matrix[1]), chunk(matrix[0].copy())]
+
+
+def test_list_and_array_embeddings_compare_equal():
+    assert chunk([0.0, 1.0, 2.0]) == chunk(np.array([0.0, 1.0, 2.0]))
+    assert chunk([0.0, 1.0]) != chunk(np.array([0.0, 1.0, 2.0]))
+
+
+def test_content_and_metadata_are_compared():
+    a = chunk([1.0])
+    assert a != chunk([1.0], content="other")
+    assert a != replace(a, metadata=replace(METADATA, file_name="b.docx"))
+    assert a != "text"
@@ -0,0 +1,112 @@
+"""
+Reranker backends must rank like the fp32 torch model.
+
+A small BERT cross-encoder with random weights and a generated vocabulary is
+built in a temporary directory, so nothing is downloaded. Set
+RERANKER_PARITY_MODEL to check a real model such as BAAI/bge-reranker-large.
+"""
+import os
+import random
+import statistics
+import sys
+from typing import List
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rag-lite"))
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from reranker import RerankerConfig, build_reranker  # noqa: E402
+
+WORDS = ("access control policy audit log encryption key rotation backup restore "
+         "incident response network firewall segment vendor risk assessment training "
+         "awareness patch vulnerability scan identity password mfa retention privacy "
+         "data classification asset inventory change management monitoring alert "
+         "review approval exception").split()
+
+QUERIES = 20
+PASSAGES = 30  # candidates per query
+TOP_K = 3
+MIN_SPEARMAN = 0.9
+MIN_OVERLAP = 0.8  # mean top-k overlap with fp32
+
+
+def sample_texts(rng: random.Random, count: int, low: int, high: int) -> List[str]:
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+            for _ in range(count)]
+
+
+def ranks(scores: np.ndarray) -> np.ndarray:
+    order = np.argsort(scores, kind="stable")
+    out = np.empty(len(scores))
+    out[order] = np.arange(len(scores))
+    return out
+
+
+def spearman(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.corrcoef(ranks(a), ranks(b))[0, 1])
+
+
+def top_overlap(a: np.ndarray, b: np.ndarray, k: int) -> float:
+    return len(set(np.argsort(-a)[:k]) & set(np.argsort(-b)[:k])) / k
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    """A randomly initialized BERT cross-encoder and its tokenizer, saved to disk."""
+    name = os.environ.get("RERANKER_PARITY_MODEL")
+    if name:
+        return name
+    folder = str(tmp_path_factory.mktemp("tiny-reranker"))
+    torch.manual_seed(0)
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS
+    vocab_file = os.path.join(folder, "vocab.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab))
+    tokenizer = transformers.BertTokenizerFast(vocab_file=vocab_file)
+    config = transformers.BertConfig(
+        vocab_size=len(vocab), hidden_size=128, num_hidden_layers=2,
+        num_attention_heads=4, intermediate_size=256, max_position_embeddings=256,
+        num_labels=1, initializer_range=0.2)
+    model = transformers.BertForSequenceClassification(config).eval()
+    model.save_pretrained(folder)
+    tokenizer.save_pretrained(folder)
+    return folder
+
+
+@pytest.fixture(scope="module")
+def texts():
+    rng = random.Random(0)
+    queries = sample_texts(rng, QUERIES, 3, 8)
+    return queries, [sample_texts(rng, PASSAGES, 20, 120) for _ in queries]
+
+
+def score_all(model_dir: str, onnx_dir: str, backend: str, texts) -> List[np.ndarray]:
+    scorer = build_reranker(model_dir, RerankerConfig(backend=backend,
+                                                      onnx_dir=onnx_dir))
+    queries, passages = texts
+    return [scorer.score(query, candidates)
+            for query, candidates in zip(queries, passages)]
+
+
+@pytest.fixture(scope="module")
+def reference(model_dir, texts, tmp_path_factory):
+    return score_all(model_dir, str(tmp_path_factory.mktemp("onnx")), "torch", texts)
+
+
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx", "onnx-int8"])
+def test_backend_ranks_like_fp32(backend, model_dir, texts, reference,
+                                 tmp_path_factory):
+    if backend.startswith("onnx"):
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("onnx")
+    scores = score_all(model_dir, str(tmp_path_factory.mktemp("onnx")), backend,
+                       texts)
+    rho = statistics.mean(spearman(r, s) for r, s in zip(reference, scores))
+    overlap = statistics.mean(top_overlap(r, s, TOP_K)
+                              for r, s in zip(reference, scores))
+    assert rho >= MIN_SPEARMAN, f"{backend}: spearman {rho:.3f}"
+    assert overlap >= MIN_OVERLAP, f"{backend}: top-{TOP_K} overlap {overlap:.2f}"
@@ -0,0 +1,78 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "rag-lite"))
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from s3_cache import MB, S3CacheService  # noqa: E402
+
+BUCKET = "rag-lite-test"
+
+
+@pytest.fixture
+def s3():
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1",
+                              aws_access_key_id="testing",
+                              aws_secret_access_key="testing")
+        client.create_bucket(Bucket=BUCKET)
+        # S3 parts other than the last must be at least 5 MB
+        service = S3CacheService(client=client, multipart_threshold_mb=5,
+                                 multipart_chunksize_mb=5, max_concurrency=4)
+        yield service
+        service.close()
+
+
+def test_put_and_get_small_object(s3):
+    s3.put_object(Bucket=BUCKET, Key="a/b.json", Body='{"x": 1}')
+    response = s3.get_object(Bucket=BUCKET, Key="a/b.json")
+    assert response["Body"].read() == b'{"x": 1}'
+    assert response["ContentLength"] == 8
+
+
+def test_head_object_and_exists(s3):
+    s3.put_object(Bucket=BUCKET, Key="doc.md", Body=b"# title")
+    head = s3.head_object(Bucket=BUCKET, Key="doc.md")
+    assert head["ContentLength"] == 7
+    assert head["ETag"]
+    assert head["LastModified"] is not None
+    assert s3.exists(Bucket=BUCKET, Key="doc.md")
+    assert not s3.exists(Bucket=BUCKET, Key="missing.md")
+
+
+def test_missing_key_raises_file_not_found(s3):
+    with pytest.raises(FileNotFoundError):
+        s3.get_object(Bucket=BUCKET, Key="missing.md")
+    with pytest.raises(FileNotFoundError):
+        s3.head_object(Bucket=BUCKET, Key="missing.md")
+    with pytest.raises(FileNotFoundError):
+        s3.download_file(Bucket=BUCKET, Key="missing.md", Filename=os.devnull)
+
+
+def test_get_many_leaves_out_absent_keys(s3):
+    for i in range(5):
+        s3.put_object(Bucket=BUCKET, Key=f"pages/{i}.md", Body=f"page {i}")
+    keys = [f"pages/{i}.md" for i in range(5)] + ["pages/missing.md", "pages/0.md"]
+    found = s3.get_many(Bucket=BUCKET, Keys=keys)
+    assert found == {f"pages/{i}.md": f"page {i}".encode() for i in range(5)}
+    assert s3.get_many(Bucket=BUCKET, Keys=["pages/missing.md"]) == {}
+
+
+def test_empty_object(s3):
+    s3.put_object(Bucket=BUCKET, Key="empty", Body=b"")
+    assert s3.get_object(Bucket=BUCKET, Key="empty")["Body"].read() == b""
+
+
+def test_multipart_upload_and_ranged_read(s3):
+    data = os.urandom(12 * MB + 123)
+    s3.put_object(Bucket=BUCKET, Key="big.npy", Body=data)
+    # multipart uploads get an ETag of the form "<md5 of part md5s>-<parts>"
+    head = s3.head_object(Bucket=BUCKET, Key="big.npy")
+    assert head["ETag"].strip('"').endswith("-3")
+    assert head["ContentLength"] == len(data)
+    assert s3.get_object(Bucket=BUCKET, Key="big.npy")["Body"].read() == data
+    assert s3.get_many(Bucket=BUCKET, Keys=["big.npy"]) == {"big.npy": data}